@@ -13,11 +13,43 @@ import csv
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
+from tick_store import TickStore
+from tick_journal import JournalWriter
+from market_feed import MarketPublisher, write_moves_json
+from market_shm import MarketShmWriter, SHM_NAME
+from scraper_pipeline import StageQueue, coalesce_capture, coalesce_publish
 
 # ==================== CONFIG ====================
 ENABLE_SOUND = True
-TARGET_INTERVAL = 8.5          # Refresh every ~8.5 seconds
+TARGET_INTERVAL = 8.5          # Baseline refresh interval; the scheduler adapts around it
+# Freshness vs broker load: (busiest-market interval, quiet-market interval) in seconds
+REFRESH_PROFILES = {
+    "fresh":    (2.5, 10.0),
+    "balanced": (4.0, TARGET_INTERVAL * 2),
+    "light":    (TARGET_INTERVAL, 30.0),
+}
+REFRESH_PROFILE = os.environ.get("REFRESH_PROFILE", "balanced").strip().lower()
+PRE_OPEN_REFRESH_INTERVAL = 30.0
+CLOSED_REFRESH_INTERVAL = 120.0
+ACTIVE_MOVES_PER_REFRESH = 12  # This many movers per refresh (smoothed) -> fastest interval
 DATA_RETENTION_DAYS = 7
+# "delta" = in-page MutationObserver, only changed rows cross the wire
+# "dom"   = legacy full-table scrape on every loop
+# "cdp"   = decode the dashboard's own XHR/WebSocket JSON via DevTools, no refresh clicks
+CAPTURE_MODE = os.environ.get("CAPTURE_MODE", "delta").strip().lower()
+# "binary" = TICKS.bin journal per hour (export with: python tick_journal.py export market_logs)
+# "csv"    = legacy FULL_SNAPSHOT.csv / MOVES.csv text logs
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "binary").strip().lower()
+CDP_POLL_INTERVAL = 0.25       # How often the DevTools event log is drained in cdp mode
+CDP_STALE_SECONDS = 30         # No decoded ticks for this long -> one DOM scrape as safety net
+CDP_BODY_EXPIRY = 60           # A JSON response with no loadingFinished this long is forgotten
+CDP_MAX_PENDING_BODIES = 256   # Hard cap on responses waiting for their body, oldest dropped first
+# "single"   = one dashboard from CHROME_PORT / broker.json
+# "accounts" = one capture worker per enabled account in multi_account_config.json,
+#              merged per symbol into one feed (redundancy + whichever broker is ahead)
+SCRAPER_SOURCES = os.environ.get("SCRAPER_SOURCES", "single").strip().lower()
+ACCOUNTS_CONFIG_FILE = Path("multi_account_config.json")
+MERGE_STALE_SECONDS = 60       # A leading source that stops capturing this long loses its symbols
 # ===============================================
 
 BASE_DIR = Path("market_logs")
@@ -25,12 +57,18 @@ SHARED_DIR = Path("shared")
 BASE_DIR.mkdir(exist_ok=True)
 SHARED_DIR.mkdir(exist_ok=True)
 
-PRIVATE_JSON = SHARED_DIR / "market_data_live.json"   # Only scraper writes
-SHARED_JSON  = SHARED_DIR / "market_data.json"        # Engine reads this
-MOVES_PRIVATE = SHARED_DIR / "market_moves_live.json" # Private moves file
-MOVES_SHARED = SHARED_DIR / "market_moves.json"       # UI reads this
+SNAPSHOT_EVERY = 10                                   # Full market_data.json every N sequences
+KEEP_DELTAS = 200                                     # Rolling shared/market_deltas/ window
+# Shared-memory snapshot for local consumers; the JSON feed is always written as fallback
+ENABLE_SHM = os.environ.get("MARKET_SHM", "1") == "1"
 
 RECENT_MOVES = collections.deque(maxlen=100)  # Keep last 100 movements
+TICK_STORE_FILE = SHARED_DIR / "tick_store.bin"      # Session history, read by engine/API
+TICK_STORE_SYMBOLS = 512
+# Price/volume changes kept per symbol: one per refresh over the 4h session plus pre-open at the
+# fastest profile (~5.9k). Busier cdp captures can change more often; the ring then keeps the newest.
+TICK_STORE_CAPACITY = int(4 * 3600 / min(fast for fast, _ in REFRESH_PROFILES.values())
+                          + 3600 / PRE_OPEN_REFRESH_INTERVAL)
 
 print("NEPSE 2025 ELITE SCANNER - FINAL UNBREAKABLE EDITION")
 print("=" * 95)
@@ -86,42 +124,138 @@ try:
 except:
     pass
 
-def initialize_driver_session():
-    """Initializes and configures the Selenium driver session to connect 
-    to the existing, logged-in Chrome session using the dynamic port."""
-    global driver, dashboard_handle
-    
-    print("\n[RECOVERY] Waiting for browser_ready.txt...")
+class CaptureSource:
+    """One logged-in broker dashboard: its own driver session, refresh scheduler,
+    CDP state and recovery. Single mode runs exactly one of these."""
+
+    def __init__(self, name, chrome_port, dashboard_url):
+        self.name = name
+        self.chrome_port = str(chrome_port)
+        self.dashboard_url = dashboard_url
+        self.tag = f"[{name}] " if SCRAPER_SOURCES == "accounts" else ""
+        self.driver = None
+        self.dashboard_handle = None
+        self.pending_cdp_bodies = {}      # requestId -> when its JSON response arrived, until loadingFinished
+        self.refresh_scheduler = None     # Attached once RefreshScheduler is defined
+        self.last_refresh = 0
+        self.last_cdp_tick = time.time()
+        # Freshness bookkeeping: capture side (own thread) and merge side (diff stage)
+        self.captures = self.rows_captured = self.reconnects = 0
+        self.last_ok = 0.0                # Last capture that reached the page, even if nothing changed
+        self.capture_seconds = 0.0
+        self.seen_vol = {}                # sym -> last volume this source reported
+        self.new_ticks = self.led = self.behind = self.symbols_led = 0
+        self.lag_total = 0.0
+        self.lag_count = 0
+
+    def stats(self):
+        return {
+            "chrome_port": self.chrome_port,
+            "dashboard": self.dashboard_url,
+            "connected": self.driver is not None,
+            "captures": self.captures,
+            "rows_captured": self.rows_captured,
+            "reconnects": self.reconnects,
+            "last_ok_age_seconds": round(time.time() - self.last_ok, 1) if self.last_ok else None,
+            "capture_seconds": round(self.capture_seconds, 4),
+            "new_ticks": self.new_ticks,          # Rows showing a volume this source had not shown before
+            "first_with_tick": self.led,          # ...of which it was the first source to show
+            "behind": self.behind,                # ...of which another source had already gone further
+            "avg_lag_seconds": round(self.lag_total / self.lag_count, 3) if self.lag_count else None,
+            "symbols_led": self.symbols_led,
+            "refresh": self.refresh_scheduler.stats() if self.refresh_scheduler else None,
+        }
+
+def load_capture_sources():
+    if SCRAPER_SOURCES != "accounts":
+        # It checks the CHROME_PORT environment variable (set by the orchestrator)
+        # It defaults to '9228' only if the environment variable is not set.
+        return [CaptureSource("main", os.environ.get("CHROME_PORT", "9228"), DASHBOARD_URL)]
+
+    with open(ACCOUNTS_CONFIG_FILE, encoding="utf-8") as f:
+        accounts = json.load(f)["accounts"]
+    sources, ports = [], set()
+    for key, acc in accounts.items():
+        port = str(acc.get("chrome_port", ""))
+        if not acc.get("enabled") or not port or port in ports:
+            continue  # Two accounts on one Chrome would fight over the same tab
+        ports.add(port)
+        url = acc["base_url"].rstrip("/") + "/tms/mwDashboard"
+        sources.append(CaptureSource(acc.get("broker") or key, port, url))
+    if not sources:
+        raise SystemExit(f"SCRAPER_SOURCES=accounts but no enabled account in {ACCOUNTS_CONFIG_FILE}")
+    return sources
+
+def initialize_driver_session(source):
+    """Initializes and configures the Selenium driver session to connect
+    to the existing, logged-in Chrome session using the source's port."""
+    print(f"\n{source.tag}[RECOVERY] Waiting for browser_ready.txt...")
     while not (SHARED_DIR / "browser_ready.txt").exists():
         time.sleep(0.5)
 
-    # --- CRITICAL FIX: Read port dynamically from environment ---
-    # It checks the CHROME_PORT environment variable (set by the orchestrator)
-    # It defaults to '9228' only if the environment variable is not set.
-    chrome_port = os.environ.get("CHROME_PORT", "9228") 
-    debugger_address = f"127.0.0.1:{chrome_port}"
-    print(f"[RECOVERY] Connecting to existing Chrome session at {debugger_address}")
-    
+    debugger_address = f"127.0.0.1:{source.chrome_port}"
+    print(f"{source.tag}[RECOVERY] Connecting to existing Chrome session at {debugger_address}")
+
     options = Options()
     # Use the dynamic debuggerAddress
     options.add_experimental_option("debuggerAddress", debugger_address)
+    if CAPTURE_MODE == "cdp":
+        # Network.* events are delivered through ChromeDriver's performance log
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
     driver = webdriver.Chrome(options=options)
     # -----------------------------------------------------------
 
     # Reuse or create dashboard tab - NO TAB LEAK EVER
-    dashboard_handle = get_or_create_dashboard_tab(driver, DASHBOARD_URL)
+    dashboard_handle = get_or_create_dashboard_tab(driver, source.dashboard_url)
     driver.switch_to.window(dashboard_handle)
 
-    print("[RECOVERY] Loading full stock table...")
+    print(f"{source.tag}[RECOVERY] Loading full stock table...")
     for _ in range(15):
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         time.sleep(0.15)
     time.sleep(3)
-    
+
+    if CAPTURE_MODE == "cdp":
+        driver.execute_cdp_cmd("Network.enable", {})
+        source.pending_cdp_bodies.clear()
+        print(f"{source.tag}[RECOVERY] CDP network capture enabled")
+
+    source.driver, source.dashboard_handle = driver, dashboard_handle
     return driver, dashboard_handle
 
-# Initialize the session for the first time
-driver, dashboard_handle = initialize_driver_session()
+def recover_session(source):
+    """Drop a dead session and reconnect; waits before the next attempt on failure."""
+    print(f"{source.tag}CRITICAL ERROR DETECTED: SESSION LOST OR TAB CRASHED. Attempting full re-initialization...")
+    if source.driver is not None:
+        try:
+            # Attempt to safely quit the broken session first
+            source.driver.quit()
+        except:
+            pass
+        source.driver = None
+    source.reconnects += 1
+
+    # Re-run the initialization steps to reconnect
+    try:
+        initialize_driver_session(source)
+        print(f"{source.tag}RE-INITIALIZATION SUCCESSFUL. Resuming scan.")
+    except Exception as reconnect_error:
+        print(f"{source.tag}RE-INITIALIZATION FAILED: {reconnect_error}")
+        # If reconnect fails, wait longer before next attempt
+        time.sleep(15)
+
+# Initialize the sessions for the first time
+sources = load_capture_sources()
+if len(sources) == 1:
+    initialize_driver_session(sources[0])
+else:
+    print(f"MULTI-BROKER CAPTURE -> {', '.join(f'{s.name}:{s.chrome_port}' for s in sources)}")
+    for source in sources:
+        try:
+            initialize_driver_session(source)
+        except Exception as e:
+            # Its capture worker keeps retrying; the other brokers start without it
+            print(f"{source.tag}NOT REACHABLE YET: {e}")
 # ==================== MANUAL LOGIN HOLD ====================
 # ==================== MANUAL LOGIN HOLD (30s MAX) ====================
 LOGIN_READY_FILE = SHARED_DIR / "login_ready.txt"
@@ -152,7 +286,7 @@ print("=" * 80 + "\n")
 # ====================================================================
 
 # ==================== REFRESH BUTTON ====================
-def click_refresh():
+def click_refresh(source):
     # 1. Broadest possible set of selectors for NEPSE TMS 2025
     selectors = [
         (By.CSS_SELECTOR, "button .fa-sync"),
@@ -166,91 +300,347 @@ def click_refresh():
     for by, sel in selectors:
         try:
             # Short timeout so we don't hang if one fails
-            btn = driver.find_element(by, sel)
+            btn = source.driver.find_element(by, sel)
             if btn.is_displayed():
+                clicked_ms = time.time() * 1000
                 # Try standard click first (triggers JS events better)
                 try:
                     btn.click()
                 except:
                     # Fallback to JS click if blocked by an overlay
-                    driver.execute_script("arguments[0].click();", btn)
+                    source.driver.execute_script("arguments[0].click();", btn)
                 
-                print(f" -> Refresh Triggered via {sel}")
+                print(f"{source.tag} -> Refresh Triggered via {sel}")
                 # CRITICAL: Wait for the network to actually fetch new data
-                time.sleep(1.5) 
+                source.refresh_scheduler.wait_for_settle(source.driver, clicked_ms, timeout=REFRESH_SETTLE_TIMEOUT)
                 return True
         except:
             continue
             
     # 2. FINAL FALLBACK: If no button works, force a browser-level refresh
-    print(" -> WARNING: Refresh button not found. Using Browser-Level Refresh.")
-    driver.refresh()
-    time.sleep(3) # Give the page more time to reload completely
+    print(f"{source.tag} -> WARNING: Refresh button not found. Using Browser-Level Refresh.")
+    clicked_ms = time.time() * 1000
+    source.driver.refresh()
+    source.refresh_scheduler.wait_for_settle(source.driver, clicked_ms, timeout=RELOAD_SETTLE_TIMEOUT) # Give the page time to reload completely
     return True
 
-# ==================== BULLETPROOF ATOMIC WRITE ====================
-def write_market_data_atomic(data):
-    """NEVER LOSE DATA - Survives file locks, PermissionError, crashes"""
-    max_retries = 6
-    for attempt in range(max_retries):
-        try:
-            # Step 1: Write to private file (100% safe)
-            with open(PRIVATE_JSON, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=None)
-                f.flush()
-                os.fsync(f.fileno())
-
-            # Step 2: Atomic replace - BEST METHOD ON WINDOWS
-            os.replace(PRIVATE_JSON, SHARED_JSON)
-            print("Data updated (atomic replace)")
-            return True
-
-        except PermissionError:
-            wait = 0.15 * (2 ** attempt)
-            print(f"Shared file locked by engine - retry {attempt + 1}/{max_retries} in {wait:.2f}s...")
-            time.sleep(wait)
+# ==================== ADAPTIVE REFRESH SCHEDULER ====================
+REFRESH_SETTLE_TIMEOUT = 3.0   # Upper bound on waiting after a button refresh
+RELOAD_SETTLE_TIMEOUT = 8.0    # Upper bound after a browser-level reload
+SETTLE_QUIET_MS = 300          # No DOM mutation / network response for this long = settled
+SETTLE_POLL = 0.1
 
-        except Exception as e:
-            print(f"Write error (attempt {attempt + 1}): {e}")
-            if attempt == max_retries - 1:
-                print("FINAL FALLBACK -> Direct write to shared file")
-                try:
-                    with open(SHARED_JSON, "w", encoding="utf-8") as f:
-                        json.dump(data, f, indent=None)
-                    print("Direct write succeeded")
+# Page-side probe: latest DOM mutation (from the delta observer, when installed)
+# and latest completed network response, both as epoch ms.
+SETTLE_PROBE_JS = """
+    const res = performance.getEntriesByType('resource');
+    if (res.length > 400) performance.clearResourceTimings();
+    let lastResource = 0;
+    for (let i = Math.max(0, res.length - 50); i < res.length; i++)
+        lastResource = Math.max(lastResource, res[i].responseEnd);
+    return {
+        ready: document.readyState,
+        now: Date.now(),
+        lastMutation: (window.__nepseDelta && window.__nepseDelta.lastMutation) || 0,
+        lastResource: lastResource ? performance.timeOrigin + lastResource : 0
+    };
+"""
+
+def market_phase(now=None):
+    """Same session calendar as the API's /api/calendar: Sun-Thu, 10-11 pre-open, 11-15 open."""
+    now = now or datetime.now()
+    if now.weekday() in (4, 5):
+        return "CLOSED"
+    if 11 <= now.hour < 15:
+        return "OPEN"
+    if 10 <= now.hour < 11:
+        return "PRE-OPEN"
+    return "CLOSED"
+
+class RefreshScheduler:
+    """Chooses when to press refresh from how much the diff stage saw moving.
+
+    A smoothed count of movers per refresh slides the interval between the
+    profile's fast and slow bounds; pre-open and closed sessions use fixed
+    long intervals. After a refresh it waits until the page has settled
+    (document complete, DOM and network quiet) instead of sleeping blindly."""
+
+    def __init__(self, profile):
+        self.fast, self.slow = REFRESH_PROFILES.get(profile, REFRESH_PROFILES["balanced"])
+        self.profile = profile if profile in REFRESH_PROFILES else "balanced"
+        self.activity = 0.0
+        self.moves_since_refresh = 0
+        self.interval = TARGET_INTERVAL
+        self.phase = market_phase()
+        self.refreshes = 0
+        self.settle_timeouts = 0
+        self.last_latency = 0.0
+        self.avg_latency = 0.0
+
+    def observe(self, moved_count):
+        """Called by the diff stage for every batch."""
+        self.moves_since_refresh += moved_count
+
+    def due(self, last_refresh, now):
+        return now - last_refresh >= self.next_interval()
+
+    def next_interval(self):
+        self.phase = market_phase()
+        if self.phase == "CLOSED":
+            self.interval = CLOSED_REFRESH_INTERVAL
+        elif self.phase == "PRE-OPEN":
+            self.interval = PRE_OPEN_REFRESH_INTERVAL
+        else:
+            busy = min(1.0, self.activity / ACTIVE_MOVES_PER_REFRESH)
+            self.interval = self.slow - (self.slow - self.fast) * busy
+        return self.interval
+
+    def refreshed(self):
+        # EWMA over refreshes: reacts within a few cycles, ignores single spikes
+        self.activity = 0.7 * self.activity + 0.3 * self.moves_since_refresh
+        self.moves_since_refresh = 0
+        self.refreshes += 1
+
+    def wait_for_settle(self, driver, since_ms, timeout):
+        started = time.time()
+        deadline = started + timeout
+        while time.time() < deadline:
+            try:
+                probe = driver.execute_script(SETTLE_PROBE_JS)
+            except Exception:
+                probe = None
+            if probe and probe["ready"] == "complete":
+                last_activity = max(probe["lastMutation"], probe["lastResource"])
+                if last_activity > since_ms and probe["now"] - last_activity >= SETTLE_QUIET_MS:
+                    self._record_latency((last_activity - since_ms) / 1000)
                     return True
-                except:
-                    print("ALL METHODS FAILED - DATA SAFE IN PRIVATE FILE")
-                    return False
-            time.sleep(0.3)
-    return False
+            time.sleep(SETTLE_POLL)
+        self.settle_timeouts += 1
+        self._record_latency(time.time() - started)
+        return False
+
+    def _record_latency(self, seconds):
+        self.last_latency = seconds
+        self.avg_latency = seconds if not self.avg_latency else 0.8 * self.avg_latency + 0.2 * seconds
+
+    def stats(self):
+        return {
+            "profile": self.profile,
+            "bounds_seconds": [self.fast, self.slow],
+            "phase": self.phase,
+            "interval_seconds": round(self.interval, 2),
+            "activity_moves_per_refresh": round(self.activity, 2),
+            "refreshes": self.refreshes,
+            "refresh_latency_last": round(self.last_latency, 3),
+            "refresh_latency_avg": round(self.avg_latency, 3),
+            "settle_timeouts": self.settle_timeouts,
+        }
+
+for source in sources:
+    source.refresh_scheduler = RefreshScheduler(REFRESH_PROFILE)
+
+# ==================== TABLE CAPTURE ====================
+# Row parser shared by the full scrape and the delta observer so both modes
+# produce identical dicts.
+_ROW_PARSER_JS = """
+    const parseRow = tr => {
+        const tds = tr.querySelectorAll('td');
+        if (tds.length < 8) return null;
+        const txt = i => (tds[i]?.innerText || '').replace(/,/g, '').trim();
+        const num = i => parseFloat(txt(i)) || 0;
+        return {
+            sym: txt(0),
+            ltp: num(1),
+            pct: num(2),
+            open: num(3),
+            high: num(4),
+            low: num(5),
+            close: num(6),
+            vol: num(7) || 0
+        };
+    };
+"""
+
+SCRAPE_ALL_ROWS_JS = _ROW_PARSER_JS + """
+    return Array.from(document.querySelectorAll('tbody tr')).map(parseRow)
+        .filter(x => x && x.sym && x.ltp > 0);
+"""
+
+# Installs a MutationObserver once per page load. Every mutated <tr> is parked in
+# a Set; the drain script parses only those rows and empties the Set, so a quiet
+# tick costs one tiny round trip instead of serializing ~300 unchanged rows.
+# Returns null from the drain when the observer is gone (page reload, new tab).
+INSTALL_DELTA_OBSERVER_JS = _ROW_PARSER_JS + """
+    const old = window.__nepseDelta;
+    if (old && old.observer) old.observer.disconnect();
+    const state = { dirty: new Set(), lastMutation: Date.now(), observer: null, parseRow: parseRow };
+    const markRow = node => {
+        const el = node && (node.nodeType === 1 ? node : node.parentElement);
+        const tr = el && el.closest ? el.closest('tbody tr') : null;
+        if (tr) state.dirty.add(tr);
+        else if (el && el.querySelectorAll) el.querySelectorAll('tbody tr').forEach(r => state.dirty.add(r));
+    };
+    state.observer = new MutationObserver(mutations => {
+        for (const m of mutations) {
+            markRow(m.target);
+            m.addedNodes.forEach(markRow);
+        }
+        state.lastMutation = Date.now();
+    });
+    state.observer.observe(document.body, { subtree: true, childList: true, characterData: true });
+    // Seed with the whole table so the first drain is a full snapshot
+    document.querySelectorAll('tbody tr').forEach(tr => state.dirty.add(tr));
+    window.__nepseDelta = state;
+    return true;
+"""
+
+DRAIN_DELTA_ROWS_JS = """
+    const state = window.__nepseDelta;
+    if (!state) return null;
+    const rows = [];
+    for (const tr of state.dirty) {
+        if (!tr.isConnected) continue;
+        const row = state.parseRow(tr);
+        if (row && row.sym && row.ltp > 0) rows.push(row);
+    }
+    state.dirty.clear();
+    return rows;
+"""
+
+def install_delta_observer(source):
+    source.driver.execute_script(INSTALL_DELTA_OBSERVER_JS)
+    print(f"{source.tag}[DELTA] MutationObserver installed on dashboard table")
+
+def drain_delta_rows(source):
+    """Return only rows changed since the last drain; reinstalls the observer if the page lost it."""
+    rows = source.driver.execute_script(DRAIN_DELTA_ROWS_JS)
+    if rows is None:
+        install_delta_observer(source)
+        rows = source.driver.execute_script(DRAIN_DELTA_ROWS_JS) or []
+    return rows
+
+# ==================== NETWORK CAPTURE (CDP) ====================
+# Field aliases seen across TMS builds. Any dict carrying a symbol key and an
+# LTP key is treated as a quote; missing fields are filled from the last row.
+CDP_FIELD_ALIASES = {
+    "sym":   ("symbol", "sym", "stockSymbol", "securitySymbol", "scrip"),
+    "ltp":   ("ltp", "lastTradedPrice", "lastTradePrice", "lastPrice", "closePrice_ltp"),
+    "pct":   ("percentageChange", "percentChange", "pctChange", "changePercent", "pct"),
+    "open":  ("openPrice", "open"),
+    "high":  ("highPrice", "high"),
+    "low":   ("lowPrice", "low"),
+    "close": ("previousClose", "prevClose", "previousDayClosePrice", "closePrice", "close"),
+    "vol":   ("totalTradeQuantity", "totalTradedQuantity", "volume", "vol", "qty"),
+}
+
+def _pick(obj, keys):
+    for k in keys:
+        if k in obj and obj[k] not in (None, ""):
+            return obj[k]
+    return None
 
+def _to_float(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+def _decode_frame_text(text):
+    """Unwrap SockJS ('a[...]') and STOMP ('MESSAGE\n...\n\n{json}\0') framing into JSON objects."""
+    text = (text or "").strip()
+    if not text:
+        return []
+    if text[0] == "a" and text[1:2] == "[":
+        try:
+            return [obj for inner in json.loads(text[1:]) for obj in _decode_frame_text(inner)]
+        except (ValueError, TypeError):
+            return []
+    if text.startswith("MESSAGE") and "\n\n" in text:
+        text = text.split("\n\n", 1)[1].rstrip("\x00")
+    if text[0] not in "[{":
+        return []
+    try:
+        return [json.loads(text)]
+    except ValueError:
+        return []
+
+def extract_quote_rows(obj, out, depth=0):
+    """Walk a decoded payload and append scraper-shaped rows for every quote-like dict."""
+    if depth > 6:
+        return out
+    if isinstance(obj, list):
+        for item in obj:
+            extract_quote_rows(item, out, depth + 1)
+    elif isinstance(obj, dict):
+        sym = _pick(obj, CDP_FIELD_ALIASES["sym"])
+        ltp = _to_float(_pick(obj, CDP_FIELD_ALIASES["ltp"]))
+        if isinstance(sym, str) and sym.strip() and ltp and ltp > 0:
+            sym = sym.strip().upper()
+            prev = latest_rows.get(sym, {})
+            row = {"sym": sym, "ltp": ltp}
+            for field in ("pct", "open", "high", "low", "close", "vol"):
+                value = _to_float(_pick(obj, CDP_FIELD_ALIASES[field]))
+                row[field] = value if value is not None else prev.get(field, 0)
+            out.append(row)
+        else:
+            for value in obj.values():
+                if isinstance(value, (dict, list)):
+                    extract_quote_rows(value, out, depth + 1)
+    return out
+
+def drain_cdp_rows(source):
+    """Decode quotes from WebSocket frames and JSON XHR bodies logged since the last drain.
+    Rows are coalesced per symbol so a burst of frames yields one row per symbol."""
+    rows = {}
+    driver = source.driver
+    pending = source.pending_cdp_bodies
+    now = time.time()
+    for entry in driver.get_log("performance"):
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        method = message.get("method")
+        params = message.get("params", {})
+        payloads = []
+
+        if method == "Network.webSocketFrameReceived":
+            payloads = _decode_frame_text(params.get("response", {}).get("payloadData"))
+        elif method == "Network.responseReceived":
+            if "json" in params.get("response", {}).get("mimeType", ""):
+                request_id = params.get("requestId")
+                pending.pop(request_id, None)  # Re-inserted so arrival order stays oldest first
+                pending[request_id] = now
+        elif method == "Network.loadingFailed":
+            pending.pop(params.get("requestId"), None)
+        elif method == "Network.loadingFinished" and params.get("requestId") in pending:
+            request_id = params["requestId"]
+            del pending[request_id]
+            try:
+                body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+                payloads = _decode_frame_text(body.get("body"))
+            except Exception:
+                continue
+
+        for payload in payloads:
+            for row in extract_quote_rows(payload, []):
+                rows[row["sym"]] = row
+
+    # A loadingFinished dropped from the perf log would otherwise pin its requestId all session
+    # (dicts keep arrival order, so the oldest come first)
+    for request_id, seen in list(pending.items()):
+        if now - seen < CDP_BODY_EXPIRY and len(pending) <= CDP_MAX_PENDING_BODIES:
+            break
+        del pending[request_id]
+    return list(rows.values())
+
+# ==================== BULLETPROOF ATOMIC WRITE ====================
 def write_moves_data_atomic(moves_list):
     """Write recent price movements to JSON for UI consumption"""
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            payload = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "moves": list(moves_list),  # Convert deque to list
-                "count": len(moves_list)
-            }
-            
-            # Step 1: Write to private file
-            with open(MOVES_PRIVATE, "w", encoding="utf-8") as f:
-                json.dump(payload, f, indent=None)
-                f.flush()
-                os.fsync(f.fileno())
-            
-            # Step 2: Atomic replace
-            os.replace(MOVES_PRIVATE, MOVES_SHARED)
-            return True
-            
-        except Exception as e:
-            if attempt == max_retries - 1:
-                print(f"Failed to write moves: {e}")
-            time.sleep(0.1)
-    return False
+    if not write_moves_json(SHARED_DIR, moves_list):
+        print("Failed to write moves")
+        return False
+    return True
 
 # ==================== LOGGING SETUP ====================
 def cleanup_old_logs():
@@ -262,19 +652,27 @@ cleanup_old_logs()
 
 csv_full = csv_moves = None
 writer_full = writer_moves = None
+journal = None
 current_hour = None
 
 def open_hourly_files():
-    global csv_full, csv_moves, writer_full, writer_moves, current_hour
+    global csv_full, csv_moves, writer_full, writer_moves, journal, current_hour
     hour = datetime.now().strftime("%Y-%m-%d_%H")
     if hour == current_hour: return
     current_hour = hour
     for f in (csv_full, csv_moves):
         if f and not f.closed: f.close()
+    if journal:
+        journal.close()
 
     path = BASE_DIR / f"NEPSE_{hour}"
     path.mkdir(exist_ok=True)
 
+    if LOG_FORMAT == "binary":
+        journal = JournalWriter(path)
+        print(f"LOGGING -> {path.name} (binary journal)")
+        return
+
     full_path = path / "FULL_SNAPSHOT.csv"
     csv_full = open(full_path, "a", newline="", encoding="utf-8", buffering=1)
     writer_full = csv.writer(csv_full)
@@ -292,144 +690,356 @@ def open_hourly_files():
 open_hourly_files()
 last_full_write = 0
 
-# ==================== MAIN LOOP - IMMORTAL ====================
-all_stocks = {}
-last_refresh = 0
-heartbeat_counter = 0
-# FIX: Initialize loop_start to ensure it's defined even if an exception occurs before the try block starts
-loop_start = time.time()
-print("SCANNER ONLINE - DOMINATING THE MARKET")
-print("=" * 95)
+# ==================== PIPELINE STAGES ====================
+# capture (main thread) -> diff -> publish (CSV rows, JSON files, fsync)
+#                               \-> notify (beep)
+# Every arrow is a bounded StageQueue. A stage that falls behind gets its pending
+# work coalesced instead of blocking the producer, so the capture cadence never
+# waits on disk or sound.
+PIPELINE_QUEUE_SIZE = 4
+NOTIFY_QUEUE_SIZE = 2
+PIPELINE_STATS_FILE = SHARED_DIR / "scraper_pipeline.json"
+PIPELINE_STATS_INTERVAL = 5
+
+diff_queue = StageQueue("diff", PIPELINE_QUEUE_SIZE, coalesce_capture)
+publish_queue = StageQueue("publish", PIPELINE_QUEUE_SIZE, coalesce_publish)
+notify_queue = StageQueue("notify", NOTIFY_QUEUE_SIZE)
+stage_timings = {"capture": 0.0, "diff": 0.0, "publish": 0.0}
 
-while not shutdown_event.is_set():
+def pipeline_stats():
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "queues": {q.name: q.stats() for q in (diff_queue, publish_queue, notify_queue)},
+        "last_stage_seconds": {k: round(v, 4) for k, v in stage_timings.items()},
+        "refresh": sources[0].refresh_scheduler.stats(),
+        "publication": market_publisher.stats(),
+        "sources": {s.name: s.stats() for s in sources},
+    }
+
+def write_pipeline_stats():
     try:
-        loop_start = time.time()
-        now_full = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        now_short = datetime.now().strftime("%H:%M:%S")
-
-        if datetime.now().hour != int(current_hour.split("_")[-1]):
-            open_hourly_files()
-
-        if loop_start - last_refresh >= TARGET_INTERVAL:
-            if click_refresh():
-                beep()
-                print(f"[{now_full}] MARKET REFRESHED")
-            last_refresh = loop_start
-            time.sleep(1.2)
-
-        data = driver.execute_script("""
-            return Array.from(document.querySelectorAll('tbody tr')).map(tr => {
-                const tds = tr.querySelectorAll('td');
-                if (tds.length < 8) return null;
-                const txt = i => (tds[i]?.innerText || '').replace(/,/g, '').trim();
-                const num = i => parseFloat(txt(i)) || 0;
-                return {
-                    sym: txt(0),
-                    ltp: num(1),
-                    pct: num(2),
-                    open: num(3),
-                    high: num(4),
-                    low: num(5),
-                    close: num(6),
-                    vol: num(7) || 0
-                };
-            }).filter(x => x && x.sym && x.ltp > 0);
-        """)
-
-        print(f"[{now_short}] Scraped {len(data)} stocks", end="")
-
-        moved = []
-        for item in data:
-            sym = item["sym"]
-            ltp = round(item["ltp"], 2)
-            close = round(item["close"], 2)
-            vol = int(item["vol"])
-
-            prev = all_stocks.get(sym, {})
-            old_ltp = prev.get("ltp", 0)
-            ref = old_ltp if old_ltp > 0 else close
-            change = ltp - ref
-
-            if time.time() - last_full_write > 58:
-                writer_full.writerow([now_full, sym, ltp, item["open"], item["high"], item["low"], close, vol, f"{item['pct']:+.2f}"])
-
-            if abs(change) >= 0.01:
-                direction = "UP" if change > 0 else "DOWN"
-                moved.append((sym, ltp, ref, change, direction, vol, item["pct"]))
-                beep()
-                writer_moves.writerow([now_full, sym, ltp, f"{ref:.2f}", f"{change:+.2f}", direction, f"{vol:,}", f"{item['pct']:+.2f}"])
-
-            all_stocks[sym] = {"ltp": ltp, "close": close, "volume": vol, "pct_change": item["pct"], "time": now_short}
-
-        if moved:
-            print(f" -> {len(moved)} MOVING!")
-            print("=" * 95)
-            for m in moved:
-                print(f" {m[4]} {m[0]:8} | {m[2]:7.2f} -> {m[1]:7.2f} ({m[3]:+6.2f}) | Vol:{m[5]:>9,} | {m[6]:+6.2f}%")
-                
-                # NEW CODE - Store move for UI
-                move_entry = {
-                    "timestamp": now_full,
-                    "time": now_short,
-                    "symbol": m[0],
-                    "direction": m[4],
-                    "from_price": round(m[2], 2),
-                    "to_price": round(m[1], 2),
-                    "change": round(m[3], 2),
-                    "volume": m[5],
-                    "pct_change": round(m[6], 2)
-                }
-                RECENT_MOVES.append(move_entry)
-            
-            print("=" * 95 + "\n")
-            
-            # NEW CODE - Write moves to JSON for UI
-            write_moves_data_atomic(RECENT_MOVES)
-        else:
-            print(" -> Quiet market")
+        tmp = PIPELINE_STATS_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pipeline_stats(), f, indent=None)
+        os.replace(tmp, PIPELINE_STATS_FILE)
+    except Exception as e:
+        print(f"Failed to write pipeline stats: {e}")
 
-        payload = {"timestamp": now_full, "total": len(all_stocks), "stocks": all_stocks.copy()}
-        write_market_data_atomic(payload)
+all_stocks = {}     # Published JSON view; diffing and history live in tick_store
+latest_rows = {}   # sym -> last raw row from the page (feeds FULL_SNAPSHOT in delta mode)
+try:
+    tick_store = TickStore(TICK_STORE_FILE, TICK_STORE_SYMBOLS, TICK_STORE_CAPACITY)
+except (OSError, ValueError) as e:
+    # e.g. a new layout while the engine/API keeps the old file mapped (Windows won't replace it):
+    # keep scraping with an in-process store; engine/API history resumes once it can be recreated
+    print(f"Tick store unavailable ({e}), keeping this session's history in memory")
+    tick_store = TickStore(None, TICK_STORE_SYMBOLS, TICK_STORE_CAPACITY)
+market_publisher = MarketPublisher(SHARED_DIR, SNAPSHOT_EVERY, KEEP_DELTAS)
+shm_writer = None
+if ENABLE_SHM:
+    try:
+        shm_writer = MarketShmWriter(SHARED_DIR / SHM_NAME, TICK_STORE_SYMBOLS)
+    except OSError as e:
+        # e.g. a new layout while a reader keeps the old segment mapped (Windows won't replace it);
+        # its heartbeat goes stale and readers serve the JSON feed
+        print(f"Shared memory disabled ({e}), publishing the JSON feed only")
+if not ENABLE_SHM:
+    # A segment left by an earlier run would be served as frozen prices
+    (SHARED_DIR / SHM_NAME).unlink(missing_ok=True)
+print(f"TICK STORE -> {tick_store.path or 'memory'} ({len(tick_store.symbols)} symbols carried over)")
 
-        if time.time() - last_full_write > 58:
-            csv_full.flush()
-            last_full_write = time.time()
+merge_leaders = {}  # sym -> [source, volume, when that volume was first seen] (multi-broker only)
 
-        heartbeat_counter += 1
-        if heartbeat_counter % 100 == 0:
-            print(f"HEARTBEAT @ {now_full} | {len(all_stocks)} stocks | Running strong")
+def merge_source_rows(rows, now):
+    """Consolidate rows from several brokers into one feed.
 
-    except Exception as e:
-        error_message = str(e).lower()
-        print(f"\nRECOVERABLE ERROR: {e}")
-        
-        # Check for session termination errors (tab crashed, connection lost, invalid session)
-        if "invalid session id" in error_message or "tab crashed" in error_message or "connection refused" in error_message:
-            print("CRITICAL ERROR DETECTED: SESSION LOST OR TAB CRASHED. Attempting full re-initialization...")
-            try:
-                # Attempt to safely quit the broken session first
-                driver.quit()
-            except:
-                pass
+    NEPSE volume is cumulative for the session, so for each symbol the source
+    showing the highest volume has seen the most trades and leads it. Its rows
+    pass; a lagging broker's older quote is dropped instead of moving the price
+    backwards. A leader that stops capturing for MERGE_STALE_SECONDS (session
+    lost, dashboard frozen) gives its symbols up to whichever source reports next."""
+    accepted = []
+    for row in rows:
+        source, sym, vol = row["src"], row["sym"], int(row["vol"])
+        seen = source.seen_vol.get(sym)
+        fresh = seen != vol
+        if fresh:
+            source.seen_vol[sym] = vol
+            source.new_ticks += 1
+        lead = merge_leaders.get(sym)
+        if lead is None or vol > lead[1] or now - lead[0].last_ok >= MERGE_STALE_SECONDS:
+            if fresh and (lead is None or vol > lead[1]):
+                source.led += 1
+            if lead is None or lead[0] is not source:
+                if lead:
+                    lead[0].symbols_led -= 1
+                source.symbols_led += 1
+            merge_leaders[sym] = [source, vol, now if lead is None or vol != lead[1] else lead[2]]
+            accepted.append(row)
+        elif lead[0] is source:
+            if vol == lead[1]:
+                accepted.append(row)  # Same trade count, e.g. a corrected %change
+        elif fresh:
+            if vol == lead[1] and seen is not None:  # First sighting after startup says nothing about lag
+                source.lag_total += now - lead[2]
+                source.lag_count += 1
+            elif vol < lead[1]:
+                source.behind += 1
+    return accepted
+
+def diff_capture(batch):
+    """Diff one capture batch against all_stocks and build the publish job."""
+    global last_full_write
+    now_full, now_short = batch["now_full"], batch["now_short"]
+    moves_rows = []
+    moved = []
+    changed = {}
+    ts = time.time()
+    rows = merge_source_rows(batch["rows"], ts) if len(sources) > 1 else batch["rows"]
+    for item in rows:
+        sym = item["sym"]
+        ltp = round(item["ltp"], 2)
+        close = round(item["close"], 2)
+        vol = int(item["vol"])
+
+        try:
+            last = tick_store.last(sym)
+            if last is None or last[1] != ltp or last[2] != vol:
+                tick_store.append(sym, ts, ltp, vol, item["pct"])
+            old_ltp = last[1] if last else 0
+        except OverflowError:
+            old_ltp = all_stocks.get(sym, {}).get("ltp", 0)
+        ref = old_ltp if old_ltp > 0 else close
+        change = ltp - ref
+
+        latest_rows[sym] = item
+
+        if abs(change) >= 0.01:
+            direction = "UP" if change > 0 else "DOWN"
+            moved.append((sym, ltp, ref, change, direction, vol, item["pct"]))
+            notify_queue.put("move")
+            moves_rows.append((ts, now_full, sym, ltp, ref, change, direction, vol, item["pct"]))
+
+        entry = {"ltp": ltp, "close": close, "volume": vol, "pct_change": item["pct"], "time": now_short}
+        prev = all_stocks.get(sym)
+        if prev is None or (prev["ltp"], prev["close"], prev["volume"], prev["pct_change"]) != (ltp, close, vol, item["pct"]):
+            changed[sym] = entry
+        all_stocks[sym] = entry
+
+    print(batch["label"], end="")
+    moves = None
+    if moved:
+        print(f" -> {len(moved)} MOVING!")
+        print("=" * 95)
+        for m in moved:
+            print(f" {m[4]} {m[0]:8} | {m[2]:7.2f} -> {m[1]:7.2f} ({m[3]:+6.2f}) | Vol:{m[5]:>9,} | {m[6]:+6.2f}%")
             
-            # Re-run the initialization steps to reconnect
-            try:
-                driver, dashboard_handle = initialize_driver_session()
-                print("RE-INITIALIZATION SUCCESSFUL. Resuming scan.")
-            except Exception as reconnect_error:
-                print(f"RE-INITIALIZATION FAILED: {reconnect_error}")
-                # If reconnect fails, wait longer before next attempt
-                time.sleep(15) 
+            # NEW CODE - Store move for UI
+            move_entry = {
+                "timestamp": now_full,
+                "time": now_short,
+                "symbol": m[0],
+                "direction": m[4],
+                "from_price": round(m[2], 2),
+                "to_price": round(m[1], 2),
+                "change": round(m[3], 2),
+                "volume": m[5],
+                "pct_change": round(m[6], 2)
+            }
+            RECENT_MOVES.append(move_entry)
         
-        time.sleep(3) # Short wait for general errors
+        print("=" * 95 + "\n")
+        for source in sources:
+            source.refresh_scheduler.observe(len(moved))
+        moves = list(RECENT_MOVES)
+    else:
+        print(" -> Quiet market")
+
+    # Full snapshot comes from the row cache so delta mode still logs every symbol
+    full_rows = None
+    if time.time() - last_full_write > 58:
+        full_rows = [(ts, now_full, sym, round(item["ltp"], 2), item["open"], item["high"], item["low"],
+                      round(item["close"], 2), int(item["vol"]), item["pct"])
+                     for sym, item in list(latest_rows.items())]
+        last_full_write = time.time()
+
+    return {
+        "now_full": now_full,
+        "moves_rows": moves_rows,
+        "full_rows": full_rows,
+        "moves": moves,
+        "changed": changed,
+        "stocks": all_stocks.copy() if changed else None,
+    }
+
+def write_log_rows(moves_rows, full_rows):
+    if journal:
+        for ts, _, sym, ltp, ref, _, _, vol, pct in moves_rows:
+            journal.append_move(int(ts * 1000), sym, ltp, ref, vol, pct)
+        for ts, _, sym, ltp, open_, high, low, close, vol, pct in full_rows or ():
+            journal.append_snapshot(int(ts * 1000), sym, ltp, open_, high, low, close, vol, pct)
+        journal.flush()
+        return
+    for _, now_full, sym, ltp, ref, change, direction, vol, pct in moves_rows:
+        writer_moves.writerow([now_full, sym, ltp, f"{ref:.2f}", f"{change:+.2f}", direction, f"{vol:,}", f"{pct:+.2f}"])
+    if full_rows:
+        writer_full.writerows([now_full, sym, ltp, open_, high, low, close, vol, f"{pct:+.2f}"]
+                              for _, now_full, sym, ltp, open_, high, low, close, vol, pct in full_rows)
+        csv_full.flush()
+
+def publish_job(job):
+    open_hourly_files()
+    write_log_rows(job["moves_rows"], job["full_rows"])
+    if job["moves"] is not None:
+        # NEW CODE - Write moves to JSON for UI
+        write_moves_data_atomic(job["moves"])
+    seq = market_publisher.publish(job["now_full"], job["stocks"] or {}, job["changed"])
+    if seq is not None:
+        if shm_writer:
+            shm_writer.write(job["changed"], seq)
+        print(f"Data updated (seq {seq}, {len(job['changed'])} changed)")
+
+def diff_stage():
+    while (batch := diff_queue.get()) is not None:
+        started = time.time()
+        try:
+            publish_queue.put(diff_capture(batch))
+        except Exception as e:
+            print(f"\nRECOVERABLE ERROR (diff stage): {e}")
+        stage_timings["diff"] = time.time() - started
+    publish_queue.close()
+    notify_queue.close()
+
+def publish_stage():
+    last_stats = 0
+    while (job := publish_queue.get()) is not None:
+        started = time.time()
+        try:
+            publish_job(job)
+        except Exception as e:
+            print(f"\nRECOVERABLE ERROR (publish stage): {e}")
+        stage_timings["publish"] = time.time() - started
+        if started - last_stats >= PIPELINE_STATS_INTERVAL:
+            write_pipeline_stats()
+            last_stats = started
+
+def notify_stage():
+    while notify_queue.get() is not None:
+        beep()
+
+stage_threads = [
+    threading.Thread(target=diff_stage, name="diff", daemon=True),
+    threading.Thread(target=publish_stage, name="publish", daemon=True),
+    threading.Thread(target=notify_stage, name="notify", daemon=True),
+]
+for t in stage_threads:
+    t.start()
+
+# ==================== MAIN LOOP - IMMORTAL (CAPTURE STAGE) ====================
+def capture_loop(source):
+    """Capture stage for one broker dashboard. Single mode runs it on the main
+    thread; multi-broker mode runs one per source, all feeding diff_queue."""
+    heartbeat_counter = 0
+    # FIX: Initialize loop_start to ensure it's defined even if an exception occurs before the try block starts
+    loop_start = time.time()
+    tag = source.tag
+    while not shutdown_event.is_set():
+        try:
+            loop_start = time.time()
+            now_full = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            now_short = datetime.now().strftime("%H:%M:%S")
+            if source.driver is None:
+                raise RuntimeError("no driver session")
+            driver = source.driver
+            scheduler = source.refresh_scheduler
+
+            if CAPTURE_MODE != "cdp" and scheduler.due(source.last_refresh, loop_start):
+                if click_refresh(source):
+                    notify_queue.put("refresh")
+                    print(f"{tag}[{now_full}] MARKET REFRESHED ({scheduler.phase}, next in {scheduler.interval:.1f}s, "
+                          f"settled in {scheduler.last_latency:.2f}s)")
+                scheduler.refreshed()
+                source.last_refresh = loop_start
+
+            if CAPTURE_MODE == "cdp":
+                data = drain_cdp_rows(source)
+                if data:
+                    source.last_cdp_tick = loop_start
+                elif loop_start - source.last_cdp_tick >= CDP_STALE_SECONDS:
+                    print(f"{tag}[{now_short}] [CDP] No network ticks for {CDP_STALE_SECONDS}s -> DOM safety scrape")
+                    data = driver.execute_script(SCRAPE_ALL_ROWS_JS)
+                    source.last_cdp_tick = loop_start
+                label = f"{tag}[{now_short}] Captured {len(data)} quotes from network"
+            elif CAPTURE_MODE == "delta":
+                data = drain_delta_rows(source)
+                label = f"{tag}[{now_short}] Scraped {len(data)} changed rows ({len(latest_rows)} tracked)"
+            else:
+                data = driver.execute_script(SCRAPE_ALL_ROWS_JS)
+                label = f"{tag}[{now_short}] Scraped {len(data)} stocks"
+            source.last_ok = time.time()
+            if shm_writer:
+                shm_writer.heartbeat()  # Readers treat a silent segment as stale
+            if CAPTURE_MODE == "cdp" and not data:
+                # Nothing pushed by the broker: skip the publish stage entirely
+                time.sleep(CDP_POLL_INTERVAL)
+                continue
+
+            if len(sources) > 1:
+                for row in data:
+                    row["src"] = source  # The diff stage merges brokers per symbol
+            diff_queue.put({"now_full": now_full, "now_short": now_short, "rows": data, "label": label})
+            source.captures += 1
+            source.rows_captured += len(data)
+            source.capture_seconds = stage_timings["capture"] = time.time() - loop_start
+
+            heartbeat_counter += 1
+            if heartbeat_counter % 100 == 0:
+                depths = " ".join(f"{name}={q['depth']}/{q['max']}" for name, q in pipeline_stats()["queues"].items())
+                print(f"{tag}HEARTBEAT @ {now_full} | {len(all_stocks)} stocks | Queues {depths} | Running strong")
+
+        except Exception as e:
+            error_message = str(e).lower()
+            print(f"\n{tag}RECOVERABLE ERROR: {e}")
+
+            # Check for session termination errors (tab crashed, connection lost, invalid session)
+            if source.driver is None or "invalid session id" in error_message or "tab crashed" in error_message or "connection refused" in error_message:
+                recover_session(source)
+
+            time.sleep(3) # Short wait for general errors
+
+        elapsed = time.time() - loop_start
+        min_period = CDP_POLL_INTERVAL if CAPTURE_MODE == "cdp" else 1.0
+        if elapsed < min_period:
+            time.sleep(min_period - elapsed)
+
+print("SCANNER ONLINE - DOMINATING THE MARKET")
+print("=" * 95)
 
-    elapsed = time.time() - loop_start
-    if elapsed < 1.0:
-        time.sleep(1.0 - elapsed)
+if len(sources) == 1:
+    capture_loop(sources[0])
+else:
+    capture_threads = [threading.Thread(target=capture_loop, args=(source,), name=f"capture-{source.name}", daemon=True)
+                       for source in sources]
+    for t in capture_threads:
+        t.start()
+    while not shutdown_event.is_set():
+        shutdown_event.wait(1)  # Short waits keep Ctrl+C responsive on Windows
+    for t in capture_threads:
+        t.join(timeout=15)
 
-# FINAL CLEANUP
+# FINAL CLEANUP - let the diff/publish stages drain before closing the CSVs
+diff_queue.close()
+for t in stage_threads:
+    t.join(timeout=10)
+write_pipeline_stats()
 for f in (csv_full, csv_moves):
     if f and not f.closed: f.close()
-try: driver.quit()
-except: pass
+if journal:
+    journal.close()
+tick_store.close()
+if shm_writer:
+    shm_writer.close()
+for source in sources:
+    try: source.driver.quit()
+    except: pass
 print("ELITE SCANNER STOPPED - THE EMPIRE IS ETERNAL - GOODBYE KING")
\ No newline at end of file
@@ -1,28 +1,64 @@
 """
 backend/3_signal_engine_v2.py
 Real-time personalized signal engine that:
- - reads shared/market_data.json
- - reads shared/user_strategies.json every STRATEGY_RELOAD_INTERVAL seconds
- - writes enriched signals.json and signals_legacy.json (backward-compatible)
- - logs signals to DB (signal_history) and CSV
+ - follows the scraper via shared memory (market_shm.py), falling back to the
+   versioned shared/market_data.json delta feed (market_feed.py)
+ - sleeps until the scraper publishes (market_feed.FeedWaiter) and re-checks
+   only symbols whose LTP changed, with a full sweep every FULL_SWEEP_INTERVAL
+ - indexes every trigger level per symbol (signal_rules.TriggerIndex) and keeps
+   it in step with shared/user_strategies.json incrementally: the file is only
+   parsed when its stat and content hash change, only users whose config changed
+   are re-indexed, and only their symbols are re-checked. Per-user notices from
+   the config API (shared/strategy_update_<user_id>.json) apply immediately
+ - with SIGNAL_EVAL_MODE=numpy, evaluates ticks on a columnar copy of the index
+   (signal_vector.VectorTriggerBook); same signals, faster on very large books
+ - with SIGNAL_SHARDS=N (N > 1), partitions the users over N worker processes
+   (signal_shards.ShardPool): each tick's prices are broadcast to all of them,
+   their hits merged back in strategy-file order, and per-shard evaluation time
+   is reported with the heartbeat
+ - keeps streaming per-symbol indicators (indicators.IndicatorBook: VWAP, EMA,
+   ATR, RSI), computed once per symbol from each tick and warmed up from the
+   scraper's tick store, for buy_rule / sell_rule / stop_rule triggers such as
+   "ltp < vwap - 1.5 * atr"
+ - latches each trigger after it fires (signal_rules.TriggerLatches) so a held
+   price emits one signal, not one per pass
+ - appends every signal to the durable queue (signal_queue.SignalQueue,
+   shared/signal_queue.db) that the order executors consume with their own
+   committed offsets; signals.json / signals_legacy.json still hold the latest
+   batch for the API and older readers, but nothing consumes them any more
+ - logs signals to DB (signal_history) and CSV through a background batch writer
+   (signal_history.py)
 
 Run:
     python backend/3_signal_engine_v2.py
 """
+import atexit
+import hashlib
 import json
 import os
 import time
-import csv
-import sqlite3
 from datetime import datetime
 from pathlib import Path
 
+from indicators import IndicatorBook
+from market_feed import PARENT_SHARED_DIR, ConsumerProgress, FeedWaiter, shared_dir, wait_for_update
+from market_shm import open_market_reader
+from signal_history import SignalHistoryWriter
+from signal_queue import SignalQueue
+from signal_rules import BUY, SELL, STOP, TriggerIndex, TriggerLatches, make_signal
+from signal_shards import ShardPool
+from signal_vector import HAVE_NUMPY, VectorTriggerBook
+from tick_store import open_tick_store
+from user_strategies_generator import STRATEGY_UPDATE_PREFIX
+
 BASE_DIR = Path(__file__).resolve().parent
-SHARED_DIR = BASE_DIR.parent / "shared"
-DATA_FILE = SHARED_DIR / "market_data.json"
+SHARED_DIR = shared_dir(PARENT_SHARED_DIR)  # $SHARED_DIR overrides (replay load tests)
 STRATEGIES_FILE = SHARED_DIR / "user_strategies.json"
 SIGNAL_FILE = SHARED_DIR / "signals.json"
 SIGNAL_LEGACY = SHARED_DIR / "signals_legacy.json"
+SIGNAL_QUEUE_DB = SHARED_DIR / "signal_queue.db"
+LATCH_FILE = SHARED_DIR / "trigger_latches.json"
+TICK_STORE_FILE = SHARED_DIR / "tick_store.bin"
 LOG_DIR = BASE_DIR / "logs"
 CSV_LOG = LOG_DIR / "SIGNALS_HISTORY.csv"
 DATABASE_PATH = BASE_DIR / "trading_system.db"
@@ -30,12 +66,6 @@ DATABASE_PATH = BASE_DIR / "trading_system.db"
 LOG_DIR.mkdir(exist_ok=True)
 SHARED_DIR.mkdir(exist_ok=True)
 
-if not CSV_LOG.exists():
-    with CSV_LOG.open("w", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow([
-            "Time", "User_ID", "Symbol", "Action", "Price", "Qty", "Reason", "Order_Type"
-        ])
-
 print("=" * 100)
 print("🚀 NEPAL PERSONALIZED SIGNAL ENGINE 2025 - REAL-TIME EDITION")
 print("=" * 100)
@@ -63,182 +93,254 @@ def atomic_write(path, data):
     except Exception as e:
         print(f"❌ WRITE FAILED {path.name}: {e}")
 
-def log_signal_to_db(user_id, symbol, action, price, qty, reason):
+SIGNAL_STYLE = {BUY: ("🟢", "BUY "), SELL: ("🔴", "SELL"), STOP: ("⛔", "STOP")}
+
+strategy_stat = None     # (mtime_ns, size) of user_strategies.json when last read
+strategy_digest = None   # sha1 of its content when last parsed
+
+def strategies_if_changed():
+    """Parsed user_strategies.json if its content changed since the last call, else None.
+    A stat() is the usual cost; the file is read only when mtime/size moved and
+    parsed only when its hash differs too."""
+    global strategy_stat, strategy_digest
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA journal_mode=WAL;")
-        cursor.execute("""
-            INSERT INTO signal_history (user_id, symbol, action, price, qty, reason, status)
-            VALUES (?, ?, ?, ?, ?, ?, 'PENDING')
-        """, (user_id, symbol, action, price, qty, reason))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"⚠️  DB LOG FAILED: {e}")
+        st = STRATEGIES_FILE.stat()
+        if (st.st_mtime_ns, st.st_size) == strategy_stat:
+            return None
+        raw = STRATEGIES_FILE.read_bytes()
+    except OSError:
+        return None
+    digest = hashlib.sha1(raw).hexdigest()
+    if digest == strategy_digest:
+        strategy_stat = (st.st_mtime_ns, st.st_size)
+        return None
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None  # Caught mid-write: look again on the next check
+    strategy_stat, strategy_digest = (st.st_mtime_ns, st.st_size), digest
+    return data if isinstance(data, dict) else None
+
+def take_strategy_updates():
+    """{user_id: config or None} from the per-user notices; each is applied once, then removed."""
+    updates = {}
+    for path in sorted(SHARED_DIR.glob(f"{STRATEGY_UPDATE_PREFIX}*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                notice = json.load(f)
+            path.unlink()
+        except (OSError, ValueError):
+            continue
+        if isinstance(notice, dict) and notice.get("user_id"):
+            updates[notice["user_id"]] = notice.get("config")
+    return updates
+
+# DB + CSV history is written by a background thread, one transaction per tick
+history_writer = SignalHistoryWriter(DATABASE_PATH, CSV_LOG)
+atexit.register(history_writer.close)
 
-user_strategies = {}
-last_strategy_reload = 0
-STRATEGY_RELOAD_INTERVAL = 30
+# Executors read from here, each at its own committed offset
+SIGNAL_QUEUE_KEEP_DAYS = 7
+signal_queue = SignalQueue(SIGNAL_QUEUE_DB)
+atexit.register(signal_queue.close)
+pruned = signal_queue.prune(SIGNAL_QUEUE_KEEP_DAYS)
+print(f"📬 Signal queue at offset {signal_queue.head()}"
+      + (f" ({pruned} signals older than {SIGNAL_QUEUE_KEEP_DAYS} days pruned)" if pruned else ""))
+
+market_feed = open_market_reader(SHARED_DIR)  # Shared memory, JSON delta feed as fallback
+feed_progress = ConsumerProgress(SHARED_DIR, "signal_engine")
+# Strategy changes wake the loop too, so they apply without waiting for a tick
+feed_waiter = FeedWaiter(SHARED_DIR, wake_prefixes=(STRATEGIES_FILE.name, STRATEGY_UPDATE_PREFIX))
+IDLE_WAKE_SECONDS = 5          # Longest sleep without a publication (heartbeat, strategy check)
+user_strategies = {"users": {}}
+trigger_index = TriggerIndex()
+last_strategy_check = 0
+STRATEGY_CHECK_INTERVAL = 1    # stat() of the strategies file at most this often while ticks flow
 last_heartbeat = time.time()
 
-print("🔄 Starting signal engine loop...\n")
+# Dirty-symbol evaluation: a tick only re-checks triggers on symbols whose LTP
+# moved; every FULL_SWEEP_INTERVAL everything is re-checked. Symbols whose
+# triggers were just re-indexed are re-checked even if their LTP did not move.
+FULL_SWEEP_INTERVAL = 30
+dirty_symbols = set()
+retrigger_symbols = set()
+evaluated_ltp = {}       # symbol -> LTP at its last evaluation
+last_full_sweep = 0
+evaluated_count = sweep_count = 0
+
+# A trigger fires once, then stays latched until the price leaves a band around
+# its level and the cooldown has passed (state survives restarts in LATCH_FILE)
+LATCH_HYSTERESIS = 0.005       # 0.5% of the trigger level
+LATCH_COOLDOWN = 120           # Seconds before a fired trigger can fire again
+latches = TriggerLatches(LATCH_FILE, LATCH_HYSTERESIS, LATCH_COOLDOWN)
+
+# Indicators for rule triggers: one state per symbol, fed from every tick
+INDICATOR_BAR_SECONDS = 60     # EMA / ATR / RSI run on bars of this length
+indicators = IndicatorBook(INDICATOR_BAR_SECONDS)
+if TICK_STORE_FILE.exists():
+    try:
+        warm_store = open_tick_store(TICK_STORE_FILE)
+        print(f"📈 Indicators warmed from tick store: {indicators.warm_from(warm_store):,} ticks")
+        warm_store.close()
+    except Exception as e:
+        print(f"⚠️  Indicator warm-up skipped: {e}")
+
+# "index" (bisect per symbol) or "numpy" (columnar arrays, rebuilt when the index changes)
+SIGNAL_EVAL_MODE = os.environ.get("SIGNAL_EVAL_MODE", "index").lower()
+if SIGNAL_EVAL_MODE == "numpy" and not HAVE_NUMPY:
+    print("⚠️  SIGNAL_EVAL_MODE=numpy but numpy is not installed, using the index")
+    SIGNAL_EVAL_MODE = "index"
+vector_book = None
+
+# Sharded evaluation: the coordinator (this process) keeps the feed, latches and
+# output; workers only evaluate their users' triggers
+SIGNAL_SHARDS = int(os.environ.get("SIGNAL_SHARDS", "1") or 1)
+shard_pool = None
+if SIGNAL_SHARDS > 1:
+    shard_pool = ShardPool(SIGNAL_SHARDS, SIGNAL_EVAL_MODE)
+    atexit.register(shard_pool.close)
+    print(f"🧩 Evaluating on {SIGNAL_SHARDS} shard processes")
+
+print(f"🔄 Starting signal engine loop (feed wake-up: {feed_waiter.mode}, evaluation: {SIGNAL_EVAL_MODE})...\n")
 
 while True:
     try:
+        # Block until the scraper publishes a new seq; None after IDLE_WAKE_SECONDS of silence
+        changed = wait_for_update(market_feed, feed_waiter, IDLE_WAKE_SECONDS)
         now = time.time()
         now_str = datetime.now().strftime("%H:%M:%S")
 
-        # Reload strategies
-        if now - last_strategy_reload >= STRATEGY_RELOAD_INTERVAL:
-            user_strategies = safe_load_json(STRATEGIES_FILE, {"users": {}})
-            total_users = len(user_strategies.get("users", {}))
-            total_stocks = sum(len(u.get("stocks", {})) for u in user_strategies.get("users", {}).values())
-            print(f"🔄 {now_str} -> Reloaded strategies: {total_users} users, {total_stocks} stocks")
-            last_strategy_reload = now
+        # Strategy changes: on a quiet wake (timeout or nudge), else every STRATEGY_CHECK_INTERVAL
+        if changed is None or now - last_strategy_check >= STRATEGY_CHECK_INTERVAL:
+            last_strategy_check = now
+            users = user_strategies.setdefault("users", {})
+            added, updated, removed, touched = [], [], [], set()
+            fresh = strategies_if_changed()
+            if fresh is not None:
+                user_strategies = fresh
+                users = user_strategies.setdefault("users", {})
+                added, updated, removed, touched = trigger_index.sync(users)
+            for user_id, config in take_strategy_updates().items():
+                patched = trigger_index.set_user(user_id, config)
+                touched |= patched
+                if not config:
+                    if users.pop(user_id, None) is not None:
+                        removed.append(user_id)
+                    continue
+                if patched or user_id not in users:
+                    (updated if user_id in users else added).append(user_id)
+                users[user_id] = config
+            if shard_pool and (added or updated or removed):
+                moved = shard_pool.set_users({**{u: users[u] for u in added + updated}, **dict.fromkeys(removed)})
+                if moved:
+                    print(f"🧩 {now_str} -> Rebalanced shards: moved {moved} users")
+            if added or updated or removed:
+                print(f"🔄 {now_str} -> Strategies: +{len(added)} ~{len(updated)} -{len(removed)} users, "
+                      f"{len(touched)} symbols re-checked | {len(trigger_index)} armed on "
+                      f"{len(trigger_index.symbols)} symbols")
+                retrigger_symbols |= touched
 
-        # Read market
-        market = safe_load_json(DATA_FILE, {"stocks": {}, "timestamp": now_str})
-        market_stocks = market.get("stocks", {})
+        market_stocks = market_feed.stocks
+        if changed is not None:
+            feed_progress.report(market_feed.seq)
+            dirty_symbols.update(changed)
+            for symbol in changed:
+                stock = market_stocks.get(symbol)
+                try:
+                    indicators.update(symbol, float(stock.get("ltp", 0)), float(stock.get("volume", 0) or 0), now)
+                except Exception:
+                    continue
 
         if not market_stocks:
             if now - last_heartbeat > 15:
                 print(f"⏳ {now_str} -> Waiting for market data...")
                 last_heartbeat = now
-            time.sleep(0.7)
             continue
 
+        if now - last_heartbeat > 12:
+            print(f"💓 {now_str} -> Market stocks: {len(market_stocks)} | Users: {len(user_strategies.get('users', {}))} "
+                  f"| Seq: {market_feed.seq} | Evaluated: {evaluated_count} symbols, {sweep_count} sweeps "
+                  f"| Latched: {latches.stats()['latched']} | Alive")
+            if shard_pool:
+                print("🧩 Shards: " + " | ".join(f"#{s['shard']} {s['users']}u/{s['rows']} rows "
+                                               f"{s['avg_ms']:.2f}ms avg {s['max_ms']:.2f}ms max"
+                                               for s in shard_pool.stats(reset=True)))
+            consumers = signal_queue.consumers()
+            if consumers:
+                print("📬 Queue lag: " + " | ".join(f"{name} {c['lag']}" for name, c in consumers.items()))
+            last_heartbeat = now
+            evaluated_count = sweep_count = 0
+
+        full_sweep = now - last_full_sweep >= FULL_SWEEP_INTERVAL
+        if not full_sweep and not dirty_symbols and not retrigger_symbols:
+            continue
+        if full_sweep:
+            candidates = trigger_index.symbols
+            last_full_sweep = now
+            sweep_count += 1
+        else:
+            candidates = (dirty_symbols | retrigger_symbols) & trigger_index.symbols
+        retrigger = retrigger_symbols
+        dirty_symbols = set()
+        retrigger_symbols = set()
+
         all_signals = []
         legacy_signals = []
+        history_rows = []
 
-        for user_id, user_config in user_strategies.get("users", {}).items():
-            user_stocks = user_config.get("stocks", {})
-            for symbol, stock_config in user_stocks.items():
-                if symbol not in market_stocks:
-                    continue
+        # Only symbols somebody has a trigger on; the index bisects each one's levels
+        prices = {}
+        for symbol in candidates:
+            if symbol not in market_stocks:
+                continue
+            try:
+                current_price = float(market_stocks[symbol].get("ltp", 0))
+            except Exception:
+                continue
+            if current_price <= 0:
+                continue
+            # Volume/%change-only updates can't cross a price level (but can move a rule's indicators)
+            if full_sweep or symbol in retrigger or symbol in trigger_index.rule_entries \
+                    or evaluated_ltp.get(symbol) != current_price:
+                prices[symbol] = current_price
+                evaluated_ltp[symbol] = current_price
+        evaluated_count += len(prices)
+        if not prices:
+            continue  # Nothing re-checked, so leave the last signals file alone
 
-                try:
-                    current_price = float(market_stocks[symbol].get("ltp", 0))
-                except Exception:
-                    continue
-                if current_price <= 0:
-                    continue
+        rule_values = {s: indicators.values(s) for s in prices if s in trigger_index.rule_entries}
+        if shard_pool:
+            hits = shard_pool.evaluate(prices, rule_values)
+        elif SIGNAL_EVAL_MODE == "numpy":
+            if vector_book is None or vector_book.version != trigger_index.version:
+                vector_book = VectorTriggerBook(trigger_index)
+            hits = vector_book.evaluate(prices, rule_values)
+        else:
+            hits = trigger_index.evaluate(prices, rule_values)
+
+        for entry, kind, current_price in latches.filter(hits, prices, now):
+            signal, legacy = make_signal(entry, kind, current_price)
+            user_id, symbol = entry["user_id"], entry["symbol"]
+            qty, reason = signal["qty"], signal["reason"]
+            all_signals.append(signal)
+            legacy_signals.append(legacy)
+            icon, label = SIGNAL_STYLE[kind]
+            print(f"{icon} {now_str} -> {label} | {user_id[:8]}... | {symbol:8} @ {current_price:7.2f} | Qty: {qty} | {reason}")
+            history_rows.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id, symbol, signal["action"],
+                                 round(current_price, 2), qty, reason, signal["order_type"]))
 
-                triggers = stock_config.get("triggers", {}) or {}
-                buy_trigger = triggers.get("buy_trigger", 0)
-                sell_trigger = triggers.get("sell_trigger", 0)
-                stop_loss = triggers.get("stop_loss", 0)
-
-                purchase_qty = stock_config.get("purchase_qty", 10)
-                selling_qty = stock_config.get("selling_qty", 10)
-                order_type = stock_config.get("order_type", "LIMIT")
-
-                partial_fill_enabled = bool(triggers.get("partial_fill_enabled", True))
-                min_fill_qty = triggers.get("min_fill_qty") or max(1, purchase_qty // 2)
-
-                # BUY
-                if buy_trigger and current_price <= buy_trigger:
-                    reason = f"Buy trigger hit: {current_price} <= {buy_trigger}"
-                    qty_to_buy = purchase_qty
-                    signal = {
-                        "user_id": user_id,
-                        "symbol": symbol,
-                        "action": "BUY",
-                        "price": round(current_price, 2),
-                        "qty": qty_to_buy,
-                        "min_qty": min_fill_qty if partial_fill_enabled else qty_to_buy,
-                        "order_type": order_type,
-                        "partial_fill": partial_fill_enabled,
-                        "reason": reason,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    all_signals.append(signal)
-                    legacy_signals.append({
-                        "symbol": symbol,
-                        "action": "BUY",
-                        "price": round(current_price, 2),
-                        "qty": qty_to_buy,
-                        "reason": reason
-                    })
-                    print(f"🟢 {now_str} -> BUY  | {user_id[:8]}... | {symbol:8} @ {current_price:7.2f} | Qty: {qty_to_buy} | {reason}")
-                    # CSV
-                    try:
-                        with CSV_LOG.open("a", newline="", encoding="utf-8") as f:
-                            csv.writer(f).writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id, symbol, "BUY", round(current_price, 2), qty_to_buy, reason, order_type])
-                    except:
-                        pass
-                    log_signal_to_db(user_id, symbol, "BUY", current_price, qty_to_buy, reason)
-
-                # SELL (target)
-                elif sell_trigger and current_price >= sell_trigger:
-                    reason = f"Target reached: {current_price} >= {sell_trigger}"
-                    qty_to_sell = selling_qty
-                    signal = {
-                        "user_id": user_id,
-                        "symbol": symbol,
-                        "action": "SELL",
-                        "price": round(current_price, 2),
-                        "qty": qty_to_sell,
-                        "min_qty": min_fill_qty if partial_fill_enabled else qty_to_sell,
-                        "order_type": order_type,
-                        "partial_fill": partial_fill_enabled,
-                        "reason": reason,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    all_signals.append(signal)
-                    legacy_signals.append({
-                        "symbol": symbol,
-                        "action": "SELL",
-                        "price": round(current_price, 2),
-                        "qty": qty_to_sell,
-                        "reason": reason
-                    })
-                    print(f"🔴 {now_str} -> SELL | {user_id[:8]}... | {symbol:8} @ {current_price:7.2f} | Qty: {qty_to_sell} | {reason}")
-                    try:
-                        with CSV_LOG.open("a", newline="", encoding="utf-8") as f:
-                            csv.writer(f).writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id, symbol, "SELL", round(current_price, 2), qty_to_sell, reason, order_type])
-                    except:
-                        pass
-                    log_signal_to_db(user_id, symbol, "SELL", current_price, qty_to_sell, reason)
-
-                # STOP LOSS (force market sell)
-                elif stop_loss and current_price <= stop_loss:
-                    reason = f"STOP LOSS TRIGGERED: {current_price} <= {stop_loss}"
-                    qty_to_sell = selling_qty
-                    signal = {
-                        "user_id": user_id,
-                        "symbol": symbol,
-                        "action": "SELL",
-                        "price": round(current_price, 2),
-                        "qty": qty_to_sell,
-                        "min_qty": qty_to_sell,
-                        "order_type": "MARKET",
-                        "partial_fill": False,
-                        "reason": reason,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    all_signals.append(signal)
-                    legacy_signals.append({
-                        "symbol": symbol,
-                        "action": "SELL",
-                        "price": round(current_price, 2),
-                        "qty": qty_to_sell,
-                        "reason": reason
-                    })
-                    print(f"⛔ {now_str} -> STOP | {user_id[:8]}... | {symbol:8} @ {current_price:7.2f} | Qty: {qty_to_sell} | {reason}")
-                    try:
-                        with CSV_LOG.open("a", newline="", encoding="utf-8") as f:
-                            csv.writer(f).writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id, symbol, "SELL", round(current_price, 2), qty_to_sell, reason, "MARKET"])
-                    except:
-                        pass
-                    log_signal_to_db(user_id, symbol, "SELL", current_price, qty_to_sell, reason)
-
-        # Write signals files
+        # Queue first (executors), then the latest-batch files (API / legacy readers)
+        if all_signals:
+            offset = signal_queue.append(all_signals)
+        # Only once queued: a failed append leaves the triggers armed and out of the history,
+        # so the retry on the next tick is recorded once
+        latches.commit()
+        history_writer.submit(history_rows)
         if all_signals:
             atomic_write(SIGNAL_FILE, all_signals)
             # Write legacy adapter
             atomic_write(SIGNAL_LEGACY, legacy_signals)
-            print(f"📤 {now_str} -> {len(all_signals)} SIGNAL(S) WRITTEN\n")
+            print(f"📤 {now_str} -> {len(all_signals)} SIGNAL(S) QUEUED (offset {offset})\n")
         else:
             # Remove existing to avoid stale signals
             if SIGNAL_FILE.exists():
@@ -248,11 +350,6 @@ while True:
                 try: SIGNAL_LEGACY.unlink()
                 except: pass
 
-        if now - last_heartbeat > 12:
-            print(f"💓 {now_str} -> Market stocks: {len(market_stocks)} | Users: {len(user_strategies.get('users', {}))} | Alive")
-            last_heartbeat = now
-
     except Exception as e:
         print(f"⚠️  {datetime.now().strftime('%H:%M:%S')} -> RECOVERED FROM ERROR: {e}")
-
-    time.sleep(0.7)
\ No newline at end of file
+        time.sleep(0.7)
\ No newline at end of file
@@ -4,14 +4,21 @@
 # - Reads signals and generates email forms
 # - Sends forms to broker email: avinaya@miyo66.com
 # - Compatible with existing pipeline (scraper + signal engine)
+# - Consumes shared/signal_queue.db at its own offset (signal_queue.py)
+# - Sends a batch ORDER_WORKERS orders at a time; same user + symbol stays in order
 
 import os
 import sys
 import time
 import json
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from queue import Empty, Queue
+
+from market_feed import REPO_SHARED_DIR, shared_dir
 
 # Accept both MANAGER_MODE and legacy MANAGED_MODE
 MANAGER_MODE = os.environ.get("MANAGER_MODE", os.environ.get("MANAGED_MODE", "0")) == "1"
@@ -25,10 +32,19 @@ ACCOUNT_NAME = f"TRADER_{ACCOUNT_ID}"
 
 # This ensures both scripts use the exact same folder
 BASE_DIR = Path(__file__).resolve().parent 
-SHARED = BASE_DIR / "shared"
+SHARED = shared_dir(REPO_SHARED_DIR)  # $SHARED_DIR overrides, as in order_utils
+
+# Signal queue: appended by the signal engine, read at this account's own offset
+SIGNAL_QUEUE_DB = SHARED / "signal_queue.db"
+SIGNAL_CONSUMER = os.environ.get("SIGNAL_CONSUMER", f"executor_{ACCOUNT_ID}").strip()
+SIGNAL_REPLAY_FROM = os.environ.get("SIGNAL_REPLAY_FROM", "").strip()   # Re-deliver signals after this offset (once)
+SIGNAL_WAIT_TIMEOUT = 2     # Longest wait for a signal (heartbeat / shutdown flag cadence)
+SIGNAL_BATCH = 50
 
-# Signal file
-SIGNAL_FILE = SHARED / "signals.json"
+# Orders of a batch are sent concurrently; orders for the same user + symbol
+# stay in queue order (one after another on the same worker)
+ORDER_WORKERS = max(1, int(os.environ.get("ORDER_WORKERS", "4") or 4))
+ORDER_TIMEOUT = float(os.environ.get("ORDER_TIMEOUT", "60") or 60)   # Seconds before an order is reported failed
 
 # Logs will stay organized within the project folder
 LOG_DIR = BASE_DIR / "Executor_Logs" / ACCOUNT_NAME / datetime.now().strftime("%Y-%m-%d")
@@ -47,7 +63,11 @@ logging.basicConfig(
 logger = logging.getLogger("executor")
 
 # Import order execution function (NEW VERSION)
-from order_utils import execute_order
+from order_utils import execute_order, serial_allocator
+from signal_queue import SignalQueue
+from smtp_pool import smtp_pool
+
+smtp_pool.max_sessions = ORDER_WORKERS  # One SMTP session per concurrent order
 
 def print_banner():
     """Print startup banner"""
@@ -132,118 +152,205 @@ def verify_configuration():
     return True
 
 
+def write_archive(path, signals):
+    """Rewrite a batch archive file atomically (it grows as orders complete)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(signals, f, indent=2)
+    os.replace(tmp, path)
+
+
+def order_chains(batch):
+    """Split a batch into per-(user, symbol) chains, each kept in queue order"""
+    chains = {}
+    for seq, sig in batch:
+        chains.setdefault((sig.get('user_id'), sig.get('symbol', 'UNKNOWN')), []).append((seq, sig))
+    return list(chains.values())
+
+
+def dispatch_batch(batch, queue, pool, on_idle):
+    """
+    Send a batch of (offset, signal) through the worker pool.
+    Results are archived to executed/ and failed/ as they arrive, and the queue
+    offset is committed up to the longest prefix of the batch that is finished.
+    An order still running after ORDER_TIMEOUT is reported failed (its outcome is
+    unknown: check with the broker before replaying it), and later orders for the
+    same symbol are skipped rather than sent out of order.
+    """
+    results = Queue()
+    running = {}         # offset -> start time
+    sends = {}           # offset -> Future resolved the moment execute_order returns
+    stopped = set()      # chains given up after a timeout
+    lock = threading.Lock()  # A worker registers its next order and the timeout scan stops a chain atomically
+    chains = order_chains(batch)
+    chain_of = {seq: chain_id for chain_id, chain in enumerate(chains) for seq, _ in chain}
+
+    def run_chain(chain_id, chain):
+        for seq, sig in chain:
+            with lock:
+                if chain_id in stopped:
+                    break  # The rest of the chain was already reported as skipped
+                running[seq] = time.time()
+                sent = sends[seq] = Future()
+            symbol = sig.get('symbol', 'UNKNOWN')
+            action = sig.get('action', 'BUY')
+            logger.info(f"Processing: {action} {symbol} (offset {seq})")
+            try:
+                # Execute order (generates form + sends email)
+                success = execute_order(
+                    driver=None,  # Not needed in email mode
+                    signal=sig,
+                    logger=logger
+                )
+                error = None if success else "failed to send"
+            except Exception as e:
+                logger.exception(f"Exception while processing signal {sig}: {e}")
+                success, error = False, str(e)
+            sent.set_result(success)  # Before the lock: the timeout scan may be holding it
+            with lock:
+                running.pop(seq, None)
+            results.put((seq, sig, success, error))
+
+    for seq, sig in batch:
+        sig["queue_offset"] = seq
+        # Add timestamp if not present
+        if 'timestamp' not in sig:
+            sig['timestamp'] = time.time()
+    for chain_id, chain in enumerate(chains):
+        pool.submit(run_chain, chain_id, chain)
+
+    ts = int(time.time())
+    archive_file = SHARED / "executed" / f"done_{ACCOUNT_ID}_{ts}.json"
+    failed_file = SHARED / "failed" / f"failed_{ACCOUNT_ID}_{ts}.json"
+    processed, failed = [], []
+    outcome = {}         # offset -> finished (sent, failed, timed out or skipped)
+    order = [seq for seq, _ in batch]
+    committed = 0        # Batch positions committed so far
+
+    while len(outcome) < len(batch):
+        try:
+            seq, sig, success, error = results.get(timeout=0.5)
+        except Empty:
+            now = time.time()
+            with lock:
+                # Still registered under the lock, so its worker has not moved on to
+                # the next order of the chain and will see `stopped` before it does.
+                # A finished send is left for its worker to report, however long it took
+                timed_out = [seq for seq, started in running.items()
+                             if now - started > ORDER_TIMEOUT and not sends[seq].done()]
+                for seq in timed_out:
+                    stopped.add(chain_of[seq])
+                    running.pop(seq)
+            for seq in timed_out:
+                later = False
+                for q, sig in chains[chain_of[seq]]:
+                    if q == seq:
+                        results.put((q, sig, False, f"timed out after {ORDER_TIMEOUT:.0f}s (outcome unknown)"))
+                        later = True
+                    elif later:
+                        results.put((q, sig, False, "skipped: an earlier order for this symbol timed out"))
+            on_idle()
+            continue
+        if seq in outcome:
+            # The late result of an order already reported as timed out
+            logger.warning(f"Late result for offset {seq}: {'sent' if success else 'failed'} "
+                           f"(was reported as timed out)")
+            continue
+        outcome[seq] = success
+        action, symbol = sig.get('action', 'BUY'), sig.get('symbol', 'UNKNOWN')
+        try:
+            if success:
+                sig["processed_ts"] = time.time()
+                processed.append(sig)
+                write_archive(archive_file, processed)
+                logger.info(f"✓ {action} {symbol} - Form sent to broker")
+            else:
+                sig["error"] = error
+                failed.append(sig)
+                write_archive(failed_file, failed)
+                logger.warning(f"✗ {action} {symbol} - {error} "
+                               f"(replay with SIGNAL_REPLAY_FROM={seq - 1})")
+        except Exception as e:
+            logger.warning(f"Failed to archive signal {seq}: {e}")
+        while committed < len(order) and order[committed] in outcome:
+            committed += 1
+        if committed:
+            queue.commit(SIGNAL_CONSUMER, order[committed - 1])
+
+    return processed, failed
+
+
 def process_signals_loop():
     """
     Main signal processing loop (SIMPLIFIED - No browser needed)
-    Waits for signals.json and processes them by generating email forms
+    Waits on the signal queue and processes signals by generating email forms,
+    ORDER_WORKERS at a time (dispatch_batch). An offset is committed once it and
+    every offset before it has been handled (sent or saved to failed/), so a
+    restart re-delivers at most the orders that were in flight.
     """
+    queue = SignalQueue(SIGNAL_QUEUE_DB)
+    offset = queue.register(SIGNAL_CONSUMER)  # A new consumer starts at the head, not at old signals
+    if SIGNAL_REPLAY_FROM:
+        replay_from = int(SIGNAL_REPLAY_FROM)
+        if queue.replay(SIGNAL_CONSUMER, replay_from):
+            offset = replay_from
+            logger.info(f"SIGNAL_REPLAY_FROM={offset} -> re-delivering signals after offset {offset}")
+        else:
+            # Still set from an earlier run: rewinding again would resend those orders
+            logger.warning(f"SIGNAL_REPLAY_FROM={replay_from} was already applied, ignoring it "
+                           f"(unset it, or use: python signal_queue.py seek {SIGNAL_CONSUMER} {replay_from})")
+    pool = ThreadPoolExecutor(max_workers=ORDER_WORKERS, thread_name_prefix="order")
+
     logger.info("="*70)
     logger.info("EXECUTOR ONLINE - Monitoring for signals...")
-    logger.info("Signal file: " + str(SIGNAL_FILE))
+    logger.info(f"Signal queue: {SIGNAL_QUEUE_DB} | consumer {SIGNAL_CONSUMER} at offset {offset} "
+                f"(head {queue.head()})")
+    logger.info(f"Order workers: {ORDER_WORKERS} | order timeout: {ORDER_TIMEOUT:.0f}s")
     logger.info("="*70)
     
     heartbeat_path = SHARED / "executor_heartbeat" / f"{ACCOUNT_ID}.txt"
     heartbeat_path.parent.mkdir(parents=True, exist_ok=True)
     last_hb = 0
+
+    def heartbeat():
+        nonlocal last_hb
+        if time.time() - last_hb > 5:
+            try:
+                heartbeat_path.write_text(str(time.time()))
+            except Exception:
+                pass
+            last_hb = time.time()
     
     while True:
         try:
-            # Check for signals
-            if SIGNAL_FILE.exists():
+            # Block until the engine appends (or SIGNAL_WAIT_TIMEOUT passes)
+            batch = queue.wait(SIGNAL_CONSUMER, SIGNAL_WAIT_TIMEOUT, limit=SIGNAL_BATCH)
+            if batch:
                 logger.info("="*70)
-                logger.info("SIGNAL DETECTED - Processing orders...")
+                logger.info(f"SIGNAL DETECTED - Processing {len(batch)} order(s) "
+                            f"(offsets {batch[0][0]}-{batch[-1][0]})...")
                 logger.info("="*70)
                 
-                try:
-                    with open(SIGNAL_FILE, "r", encoding="utf-8") as f:
-                        signals = json.load(f)
-                except Exception as e:
-                    logger.error(f"Failed to read signals.json: {e}")
-                    time.sleep(1)
-                    continue
-                
-                if not isinstance(signals, list):
-                    signals = [signals]
-                
-                processed = []
-                failed = []
-                
-                for sig in signals:
-                    try:
-                        symbol = sig.get('symbol', 'UNKNOWN')
-                        action = sig.get('action', 'BUY')
-                        
-                        logger.info(f"Processing: {action} {symbol}")
-                        
-                        # Add timestamp if not present
-                        if 'timestamp' not in sig:
-                            sig['timestamp'] = time.time()
-                        
-                        # Execute order (generates form + sends email)
-                        success = execute_order(
-                            driver=None,  # Not needed in email mode
-                            signal=sig,
-                            logger=logger
-                        )
-                        
-                        if success:
-                            sig["processed_ts"] = time.time()
-                            processed.append(sig)
-                            logger.info(f"✓ {action} {symbol} - Form sent to broker")
-                        else:
-                            failed.append(sig)
-                            logger.warning(f"✗ {action} {symbol} - Failed to send")
-                    
-                    except Exception as e:
-                        logger.exception(f"Exception while processing signal {sig}: {e}")
-                        failed.append(sig)
-                
-                # Archive or remove signals
-                try:
-                    if processed:
-                        archive = SHARED / "executed"
-                        archive.mkdir(parents=True, exist_ok=True)
-                        ts = int(time.time())
-                        archive_file = archive / f"done_{ACCOUNT_ID}_{ts}.json"
-                        with open(archive_file, "w", encoding="utf-8") as af:
-                            json.dump(processed, af, indent=2)
-                        logger.info(f"Archived {len(processed)} processed signals")
-                    
-                    if failed:
-                        failed_dir = SHARED / "failed"
-                        failed_dir.mkdir(parents=True, exist_ok=True)
-                        ts = int(time.time())
-                        failed_file = failed_dir / f"failed_{ACCOUNT_ID}_{ts}.json"
-                        with open(failed_file, "w", encoding="utf-8") as ff:
-                            json.dump(failed, ff, indent=2)
-                        logger.warning(f"Saved {len(failed)} failed signals")
-                    
-                    # Remove signals file
-                    SIGNAL_FILE.unlink(missing_ok=True)
-                    logger.info("Signals file processed and removed")
-                
-                except Exception as e:
-                    logger.warning(f"Failed to archive/remove signals file: {e}")
+                started = time.time()
+                processed, failed = dispatch_batch(batch, queue, pool, heartbeat)
                 
                 logger.info("="*70)
-                logger.info(f"Batch complete: {len(processed)} sent, {len(failed)} failed")
+                logger.info(f"Batch complete in {time.time() - started:.1f}s: {len(processed)} sent, "
+                            f"{len(failed)} failed | committed offset {batch[-1][0]}")
+                for sender, st in smtp_pool.stats().items():
+                    logger.info(f"SMTP {sender}: {st['open']} open | {st['sends']} sent, {st['reused']} on a kept session "
+                                f"| handshake avg {st['handshake_avg_ms']}ms | send avg {st['send_avg_ms']}ms "
+                                f"max {st['send_max_ms']}ms | reconnects {st['reconnects']}")
                 logger.info("="*70)
             
             # Heartbeat
-            if time.time() - last_hb > 5:
-                try:
-                    heartbeat_path.write_text(str(time.time()))
-                except Exception:
-                    pass
-                last_hb = time.time()
+            heartbeat()
             
             # Check for shutdown flag
             if (SHARED / f"shutdown_{ACCOUNT_ID}.flag").exists():
                 logger.info("Shutdown flag detected; exiting loop")
                 break
-            
-            # Sleep briefly
-            time.sleep(0.6)
         
         except KeyboardInterrupt:
             logger.info("KeyboardInterrupt received; stopping")
@@ -253,6 +360,9 @@ def process_signals_loop():
             logger.exception(f"Unexpected error in main loop: {e}")
             time.sleep(5)
 
+    pool.shutdown(wait=False)
+    queue.close()
+
 
 def main():
     """Main entry point"""
@@ -276,6 +386,18 @@ def main():
         input("Press ENTER to exit...")
         sys.exit(1)
     
+    # Serials lost by earlier runs: released block tails, blocks of crashed executors
+    try:
+        gaps = serial_allocator().gaps()
+        abandoned = [g for g in gaps if g["reason"] == "abandoned" and time.time() - g["reserved_at"] < 86400]
+        logger.info(f"Order serials: next block from {serial_allocator().status()['next']} | "
+                    f"{sum(g['count'] for g in gaps)} unused serials in {len(gaps)} gaps")
+        for g in abandoned:
+            logger.warning(f"Serials {g['first']}-{g['last']} abandoned by {g['owner'] or '?'} (pid {g['pid']}): "
+                           f"some may have been sent, check orders_log.csv")
+    except Exception as e:
+        logger.error(f"Serial allocator unavailable: {e}")
+    
     # Wait for startup
     wait_for_startup(timeout=30)
     
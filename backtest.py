@@ -0,0 +1,302 @@
+# backtest.py - BACKTEST USER STRATEGIES OVER RECORDED market_logs
+# Runs the signal engine's trigger logic (signal_rules.TriggerIndex + TriggerLatches,
+# indicator rules included) over archived NEPSE_<hour> segments, simulates
+# fills and reports P&L per user, for one or more trigger multiplier sets.
+#
+# Usage:
+#   python backtest.py market_logs                                   (levels as configured)
+#   python backtest.py market_logs --buy-mult 0.97,0.98 --sell-mult 0.99,1.0 --stop-mult 0.88,0.9
+#   python backtest.py market_logs --from 2025-11-01 --to 2025-11-30 --workers 8 --out backtest_out
+#   python backtest.py market_logs --pack        (convert CSV-only segments to TICKS.bin first: much faster)
+#
+# Work is split into (day x user chunk) units on a process pool. Each unit
+# streams its day's segments record by record (binary journal, or the legacy
+# CSVs) and evaluates every multiplier set in the same pass, so memory stays
+# at one day's symbols per worker regardless of how many months are replayed.
+#
+# Simulation, per day (every day starts flat):
+#   - a tick re-checks the symbols whose LTP changed, like the live engine
+#     (symbols with rule triggers on every update); latches as configured
+#   - BUY fills purchase_qty at the signal price, SELL/STOP fill up to
+#     selling_qty of the open position (nothing to sell = NO_POSITION)
+#   - --slippage-bps moves every fill against the trader
+#   - open positions are marked to the day's last LTP (unrealized P&L)
+#
+# Output (--out): signals.csv, fills.csv, summary.csv (per multiplier set x user)
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from indicators import IndicatorBook
+from market_replay import find_segments, iter_batches, iter_segment
+from signal_rules import (BUY, calculate_triggers, make_signal, TriggerIndex, TriggerLatches,
+                          BUY_MULTIPLIER, SELL_MULTIPLIER, STOP_MULTIPLIER)
+from tick_journal import BIN_NAME, IDX_NAME, MOVE, SYM_NAME, JournalWriter
+
+DEFAULT_STRATEGIES = Path(__file__).resolve().parent.parent / "shared" / "user_strategies.json"
+SIGNAL_FIELDS = ["params", "day", "time", "user_id", "symbol", "action", "kind", "price", "qty", "order_type", "reason"]
+FILL_FIELDS = ["params", "day", "time", "user_id", "symbol", "action", "qty", "fill_price", "position_after",
+               "realized", "status"]
+SUMMARY_FIELDS = ["params", "user_id", "days", "signals", "buys", "sells", "stops", "fills",
+                  "realized", "unrealized", "pnl"]
+
+
+# ==================== STRATEGIES ====================
+def apply_multipliers(users, mults):
+    """Copy of `users` with every stock's levels recomputed from (buy, sell, stop) multipliers.
+    Stocks without purchase/target prices keep their configured levels."""
+    if mults is None:
+        return users
+    buy_mult, sell_mult, stop_mult = mults
+    out = {}
+    for user_id, config in users.items():
+        stocks = {}
+        for symbol, stock in (config.get("stocks", {}) or {}).items():
+            stock = dict(stock)
+            try:
+                levels = calculate_triggers(float(stock["purchase_price"]), float(stock["target_sell_price"]),
+                                            buy_mult=buy_mult, sell_mult=sell_mult, stop_mult=stop_mult)
+                stock["triggers"] = {**(stock.get("triggers", {}) or {}), **levels}
+            except (KeyError, TypeError, ValueError):
+                pass
+            stocks[symbol] = stock
+        out[user_id] = {**config, "stocks": stocks}
+    return out
+
+
+def param_sets(args):
+    """[(label, (buy, sell, stop) | None)]; None = the levels in the strategies file."""
+    if not (args.buy_mult or args.sell_mult or args.stop_mult):
+        return [("configured", None)]
+    def floats(text, default):
+        return [float(x) for x in text.split(",")] if text else [default]
+    grid = itertools.product(floats(args.buy_mult, BUY_MULTIPLIER), floats(args.sell_mult, SELL_MULTIPLIER),
+                             floats(args.stop_mult, STOP_MULTIPLIER))
+    return [(f"b{b:g}_s{s:g}_x{x:g}", (b, s, x)) for b, s, x in grid]
+
+
+# ==================== SIMULATION ====================
+class _Simulation:
+    def __init__(self, label, users, day, opts):
+        self.label = label
+        self.day = day
+        self.index = TriggerIndex(users)
+        self.latches = TriggerLatches(None, opts["hysteresis"], opts["cooldown"])
+        self.slippage = opts["slippage_bps"] / 10000.0
+        self.positions = {}                      # (user_id, symbol) -> [qty, cost]
+        self.stats = defaultdict(lambda: defaultdict(float))
+        self.signals = []
+        self.fills = []
+
+    def tick(self, changed, moved, ts, indicators):
+        index = self.index
+        prices = {s: p for s, p in changed.items()
+                  if s in index.rule_entries or (s in moved and s in index.by_symbol)}
+        if not prices:
+            return
+        rule_values = {s: indicators.values(s) for s in prices if s in index.rule_entries}
+        for entry, kind, price in self.latches.filter(index.evaluate(prices, rule_values), prices, ts):
+            signal, _ = make_signal(entry, kind, price)
+            clock = datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+            self.signals.append([self.label, self.day, clock, signal["user_id"], signal["symbol"], signal["action"],
+                                 kind, signal["price"], signal["qty"], signal["order_type"], signal["reason"]])
+            stats = self.stats[signal["user_id"]]
+            stats["signals"] += 1
+            stats[{"BUY": "buys", "SELL": "sells", "STOP": "stops"}[kind]] += 1
+            self._fill(signal, clock, stats)
+        self.latches.commit()
+
+    def _fill(self, signal, clock, stats):
+        key = (signal["user_id"], signal["symbol"])
+        position = self.positions.setdefault(key, [0, 0.0])
+        realized = 0.0
+        if signal["action"] == BUY:
+            qty = signal["qty"]
+            price = signal["price"] * (1 + self.slippage)
+            position[0] += qty
+            position[1] += qty * price
+            status = "FILLED"
+        else:
+            qty = min(signal["qty"], position[0])
+            price = signal["price"] * (1 - self.slippage)
+            if qty:
+                avg = position[1] / position[0]
+                realized = qty * (price - avg)
+                position[1] -= qty * avg
+                position[0] -= qty
+                stats["realized"] += realized
+                status = "FILLED" if qty == signal["qty"] else "PARTIAL"
+            else:
+                status = "NO_POSITION"
+        if qty:
+            stats["fills"] += 1
+        self.fills.append([self.label, self.day, clock, signal["user_id"], signal["symbol"], signal["action"],
+                           qty, round(price, 2), position[0], round(realized, 2), status])
+
+    def finish(self, last_ltp):
+        for (user_id, symbol), (qty, cost) in self.positions.items():
+            if qty and symbol in last_ltp:
+                self.stats[user_id]["unrealized"] += qty * last_ltp[symbol] - cost
+        return {"label": self.label, "signals": self.signals, "fills": self.fills,
+                "stats": {user_id: dict(s) for user_id, s in self.stats.items()}}
+
+
+def run_unit(day, segments, users, params, opts):
+    """One day for one chunk of users, every multiplier set in a single pass."""
+    sims = [_Simulation(label, apply_multipliers(users, mults), day, opts) for label, mults in params]
+    indicators = IndicatorBook(opts["bar_seconds"])
+    last_ltp = {}
+    records = 0
+    for ts_ms, batch in iter_batches(segments):
+        ts = ts_ms / 1000
+        changed, moved = {}, set()
+        for rec in batch:
+            symbol, price = rec["sym"], rec["ltp"]
+            if price <= 0:
+                continue
+            indicators.update(symbol, price, rec["vol"], ts)
+            if last_ltp.get(symbol) != price:
+                moved.add(symbol)
+            last_ltp[symbol] = changed[symbol] = price
+        records += len(batch)
+        for sim in sims:
+            sim.tick(changed, moved, ts, indicators)
+    return {"day": day, "records": records, "results": [sim.finish(last_ltp) for sim in sims]}
+
+
+# ==================== DRIVER ====================
+def segments_by_day(segments, start=None, end=None):
+    days = defaultdict(list)
+    for segment in segments:
+        day = segment.name[len("NEPSE_"):len("NEPSE_") + 10]
+        if (start and day < start) or (end and day > end):
+            continue
+        days[day].append(segment)
+    return dict(sorted(days.items()))
+
+
+def pack_segments(segments):
+    """Write TICKS.bin next to CSV-only segments so later runs skip CSV parsing."""
+    packed = 0
+    for segment in segments:
+        if (segment / BIN_NAME).exists():
+            continue
+        # Build in a side folder: the segment only gains TICKS.* once they are complete
+        staging = segment / ".pack"
+        shutil.rmtree(staging, ignore_errors=True)
+        writer = JournalWriter(staging)
+        for r in iter_segment(segment):
+            if r["kind"] == MOVE:
+                writer.append_move(r["ts_ms"], r["sym"], r["ltp"], r["ref"], r["vol"], r["pct"])
+            else:
+                writer.append_snapshot(r["ts_ms"], r["sym"], r["ltp"], r["open"], r["high"], r["low"],
+                                       r["close"], r["vol"], r["pct"])
+        writer.close()
+        for name in (SYM_NAME, IDX_NAME, BIN_NAME):  # TICKS.bin last: its presence marks the segment binary
+            os.replace(staging / name, segment / name)
+        staging.rmdir()
+        packed += 1
+        print(f"PACKED -> {segment / BIN_NAME}")
+    return packed
+
+
+def backtest(days, users, params, opts, workers, chunks, out_dir):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    user_ids = sorted(users)
+    user_chunks = [{u: users[u] for u in user_ids[i::chunks]} for i in range(chunks)]
+    user_chunks = [c for c in user_chunks if c]
+    totals = defaultdict(lambda: defaultdict(float))
+    user_days = defaultdict(set)
+    units = len(days) * len(user_chunks)
+    done = records = 0
+    started = time.time()
+
+    with open(out_dir / "signals.csv", "w", newline="", encoding="utf-8") as sf, \
+            open(out_dir / "fills.csv", "w", newline="", encoding="utf-8") as ff, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        signals_csv, fills_csv = csv.writer(sf), csv.writer(ff)
+        signals_csv.writerow(SIGNAL_FIELDS)
+        fills_csv.writerow(FILL_FIELDS)
+        futures = [pool.submit(run_unit, day, segments, chunk, params, opts)
+                   for day, segments in days.items() for chunk in user_chunks]
+        for future in as_completed(futures):
+            unit = future.result()
+            done += 1
+            records += unit["records"]
+            for result in unit["results"]:
+                signals_csv.writerows(result["signals"])
+                fills_csv.writerows(result["fills"])
+                for user_id, stats in result["stats"].items():
+                    for key, value in stats.items():
+                        totals[(result["label"], user_id)][key] += value
+                    user_days[(result["label"], user_id)].add(unit["day"])
+            print(f"[BACKTEST] {done}/{units} units | {unit['day']} | "
+                  f"{records / max(time.time() - started, 1e-9):,.0f} records/s")
+
+    by_params = defaultdict(float)
+    with open(out_dir / "summary.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_FIELDS)
+        for (label, user_id), stats in sorted(totals.items()):
+            pnl = stats["realized"] + stats["unrealized"]
+            by_params[label] += pnl
+            writer.writerow([label, user_id, len(user_days[(label, user_id)])] +
+                            [int(stats[k]) for k in ("signals", "buys", "sells", "stops", "fills")] +
+                            [round(stats["realized"], 2), round(stats["unrealized"], 2), round(pnl, 2)])
+    return by_params, records, time.time() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest user strategies over recorded market_logs")
+    parser.add_argument("paths", nargs="+", help="market_logs root or NEPSE_<hour> segment folders")
+    parser.add_argument("--strategies", default=str(DEFAULT_STRATEGIES), help="user_strategies.json to test")
+    parser.add_argument("--buy-mult", help="Comma list, e.g. 0.97,0.98 (default: configured levels)")
+    parser.add_argument("--sell-mult", help="Comma list of sell_trigger multipliers on target_sell_price")
+    parser.add_argument("--stop-mult", help="Comma list of stop_loss multipliers on purchase_price")
+    parser.add_argument("--from", dest="start", help="First day, YYYY-mm-dd")
+    parser.add_argument("--to", dest="end", help="Last day, YYYY-mm-dd")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--chunks", type=int, default=0, help="User chunks per day (default: enough to fill the pool)")
+    parser.add_argument("--slippage-bps", type=float, default=0.0)
+    parser.add_argument("--hysteresis", type=float, default=0.005, help="Latch band, as in the live engine")
+    parser.add_argument("--cooldown", type=float, default=120, help="Latch cooldown seconds, as in the live engine")
+    parser.add_argument("--bar-seconds", type=int, default=60, help="Indicator bar length for rule triggers")
+    parser.add_argument("--out", default="backtest_out")
+    parser.add_argument("--pack", action="store_true", help="Convert CSV-only segments to TICKS.bin, then run")
+    args = parser.parse_args()
+
+    segments = find_segments(args.paths)
+    if not segments:
+        parser.error("no NEPSE_<hour> segments found")
+    if args.pack:
+        pack_segments(segments)
+    days = segments_by_day(segments, args.start, args.end)
+    if not days:
+        parser.error("no segments in the requested date range")
+    with open(args.strategies, "r", encoding="utf-8") as f:
+        users = json.load(f).get("users", {})
+    if not users:
+        parser.error(f"no users in {args.strategies}")
+
+    params = param_sets(args)
+    chunks = args.chunks or max(1, min(len(users), -(-args.workers * 2 // len(days))))
+    opts = {"hysteresis": args.hysteresis, "cooldown": args.cooldown, "slippage_bps": args.slippage_bps,
+            "bar_seconds": args.bar_seconds}
+    print(f"BACKTEST -> {len(days)} day(s), {len(users)} users in {chunks} chunk(s), "
+          f"{len(params)} multiplier set(s), {args.workers} workers")
+    by_params, records, elapsed = backtest(days, users, params, opts, args.workers, chunks, Path(args.out))
+
+    print("=" * 80)
+    print(f"{records:,} records replayed in {elapsed:.1f}s -> {args.out}/summary.csv")
+    for label, pnl in sorted(by_params.items(), key=lambda kv: -kv[1]):
+        print(f"  {label:28} total P&L {pnl:14,.2f}")
+    print("=" * 80)
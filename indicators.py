@@ -0,0 +1,152 @@
+# indicators.py
+# Per-symbol streaming indicators for rule triggers, O(1) time and memory per tick.
+# Exports:
+#  - IndicatorBook(bar_seconds=60, ema_periods=(9, 21), atr_period=14, rsi_period=14)
+#      .update(symbol, ltp, volume, ts)   feed one scraped tick (volume = cumulative day volume)
+#      .values(symbol) -> {name: float | None}   None until an indicator has enough bars
+#      .warm_from(tick_store) -> ticks replayed from today's tick_store rings
+#  - indicator_names(ema_periods=(9, 21)) -> names a rule expression may use
+#
+# One state per symbol, shared by every strategy on it:
+#   vwap         sum(ltp * volume traded) / volume traded, tick by tick, reset each session
+#   ema<N>       EMA of bar closes (SMA seed over the first N bars)
+#   atr          Wilder ATR of bar true ranges (SMA seed over the first `atr_period` bars)
+#   rsi          Wilder RSI of bar close changes (same seeding)
+#   ltp, volume, bars, bar_high, bar_low
+# EMA/ATR/RSI move when a bar_seconds bar closes, i.e. on the first tick of the
+# next bar; gaps without ticks are not back-filled.
+
+from datetime import datetime
+
+
+def indicator_names(ema_periods=(9, 21)):
+    return ("ltp", "volume", "vwap", "atr", "rsi", "bars", "bar_high", "bar_low") + \
+        tuple(f"ema{p}" for p in ema_periods)
+
+
+class _SymbolState:
+    __slots__ = ("day", "last_volume", "pv", "v", "bucket", "high", "low", "close", "prev_close", "bars",
+                 "emas", "ema_sums", "tr_sum", "atr", "gain_sum", "loss_sum", "avg_gain", "avg_loss", "values")
+
+    def __init__(self, day, n_emas):
+        self.day = day
+        self.last_volume = None
+        self.pv = self.v = 0.0
+        self.bucket = None
+        self.high = self.low = self.close = None
+        self.prev_close = None
+        self.bars = 0
+        self.emas = [None] * n_emas
+        self.ema_sums = [0.0] * n_emas
+        self.tr_sum = 0.0
+        self.atr = None
+        self.gain_sum = self.loss_sum = 0.0
+        self.avg_gain = self.avg_loss = None
+        self.values = {}
+
+
+class IndicatorBook:
+    def __init__(self, bar_seconds=60, ema_periods=(9, 21), atr_period=14, rsi_period=14):
+        self.bar_seconds = bar_seconds
+        self.ema_periods = tuple(ema_periods)
+        self.ema_alphas = [2.0 / (p + 1) for p in self.ema_periods]
+        self.ema_names = [f"ema{p}" for p in self.ema_periods]
+        self.atr_period = atr_period
+        self.rsi_period = rsi_period
+        self.states = {}
+        self.names = indicator_names(self.ema_periods)
+
+    def _close_bar(self, st):
+        close = st.close
+        if st.prev_close is None:
+            tr = st.high - st.low
+        else:
+            tr = max(st.high - st.low, abs(st.high - st.prev_close), abs(st.low - st.prev_close))
+            change = close - st.prev_close
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            n = self.rsi_period
+            if st.avg_gain is None:
+                st.gain_sum += gain
+                st.loss_sum += loss
+                if st.bars >= n:  # `bars` changes seen so far = bars - 1 before this one
+                    st.avg_gain, st.avg_loss = st.gain_sum / n, st.loss_sum / n
+            else:
+                st.avg_gain = (st.avg_gain * (n - 1) + gain) / n
+                st.avg_loss = (st.avg_loss * (n - 1) + loss) / n
+        st.bars += 1
+        n = self.atr_period
+        if st.atr is None:
+            st.tr_sum += tr
+            if st.bars >= n:
+                st.atr = st.tr_sum / n
+        else:
+            st.atr = (st.atr * (n - 1) + tr) / n
+        for i, alpha in enumerate(self.ema_alphas):
+            ema = st.emas[i]
+            if ema is None:
+                st.ema_sums[i] += close
+                if st.bars >= self.ema_periods[i]:
+                    st.emas[i] = st.ema_sums[i] / self.ema_periods[i]
+            else:
+                st.emas[i] = ema + alpha * (close - ema)
+        st.prev_close = close
+
+    def update(self, symbol, ltp, volume, ts):
+        if ltp <= 0:
+            return
+        bucket = int(ts // self.bar_seconds)
+        st = self.states.get(symbol)
+        if st is None or (st.bucket != bucket and datetime.fromtimestamp(ts).date() != st.day):
+            st = self.states[symbol] = _SymbolState(datetime.fromtimestamp(ts).date(), len(self.ema_periods))
+
+        # VWAP from the volume traded since the previous tick
+        if st.last_volume is not None and volume > st.last_volume:
+            traded = volume - st.last_volume
+            st.pv += ltp * traded
+            st.v += traded
+        if st.last_volume is None or volume >= st.last_volume:
+            st.last_volume = volume
+
+        if bucket != st.bucket:
+            if st.bucket is not None:
+                self._close_bar(st)
+            st.bucket = bucket
+            st.high = st.low = ltp
+        else:
+            if ltp > st.high:
+                st.high = ltp
+            if ltp < st.low:
+                st.low = ltp
+        st.close = ltp
+
+        if st.avg_gain is None:
+            rsi = None
+        elif st.avg_loss == 0:
+            rsi = 100.0
+        else:
+            rsi = 100.0 - 100.0 / (1.0 + st.avg_gain / st.avg_loss)
+        values = st.values
+        values["ltp"] = ltp
+        values["volume"] = volume
+        values["vwap"] = st.pv / st.v if st.v else None
+        values["atr"] = st.atr
+        values["rsi"] = rsi
+        values["bars"] = st.bars
+        values["bar_high"] = st.high
+        values["bar_low"] = st.low
+        for name, ema in zip(self.ema_names, st.emas):
+            values[name] = ema
+
+    def values(self, symbol):
+        st = self.states.get(symbol)
+        return st.values if st is not None else {}
+
+    def warm_from(self, tick_store):
+        """Replay the session so far from a (read-only) tick_store, oldest first."""
+        symbols, _ = tick_store.snapshot()
+        replayed = 0
+        for symbol in symbols:
+            for ts, ltp, vol, _pct in tick_store.history(symbol):
+                self.update(symbol, float(ltp), float(vol), float(ts))
+                replayed += 1
+        return replayed
@@ -5,7 +5,7 @@ Run:  uvicorn backend.main_fastapi:app --host 0.0.0.0 --port 8002 --reload
 """
 from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 import json
@@ -16,6 +16,12 @@ import uuid
 import sqlite3
 from datetime import datetime
 
+from market_feed import PARENT_SHARED_DIR, ConsumerProgress, shared_dir
+from market_shm import open_market_reader
+from signal_rules import calculate_triggers, compile_rule
+from tick_store import open_tick_store
+from user_strategies_generator import stock_rules, write_strategy_updates
+
 # ------------------------------------------------------------------
 # App & Middleware
 # ------------------------------------------------------------------
@@ -38,7 +44,7 @@ app.add_middleware(
 # ------------------------------------------------------------------
 
 BASE_DIR = Path(__file__).resolve().parent
-SHARED_DIR = BASE_DIR.parent / "shared"
+SHARED_DIR = shared_dir(PARENT_SHARED_DIR)  # $SHARED_DIR overrides (replay load tests)
 EXECUTED_DIR = SHARED_DIR / "executed"
 STATUS_DIR = SHARED_DIR / "status"
 LOGS_DIR = SHARED_DIR / "logs"
@@ -51,6 +57,10 @@ for d in (SHARED_DIR, EXECUTED_DIR, STATUS_DIR, LOGS_DIR):
     d.mkdir(parents=True, exist_ok=True)
 
 DP_HOLDINGS_FILE = SHARED_DIR / "dp_holdings.json"
+TICK_STORE_FILE = SHARED_DIR / "tick_store.bin"
+tick_store = None  # Read-only attachment, opened on first history request
+market_feed = open_market_reader(SHARED_DIR)  # Shared memory, JSON delta feed as fallback
+feed_progress = ConsumerProgress(SHARED_DIR, "api")
 USERS_FILE = SHARED_DIR / "users.json"
 
 # ------------------------------------------------------------------
@@ -114,6 +124,11 @@ def init_db():
             UNIQUE(user_id, symbol)
         )
     """)
+    # Indicator rule triggers, added after the table first shipped
+    stock_columns = {row[1] for row in cursor.execute("PRAGMA table_info(user_stocks)")}
+    for column in ("buy_rule", "sell_rule", "stop_rule"):
+        if column not in stock_columns:
+            cursor.execute(f"ALTER TABLE user_stocks ADD COLUMN {column} TEXT")
     
     # Signal history table
     cursor.execute("""
@@ -214,12 +229,13 @@ def get_users():
         return {}
 
 @app.get("/api/market")
-def get_market_data():
-    """Serve live market data from shared JSON file."""
+def get_market_data(since: Optional[int] = Query(None, description="Only symbols changed after this seq")):
+    """Serve live market data from the scraper's versioned feed.
+    Pass the last seen `seq` as `since` to receive only changed symbols."""
     try:
-        if not MARKET_FILE.exists():
-            return {"timestamp": "", "stocks": {}}
-        return json.loads(MARKET_FILE.read_text(encoding="utf-8"))
+        if market_feed.poll() is not None:
+            feed_progress.report(market_feed.seq)
+        return market_feed.payload(since=since)
     except Exception as e:
         log.error(f"Failed to read market data: {e}")
         return {"error": str(e)}
@@ -425,6 +441,16 @@ class StockConfig(BaseModel):
     order_type: str = Field(default="LIMIT", example="LIMIT")
     partial_fill_enabled: bool = Field(default=True)
     min_fill_qty: Optional[int] = Field(None, example=5)
+    # Indicator rules (signal_rules.compile_rule), fire alongside the price levels
+    buy_rule: Optional[str] = Field(None, example="ltp < vwap - 1.5 * atr")
+    sell_rule: Optional[str] = Field(None, example="rsi > 70 and ltp > ema21")
+    stop_rule: Optional[str] = Field(None, example="ltp < purchase_price - 3 * atr")
+
+    @validator("buy_rule", "sell_rule", "stop_rule")
+    def check_rule(cls, value):
+        if value:
+            compile_rule(value)  # ValueError -> 422 with the reason
+        return value or None
 
 class Portfolio(BaseModel):
     total_budget:  float = Field(..., gt=0, example=1000000)
@@ -449,8 +475,9 @@ class TradingConfigResponse(BaseModel):
 # User Strategies Generator
 # ------------------------------------------------------------------
 
-def generate_user_strategies_json() -> bool:
-    """Generate shared/user_strategies.json from the SQLite DB."""
+def generate_user_strategies_json(changed_users=None) -> bool:
+    """Generate shared/user_strategies.json from the SQLite DB.
+    `changed_users` also get a per-user notice for the signal engine."""
     try:
         conn = get_db()
         cursor = conn.cursor()
@@ -504,7 +531,8 @@ def generate_user_strategies_json() -> bool:
                         "sell_trigger": stock_row["sell_trigger"],
                         "stop_loss": stock_row["stop_loss"],
                         "partial_fill_enabled": bool(stock_row["partial_fill_enabled"]),
-                        "min_fill_qty": stock_row["min_fill_qty"]
+                        "min_fill_qty": stock_row["min_fill_qty"],
+                        **stock_rules(stock_row)
                     },
                     "status": "ACTIVE"
                 }
@@ -532,6 +560,8 @@ def generate_user_strategies_json() -> bool:
         with STRATEGIES_TMP.open("w", encoding="utf-8") as f:
             json.dump(strategies, f, indent=2)
         STRATEGIES_TMP.replace(STRATEGIES_FILE)
+        if changed_users:
+            write_strategy_updates(strategies, changed_users)
 
         log.info(f"Generated user_strategies.json - {len(strategies['users'])} users")
         log_to_db("INFO", "SYSTEM", f"Generated user_strategies.json with {len(strategies['users'])} users")
@@ -542,16 +572,6 @@ def generate_user_strategies_json() -> bool:
         log_to_db("ERROR", "SYSTEM", f"Failed to generate user_strategies.json: {e}")
         return False
 
-def calculate_triggers(purchase_price: float, target_sell_price: float, risk_tolerance: float) -> Dict: 
-    buy_trigger = purchase_price * 0.98
-    sell_trigger = target_sell_price * 0.99
-    stop_loss = purchase_price * 0.90
-    return {
-        "buy_trigger": round(buy_trigger, 2),
-        "sell_trigger":  round(sell_trigger, 2),
-        "stop_loss": round(stop_loss, 2)
-    }
-
 # ------------------------------------------------------------------
 # Auth Endpoints
 # ------------------------------------------------------------------
@@ -967,9 +987,9 @@ async def save_trading_config(config: TradingConfigRequest):
                     user_id, symbol, category, purchase_price, target_sell_price,
                     current_price, purchase_qty, selling_qty, weight, order_type,
                     partial_fill_enabled, min_fill_qty, buy_trigger, sell_trigger,
-                    stop_loss, is_active, updated_at
+                    stop_loss, buy_rule, sell_rule, stop_rule, is_active, updated_at
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
                 ON CONFLICT(user_id, symbol) DO UPDATE SET
                     category = excluded.category,
                     purchase_price = excluded.purchase_price,
@@ -984,6 +1004,9 @@ async def save_trading_config(config: TradingConfigRequest):
                     buy_trigger = excluded.buy_trigger,
                     sell_trigger = excluded.sell_trigger,
                     stop_loss = excluded.stop_loss,
+                    buy_rule = excluded.buy_rule,
+                    sell_rule = excluded.sell_rule,
+                    stop_rule = excluded.stop_rule,
                     is_active = 1,
                     updated_at = excluded.updated_at
             """, (
@@ -992,6 +1015,7 @@ async def save_trading_config(config: TradingConfigRequest):
                 stock.selling_qty, stock.weight, stock.order_type,
                 int(stock.partial_fill_enabled), min_fill,
                 triggers["buy_trigger"], triggers["sell_trigger"], triggers["stop_loss"],
+                stock.buy_rule, stock.sell_rule, stock.stop_rule,
                 datetime.now()
             ))
 
@@ -999,7 +1023,7 @@ async def save_trading_config(config: TradingConfigRequest):
         conn.close()
 
         # Regenerate strategies JSON
-        generated = generate_user_strategies_json()
+        generated = generate_user_strategies_json(changed_users=[config.user_id])
         
         # Log the config save
         log_to_db("INFO", "CONFIG", f"Trading config saved for user {config.user_id} with {len(config.stocks)} stocks", user_id=config.user_id)
@@ -1125,7 +1149,28 @@ def health():
 
 @app.get("/api/market")
 def api_market():
-    return load_json(MARKET_FILE) or {} if MARKET_FILE.exists() else {}
+    market_feed.poll()
+    return market_feed.payload()
+
+@app.get("/api/market/history/{symbol}")
+def api_market_history(symbol: str, since: Optional[float] = Query(None, description="Epoch seconds")):
+    """Intraday ticks for one symbol from the scraper's tick store."""
+    global tick_store
+    if not TICK_STORE_FILE.exists():
+        return {"symbol": symbol.upper(), "ticks": []}
+    try:
+        if tick_store is not None and tick_store.replaced():
+            tick_store.close()  # New session day: the scraper started a fresh file
+            tick_store = None
+        if tick_store is None:
+            tick_store = open_tick_store(TICK_STORE_FILE)
+        rows = tick_store.history(symbol.upper(), since=since)
+        ticks = [{"ts": r[0], "ltp": r[1], "volume": int(r[2]), "pct_change": r[3]} for r in rows]
+        return {"symbol": symbol.upper(), "ticks": ticks}
+    except Exception as e:
+        log.warning("Tick history read failed: %s", e)
+        tick_store = None  # Scraper may have recreated the file; reattach next call
+        return {"symbol": symbol.upper(), "ticks": [], "error": str(e)}
 
 @app.get("/api/signals")
 def api_signals():
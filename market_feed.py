@@ -0,0 +1,386 @@
+# market_feed.py
+# Versioned, change-only publication of shared/market_data.json.
+# Exports:
+#  - MarketPublisher(shared_dir, snapshot_every=10, keep_deltas=200)
+#      .publish(timestamp, stocks, changed) -> seq | None (None = nothing changed, nothing written)
+#  - MarketFeedReader(shared_dir)
+#      .poll() -> set of symbols changed since the previous poll, or None when there is no new seq
+#      .stocks / .seq / .timestamp, .payload(since=None)
+#  - atomic_write_json(path, obj, fsync=False, retries=6) -> bool
+#  - write_moves_json(shared_dir, moves) -> bool      shared/market_moves.json for the UI
+#  - ConsumerProgress(shared_dir, name).report(seq)   consumers record the last seq they handled
+#  - read_consumer_progress(shared_dir) -> {name: progress dict}
+#  - shared_dir(default) -> Path                    $SHARED_DIR if set, else `default`
+#  - PARENT_SHARED_DIR, REPO_SHARED_DIR, live_shared_dirs()   where the live processes look by default
+#  - FeedWaiter(shared_dir, wake_prefixes=())        wakes on every head pointer write, and on
+#                                                     writes of files named with `wake_prefixes`
+#  - wait_for_update(reader, waiter, timeout) -> changed set | None
+#      blocks until `reader` (JSON feed or market_shm reader) has a new seq, or a
+#      `wake_prefixes` file was written (None then, as after a timeout)
+#
+# Files in shared/:
+#   market_seq.json                 head pointer {"seq", "snapshot_seq", "oldest_delta", "timestamp"}
+#   market_deltas/delta_<seq>.json  {"seq", "timestamp", "stocks": {changed symbols only}}
+#   market_data.json                full snapshot {"seq", "timestamp", "total", "stocks"},
+#                                   rewritten every `snapshot_every` sequences for late joiners
+# Consumers read the tiny head pointer, then apply only the deltas after the
+# seq they last saw; they fall back to the snapshot when those were pruned.
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Optional: FeedWaiter falls back to a short seq-check interval
+    FileSystemEventHandler = object
+    Observer = None
+
+# The live shared/ directories: the engine and API use the one next to the repo,
+# the executors (order_utils) the one inside it. SHARED_DIR points every process
+# somewhere else, e.g. at a market_replay.py directory for a load test.
+SHARED_DIR_ENV = "SHARED_DIR"
+PARENT_SHARED_DIR = Path(__file__).resolve().parent.parent / "shared"
+REPO_SHARED_DIR = Path(__file__).resolve().parent / "shared"
+
+
+def shared_dir(default):
+    """The shared directory a process uses: $SHARED_DIR if set, else `default`."""
+    override = os.environ.get(SHARED_DIR_ENV, "").strip()
+    return Path(override).resolve() if override else Path(default)
+
+
+def live_shared_dirs():
+    """Resolved defaults of every live process, whatever $SHARED_DIR says."""
+    return {PARENT_SHARED_DIR.resolve(), REPO_SHARED_DIR.resolve()}
+
+HEAD_NAME = "market_seq.json"
+SNAPSHOT_NAME = "market_data.json"
+DELTA_DIR_NAME = "market_deltas"
+MOVES_NAME = "market_moves.json"
+CONSUMERS_DIR_NAME = "consumers"
+
+
+def atomic_write_json(path: Path, obj, fsync=False, retries=6) -> bool:
+    """Write to a private temp file, then os.replace. Retries while a reader holds
+    the target open (PermissionError on Windows) with exponential backoff."""
+    tmp = path.with_name(path.name + ".tmp")
+    for attempt in range(retries):
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(obj, f, indent=None)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, path)
+            return True
+        except PermissionError:
+            time.sleep(0.15 * (2 ** attempt))
+        except Exception as e:
+            print(f"Write error {path.name} (attempt {attempt + 1}): {e}")
+            time.sleep(0.1)
+    return False
+
+
+def write_moves_json(shared_dir, moves) -> bool:
+    """Write recent price movements to JSON for UI consumption"""
+    payload = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "moves": list(moves),  # Convert deque to list
+        "count": len(moves)
+    }
+    return atomic_write_json(Path(shared_dir) / MOVES_NAME, payload, fsync=True, retries=3)
+
+
+def _read_json(path: Path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _delta_path(delta_dir: Path, seq: int) -> Path:
+    return delta_dir / f"delta_{seq:012d}.json"
+
+
+class MarketPublisher:
+    def __init__(self, shared_dir, snapshot_every=10, keep_deltas=200):
+        self.shared_dir = Path(shared_dir)
+        self.delta_dir = self.shared_dir / DELTA_DIR_NAME
+        self.delta_dir.mkdir(parents=True, exist_ok=True)
+        self.head_path = self.shared_dir / HEAD_NAME
+        self.snapshot_path = self.shared_dir / SNAPSHOT_NAME
+        self.snapshot_every = snapshot_every
+        self.keep_deltas = keep_deltas
+
+        # Continue the sequence across scraper restarts so consumers never see it go backwards
+        head = _read_json(self.head_path) or {}
+        snap = _read_json(self.snapshot_path) or {}
+        self.seq = max(int(head.get("seq", 0) or 0), int(snap.get("seq", 0) or 0))
+        self.snapshot_seq = 0  # Force a full snapshot on the first publish
+        existing = sorted(int(p.stem.split("_")[1]) for p in self.delta_dir.glob("delta_*.json"))
+        self.oldest_delta = existing[0] if existing else self.seq + 1
+        self.skipped = 0
+
+    def publish(self, timestamp, stocks, changed):
+        """`stocks` is the full current view, `changed` maps symbol -> new entry."""
+        if not changed and self.snapshot_seq:
+            self.skipped += 1
+            return None
+
+        self.seq += 1
+        seq = self.seq
+        atomic_write_json(_delta_path(self.delta_dir, seq),
+                          {"seq": seq, "timestamp": timestamp, "stocks": changed})
+
+        if not self.snapshot_seq or seq - self.snapshot_seq >= self.snapshot_every:
+            if atomic_write_json(self.snapshot_path,
+                                 {"seq": seq, "timestamp": timestamp, "total": len(stocks), "stocks": stocks},
+                                 fsync=True):
+                self.snapshot_seq = seq
+
+        # Deltas older than the snapshot are still kept so readers a few seqs behind
+        # can catch up without re-reading the whole snapshot
+        while self.oldest_delta <= seq - self.keep_deltas:
+            try:
+                _delta_path(self.delta_dir, self.oldest_delta).unlink()
+            except FileNotFoundError:
+                pass
+            self.oldest_delta += 1
+
+        # Head pointer goes last: once a reader sees `seq` here, its delta is on disk
+        atomic_write_json(self.head_path, {"seq": seq, "snapshot_seq": self.snapshot_seq,
+                                           "oldest_delta": self.oldest_delta, "timestamp": timestamp})
+        return seq
+
+    def stats(self):
+        return {"seq": self.seq, "snapshot_seq": self.snapshot_seq, "oldest_delta": self.oldest_delta,
+                "skipped_unchanged": self.skipped}
+
+
+class MarketFeedReader:
+    """Materializes the publisher's snapshot + deltas into `stocks`. Thread-safe."""
+
+    def __init__(self, shared_dir):
+        self.shared_dir = Path(shared_dir)
+        self.delta_dir = self.shared_dir / DELTA_DIR_NAME
+        self.head_path = self.shared_dir / HEAD_NAME
+        self.snapshot_path = self.shared_dir / SNAPSHOT_NAME
+        self.seq = 0
+        self.timestamp = ""
+        self.stocks = {}
+        self.changed_at = {}  # symbol -> seq of its last change, for payload(since=...)
+        self.snapshot_stat = None  # (inode, mtime, size) of the last snapshot loaded without a head
+        self.lock = threading.Lock()
+
+    def _load_snapshot(self):
+        snap = _read_json(self.snapshot_path)
+        if not isinstance(snap, dict):
+            return None
+        stocks = snap.get("stocks", {}) or {}
+        seq = int(snap.get("seq", 0) or 0)
+        self.stocks = dict(stocks)
+        self.changed_at = dict.fromkeys(stocks, seq)
+        self.seq = seq
+        self.timestamp = snap.get("timestamp", "")
+        return set(stocks)
+
+    def poll(self):
+        with self.lock:
+            head = _read_json(self.head_path)
+            if head is None:
+                return self._poll_legacy()
+            head_seq = int(head.get("seq", 0) or 0)
+            if head_seq == self.seq:
+                return None
+
+            changed = set()
+            if head_seq < self.seq or self.seq + 1 < int(head.get("oldest_delta", 0) or 0):
+                # Publisher restarted from scratch, or we fell behind the retained deltas
+                changed = self._load_snapshot() or set()
+            reloaded = False
+            seq = self.seq + 1
+            while seq <= head_seq:
+                delta = _read_json(_delta_path(self.delta_dir, seq))
+                if delta is None:
+                    if reloaded:
+                        break  # Try again on the next poll
+                    changed |= self._load_snapshot() or set()
+                    reloaded = True
+                    seq = self.seq + 1
+                    continue
+                stocks = delta.get("stocks", {}) or {}
+                self.stocks.update(stocks)
+                self.changed_at.update(dict.fromkeys(stocks, seq))
+                changed.update(stocks)
+                self.seq = seq
+                self.timestamp = delta.get("timestamp", self.timestamp)
+                seq += 1
+            return changed
+
+    def _poll_legacy(self):
+        """Writer without sequence numbers: reload only a rewritten snapshot, report only changed quotes"""
+        try:
+            st = os.stat(self.snapshot_path)
+        except OSError:
+            return None
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key == self.snapshot_stat:
+            return None
+        previous = self.stocks
+        changed = self._load_snapshot()
+        if changed is None:
+            return None  # Half-written or unreadable: retried on the next poll
+        self.snapshot_stat = key
+        changed = {s for s in changed if previous.get(s) != self.stocks[s]}
+        return changed or None
+
+    def payload(self, since=None):
+        """Same shape as market_data.json; with `since`, only symbols changed after that seq."""
+        with self.lock:
+            if since is None:
+                stocks = dict(self.stocks)
+            else:
+                stocks = {s: self.stocks[s] for s, seq in self.changed_at.items() if seq > since}
+            return {"seq": self.seq, "timestamp": self.timestamp, "total": len(self.stocks), "stocks": stocks}
+
+
+class ConsumerProgress:
+    """Lets a feed consumer publish how far it got, throttled to one small write per interval.
+    The replay driver reads these to report the throughput each consumer sustained."""
+
+    def __init__(self, shared_dir, name, interval=1.0):
+        self.path = Path(shared_dir) / CONSUMERS_DIR_NAME / f"{name}.json"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        self.interval = interval
+        self.processed = 0
+        self.seq = 0
+        self.last_write = 0.0
+
+    def report(self, seq, processed=1):
+        self.seq = seq
+        self.processed += processed
+        now = time.time()
+        if now - self.last_write >= self.interval:
+            self.last_write = now
+            atomic_write_json(self.path, {"name": self.name, "seq": seq, "processed": self.processed,
+                                          "pid": os.getpid(), "ts": now}, retries=1)
+
+
+def read_consumer_progress(shared_dir):
+    progress = {}
+    for path in (Path(shared_dir) / CONSUMERS_DIR_NAME).glob("*.json"):
+        data = _read_json(path)
+        if isinstance(data, dict):
+            progress[path.stem] = data
+    return progress
+
+
+class _HeadWritten(FileSystemEventHandler):
+    def __init__(self, event, nudge, wake_prefixes):
+        self.event = event
+        self.nudge = nudge
+        self.wake_prefixes = tuple(wake_prefixes)
+
+    def on_any_event(self, fs_event):
+        # The head is replaced via a temp file, so it shows up as a move on most platforms
+        name = os.path.basename(getattr(fs_event, "dest_path", "") or fs_event.src_path)
+        if name == HEAD_NAME:
+            self.event.set()
+        elif self.wake_prefixes and name.startswith(self.wake_prefixes) and not name.endswith(".tmp"):
+            self.nudge.set()
+            self.event.set()
+
+
+class FeedWaiter:
+    """Blocks until the publisher writes a new head pointer.
+
+    With watchdog installed this is a filesystem notification on shared/, so a
+    consumer wakes within milliseconds of a publish and sleeps otherwise.
+    Without it, wait() returns every `poll_interval` and the caller's seq check
+    does the work. Files in shared/ whose names start with one of
+    `wake_prefixes` wake it too (see take_nudge)."""
+
+    def __init__(self, shared_dir, poll_interval=0.02, wake_prefixes=()):
+        self.shared_dir = Path(shared_dir)
+        self.head_path = self.shared_dir / HEAD_NAME
+        self.poll_interval = poll_interval
+        self.event = threading.Event()
+        self.nudge = threading.Event()
+        self.observer = None
+        if Observer is not None:
+            try:
+                self.shared_dir.mkdir(parents=True, exist_ok=True)
+                observer = Observer()
+                observer.schedule(_HeadWritten(self.event, self.nudge, wake_prefixes), str(self.shared_dir),
+                                  recursive=False)
+                observer.daemon = True
+                observer.start()
+                self.observer = observer
+            except Exception as e:
+                print(f"Feed notifications unavailable ({e}), checking every {poll_interval * 1000:.0f}ms")
+
+    @property
+    def mode(self):
+        return "notify" if self.observer else "poll"
+
+    def wait(self, timeout):
+        """True when woken by a publish (always True in poll mode, after poll_interval)."""
+        if self.observer is None:
+            time.sleep(max(0.0, min(timeout, self.poll_interval)))
+            return True
+        fired = self.event.wait(timeout)
+        self.event.clear()
+        return fired
+
+    def take_nudge(self):
+        """True (once) if a `wake_prefixes` file was written since the last call."""
+        nudged = self.nudge.is_set()
+        self.nudge.clear()
+        return nudged
+
+    def head_seq(self):
+        head = _read_json(self.head_path) or {}
+        return int(head.get("seq", 0) or 0)
+
+    def close(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join(timeout=2)
+            self.observer = None
+
+
+CATCH_UP_SECONDS = 0.05
+
+
+def wait_for_update(reader, waiter, timeout):
+    """Return the symbols changed by the next publication, or None after `timeout`.
+
+    A notification can arrive a moment before the shared-memory segment is
+    written (the scraper writes the head pointer first), so when the head is
+    ahead of the reader it re-polls briefly instead of going back to sleep.
+    A nudge (a `wake_prefixes` file) returns right away so the caller can look."""
+    deadline = time.time() + timeout
+    while True:
+        changed = reader.poll()
+        if changed is not None:
+            return changed
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        woken = waiter.wait(remaining)
+        if waiter.take_nudge():
+            return reader.poll()
+        if woken and waiter.mode == "notify":
+            catch_up = time.time() + CATCH_UP_SECONDS
+            while waiter.head_seq() > reader.seq and time.time() < catch_up:
+                changed = reader.poll()
+                if changed is not None:
+                    return changed
+                time.sleep(0.001)
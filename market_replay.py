@@ -0,0 +1,267 @@
+# market_replay.py - REPLAY RECORDED SESSIONS INTO THE LIVE PIPELINE
+# Streams market_logs/NEPSE_<hour>/ segments (binary TICKS.bin or legacy
+# FULL_SNAPSHOT.csv + MOVES.csv) into exactly what 2_scraper.py publishes:
+# the versioned market_data.json feed, market_moves.json and the shared-memory
+# segment. The signal engine, executors and API can then be load-tested against
+# real trading days without a browser or broker session.
+#
+# Usage:
+#   python market_replay.py market_logs                      (every recorded hour, 1x, into shared_replay/)
+#   python market_replay.py market_logs/NEPSE_2025-12-01_11 market_logs/NEPSE_2025-12-01_12 --speed 20
+#   python market_replay.py market_logs --speed max --shared-dir /tmp/replay_shared
+#   python market_replay.py market_logs --live               (into the live shared/: executors send REAL orders)
+#
+# Point the consumers at the replay directory to load-test them: start the
+# engine, API and executors with SHARED_DIR=<replay dir> (market_feed.shared_dir).
+# (copy user_strategies.json in first: the engine reads its strategies there too).
+# Publishing into a live shared/ (any directory the pipeline reads when
+# SHARED_DIR is not set) needs --live, because executors there turn replayed
+# signals into real broker orders at historical prices. Recorded gaps longer than --max-gap
+# seconds (overnight, lunch, between sessions) are cut down to --max-gap.
+#
+# On exit it prints the pacing accuracy and, for every consumer that reports
+# progress (<shared-dir>/consumers/*.json), the seqs/s it sustained and how far behind it ended.
+
+import argparse
+import collections
+import csv
+import heapq
+import time
+from datetime import datetime
+from pathlib import Path
+
+from market_feed import PARENT_SHARED_DIR, MarketPublisher, live_shared_dirs, read_consumer_progress, write_moves_json
+from market_shm import MarketShmWriter, SHM_NAME
+from tick_journal import JournalReader, MOVE, SNAPSHOT, BIN_NAME
+
+STATUS_INTERVAL = 5.0
+SPIN_THRESHOLD = 0.002   # Sleep until this close to the deadline, then spin for precision
+MAX_GAP_SECONDS = 60.0   # Recorded gaps longer than this are replayed as this long
+REPLAY_SHARED_DIR = "shared_replay"
+LIVE_SHARED_DIR = PARENT_SHARED_DIR   # What the engine and API read without SHARED_DIR
+
+
+# ==================== SOURCES ====================
+def _csv_time_ms(text):
+    return int(datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
+
+def _num(text):
+    try:
+        return float(str(text).replace(",", "").replace("+", ""))
+    except ValueError:
+        return 0.0
+
+def _iter_csv(path, kind):
+    if not path.exists():
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                ts_ms = _csv_time_ms(row["Time"])
+            except (KeyError, ValueError):
+                continue
+            if kind == SNAPSHOT:
+                yield {"ts_ms": ts_ms, "sym": row["Symbol"], "kind": SNAPSHOT, "ltp": _num(row["LTP"]),
+                       "open": _num(row["Open"]), "high": _num(row["High"]), "low": _num(row["Low"]),
+                       "close": _num(row["Close"]), "ref": 0.0, "pct": _num(row["%Chg"]), "vol": int(_num(row["Vol"]))}
+            else:
+                yield {"ts_ms": ts_ms, "sym": row["Symbol"], "kind": MOVE, "ltp": _num(row["LTP"]),
+                       "open": 0.0, "high": 0.0, "low": 0.0, "close": 0.0, "ref": _num(row["From"]),
+                       "pct": _num(row["%Chg"]), "vol": int(_num(row["Vol"]))}
+
+def iter_segment(segment):
+    """Records of one hourly segment in time order, whichever format it was logged in."""
+    if (segment / BIN_NAME).exists():
+        reader = JournalReader(segment)
+        try:
+            yield from reader.read()
+        finally:
+            reader.close()
+    else:
+        yield from heapq.merge(_iter_csv(segment / "FULL_SNAPSHOT.csv", SNAPSHOT),
+                               _iter_csv(segment / "MOVES.csv", MOVE),
+                               key=lambda r: r["ts_ms"])
+
+def find_segments(paths):
+    segments = []
+    for p in map(Path, paths):
+        if p.name.startswith("NEPSE_"):
+            segments.append(p)
+        else:
+            segments.extend(sorted(d for d in p.glob("NEPSE_*") if d.is_dir()))
+    return sorted(set(segments))
+
+def iter_batches(segments):
+    """Group records sharing a timestamp into one tick, like one scraper loop."""
+    batch, batch_ts = [], None
+    for segment in segments:
+        for rec in iter_segment(segment):
+            if batch and rec["ts_ms"] != batch_ts:
+                yield batch_ts, batch
+                batch = []
+            batch_ts = rec["ts_ms"]
+            batch.append(rec)
+    if batch:
+        yield batch_ts, batch
+
+
+# ==================== PACING ====================
+class Pacer:
+    """Maps recorded time onto wall time at `speed` (0 = as fast as possible).
+    Gaps longer than `max_gap` recorded seconds count as `max_gap` (0 = keep them)."""
+
+    def __init__(self, speed, max_gap=MAX_GAP_SECONDS):
+        self.speed = speed
+        self.max_gap_ms = max_gap * 1000
+        self.origin = None
+        self.start = None
+        self.last_ts = None
+        self.skipped_ms = 0      # Recorded time cut out of long gaps
+        self.gaps = 0
+        self.late_total = 0.0
+        self.late_max = 0.0
+        self.waits = 0
+
+    def wait(self, ts_ms):
+        if self.origin is None:
+            self.origin, self.start, self.last_ts = ts_ms, time.perf_counter(), ts_ms
+            return
+        gap = ts_ms - self.last_ts
+        if self.max_gap_ms and gap > self.max_gap_ms:
+            self.skipped_ms += gap - self.max_gap_ms
+            self.gaps += 1
+        self.last_ts = max(self.last_ts, ts_ms)
+        if self.speed <= 0:
+            return
+        target = self.start + (ts_ms - self.origin - self.skipped_ms) / 1000 / self.speed
+        delay = target - time.perf_counter()
+        if delay > SPIN_THRESHOLD:
+            time.sleep(delay - SPIN_THRESHOLD)
+        while time.perf_counter() < target:
+            pass
+        late = time.perf_counter() - target
+        self.waits += 1
+        self.late_total += late
+        self.late_max = max(self.late_max, late)
+
+
+# ==================== REPLAY ====================
+def replay(segments, speed, shared_dir, use_shm=True, snapshot_every=10, keep_deltas=200,
+           max_gap=MAX_GAP_SECONDS):
+    shared_dir = Path(shared_dir)
+    shared_dir.mkdir(parents=True, exist_ok=True)
+    publisher = MarketPublisher(shared_dir, snapshot_every, keep_deltas)
+    shm_writer = MarketShmWriter(shared_dir / SHM_NAME) if use_shm else None
+    pacer = Pacer(speed, max_gap)
+
+    stocks = {}
+    recent_moves = collections.deque(maxlen=100)
+    consumers_before = read_consumer_progress(shared_dir)
+    seq_before = publisher.seq
+    records = batches = publications = 0
+    started = last_status = time.time()
+
+    try:
+        for ts_ms, batch in iter_batches(segments):
+            pacer.wait(ts_ms)
+            now_full = datetime.fromtimestamp(ts_ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
+            now_short = now_full[-8:]
+            changed = {}
+            moved = False
+            for r in batch:
+                sym = r["sym"]
+                prev = stocks.get(sym, {})
+                close = r["close"] or prev.get("close") or r["ref"]
+                entry = {"ltp": round(r["ltp"], 2), "close": round(close, 2), "volume": int(r["vol"]),
+                         "pct_change": r["pct"], "time": now_short}
+                if r["kind"] == MOVE:
+                    change = r["ltp"] - r["ref"]
+                    recent_moves.append({
+                        "timestamp": now_full, "time": now_short, "symbol": sym,
+                        "direction": "UP" if change > 0 else "DOWN",
+                        "from_price": round(r["ref"], 2), "to_price": round(r["ltp"], 2),
+                        "change": round(change, 2), "volume": int(r["vol"]), "pct_change": round(r["pct"], 2),
+                    })
+                    moved = True
+                if (prev.get("ltp"), prev.get("close"), prev.get("volume"), prev.get("pct_change")) != \
+                        (entry["ltp"], entry["close"], entry["volume"], entry["pct_change"]):
+                    changed[sym] = entry
+                stocks[sym] = entry
+
+            seq = publisher.publish(now_full, dict(stocks) if changed else {}, changed)
+            if seq is not None:
+                publications += 1
+                if shm_writer:
+                    shm_writer.write(changed, seq)
+            if moved:
+                write_moves_json(shared_dir, recent_moves)
+            records += len(batch)
+            batches += 1
+
+            if time.time() - last_status >= STATUS_INTERVAL:
+                last_status = time.time()
+                elapsed = last_status - started
+                print(f"[REPLAY] {now_full} | {batches} ticks ({batches / elapsed:,.0f}/s) | "
+                      f"seq {publisher.seq} | late avg {pacer.late_total / max(1, pacer.waits) * 1000:.2f}ms")
+    except KeyboardInterrupt:
+        print("\n[REPLAY] Interrupted")
+    finally:
+        if shm_writer:
+            shm_writer.close()
+
+    elapsed = max(time.time() - started, 1e-9)
+    print("=" * 80)
+    print(f"REPLAYED {records:,} records in {batches:,} ticks -> {publications:,} publications in {elapsed:.1f}s")
+    print(f"Producer rate: {batches / elapsed:,.1f} ticks/s, {publications / elapsed:,.1f} seqs/s")
+    if pacer.waits:
+        print(f"Pacing: avg late {pacer.late_total / pacer.waits * 1000:.3f}ms, max late {pacer.late_max * 1000:.3f}ms")
+    if pacer.gaps:
+        print(f"Gaps: {pacer.gaps} longer than {max_gap:g}s, {pacer.skipped_ms / 1000:,.0f}s of recorded time skipped")
+    report_consumers(shared_dir, consumers_before, seq_before, publisher.seq, elapsed)
+    print("=" * 80)
+
+
+def live_target(shared_dir):
+    """True if `shared_dir` is one the live engine, API, executors or scraper read by default."""
+    return Path(shared_dir).resolve() in live_shared_dirs() | {Path("shared").resolve()}
+
+
+def report_consumers(shared_dir, before, seq_before, seq_after, elapsed):
+    published = seq_after - seq_before
+    after = read_consumer_progress(shared_dir)
+    if not after:
+        print(f"No consumer progress found in {Path(shared_dir) / 'consumers'} (is the signal engine running?)")
+        return
+    for name, prog in sorted(after.items()):
+        base = before.get(name, {})
+        handled = prog.get("processed", 0) - (base.get("processed", 0) if base.get("pid") == prog.get("pid") else 0)
+        seen = min(published, max(0, prog.get("seq", 0) - seq_before))
+        print(f"  {name:20} | {handled / elapsed:8.1f} updates/s | saw {seen}/{published} seqs "
+              f"| lag at end: {max(0, seq_after - prog.get('seq', 0))} seqs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded market_logs into the live outputs")
+    parser.add_argument("paths", nargs="+", help="market_logs root or NEPSE_<hour> segment folders")
+    parser.add_argument("--speed", default="1", help="1 = real time, N = N times faster, max = no pacing")
+    parser.add_argument("--shared-dir", default=None, help=f"Where to publish (default: {REPLAY_SHARED_DIR}/)")
+    parser.add_argument("--live", action="store_true",
+                        help="Publish into the live shared/ (running executors will send REAL orders)")
+    parser.add_argument("--max-gap", type=float, default=MAX_GAP_SECONDS,
+                        help="Replay recorded gaps longer than this many seconds as this long (0 = keep)")
+    parser.add_argument("--no-shm", action="store_true", help="Skip the shared-memory segment")
+    args = parser.parse_args()
+
+    target = Path(args.shared_dir or (LIVE_SHARED_DIR if args.live else REPLAY_SHARED_DIR))
+    if not args.live and live_target(target):
+        parser.error(f"{target} is a live shared directory: pass --live to publish there")
+    segments = find_segments(args.paths)
+    if not segments:
+        parser.error("no NEPSE_<hour> segments found")
+    speed = 0.0 if args.speed.lower() == "max" else float(args.speed)
+    if args.live:
+        print("⚠️  --live: publishing into the live shared/ directory, executors will send real orders")
+    print(f"REPLAY -> {len(segments)} segment(s) at {'max' if speed <= 0 else f'{speed:g}x'} into {target}/")
+    if not live_target(target):
+        print(f"Start the consumers with SHARED_DIR={target.resolve()} to load-test them")
+    replay(segments, speed, target, use_shm=not args.no_shm, max_gap=args.max_gap)
@@ -0,0 +1,303 @@
+# market_shm.py
+# Memory-mapped market snapshot guarded by a seqlock, for consumers on the same host.
+# Exports:
+#  - MarketShmWriter(path, max_symbols=512)   .write(changed, feed_seq), .close()
+#  - MarketShmReader(path, fallback=None)     same interface as market_feed.MarketFeedReader:
+#        .poll() -> changed symbols | None, .stocks, .seq, .timestamp, .payload(since=None)
+#        .heartbeat() (writer)  marks the segment alive while nothing changes
+#  - open_market_reader(shared_dir) -> MarketShmReader that falls back to the JSON feed
+#
+# Layout (little endian):
+#   header   64 bytes: magic, max_symbols, n_symbols, lock counter (u64), feed seq (u64), timestamp (f64),
+#                      generation (u64), heartbeat (f64)
+#   symbols  max_symbols * 16 bytes, NUL padded ASCII
+#   records  max_symbols * (ltp, close, volume, pct_change, updated_ts) float64
+# The writer bumps the lock counter to odd before touching anything and back to
+# even afterwards. Readers copy the region and retry if the counter was odd or
+# moved, so they never observe a half-written record and never block the writer.
+# A counter that stays odd for SEQLOCK_RETRY_SECONDS means the writer died
+# mid-update: the reader detaches and serves the JSON feed instead of spinning.
+# Every writer start bumps the generation: symbol ids are handed out again from
+# zero, so readers drop their id -> symbol table when it changes. A segment whose
+# heartbeat is older than SHM_STALE_SECONDS (writer dead, or shared memory
+# disabled in the scraper) is detached and the reader serves the JSON feed until
+# the segment is alive again.
+
+import mmap
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from market_feed import MarketFeedReader
+
+MAGIC = b"NEPSHM02"
+HEADER = struct.Struct("<8sIIQQdQd")
+HEADER_SIZE = 64
+COUNTER_OFFSET = 16
+GENERATION_OFFSET = 40
+HEARTBEAT_OFFSET = 48
+SYMBOL_WIDTH = 16
+RECORD = struct.Struct("<ddddd")
+SHM_NAME = "market_shm.bin"
+INODE_CHECK_INTERVAL = 5.0
+SHM_STALE_SECONDS = 30.0     # No write or heartbeat for this long: readers use the JSON feed
+SEQLOCK_RETRY_SECONDS = 0.2  # A write takes well under a millisecond; longer means a dead writer
+
+
+def _region_sizes(max_symbols):
+    sym_off = HEADER_SIZE
+    rec_off = sym_off + max_symbols * SYMBOL_WIDTH
+    return sym_off, rec_off, rec_off + max_symbols * RECORD.size
+
+
+class MarketShmWriter:
+    def __init__(self, path, max_symbols=512):
+        self.path = Path(path)
+        self.max_symbols = max_symbols
+        self.sym_off, self.rec_off, size = _region_sizes(max_symbols)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Reuse the file in place when possible so attached readers keep a valid mapping.
+        # A different layout goes to a fresh inode: truncating a mapped file would
+        # crash readers, while a replaced one is noticed by their inode check. On Windows
+        # the replace raises PermissionError while a reader has the old file mapped.
+        reuse = self.path.exists() and self.path.stat().st_size == size
+        if reuse:
+            with open(self.path, "rb") as f:
+                reuse = f.read(len(MAGIC)) == MAGIC
+        if not reuse:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.truncate(size)
+            tmp.replace(self.path)
+        self._file = open(self.path, "r+b")
+        self.buf = mmap.mmap(self._file.fileno(), size)
+        self.ids = {}
+        self.lock = threading.Lock()  # heartbeat() is called from the capture thread
+        counter = struct.unpack_from("<Q", self.buf, COUNTER_OFFSET)[0] if reuse else 0
+        self.counter = counter + (counter & 1)  # A crashed writer may have left it odd
+        self.generation = (struct.unpack_from("<Q", self.buf, GENERATION_OFFSET)[0] if reuse else 0) + 1
+        self._begin()
+        HEADER.pack_into(self.buf, 0, MAGIC, max_symbols, 0, self.counter, 0, 0.0, self.generation, time.time())
+        self._end()
+
+    def _begin(self):
+        self.counter += 1
+        struct.pack_into("<Q", self.buf, COUNTER_OFFSET, self.counter)
+
+    def _end(self):
+        self.counter += 1
+        struct.pack_into("<Q", self.buf, COUNTER_OFFSET, self.counter)
+
+    def write(self, changed, feed_seq):
+        """`changed` maps symbol -> entry with ltp/close/volume/pct_change, as in all_stocks."""
+        now = time.time()
+        with self.lock:
+            self._write(changed, feed_seq, now)
+
+    def _write(self, changed, feed_seq, now):
+        self._begin()
+        try:
+            for sym, entry in changed.items():
+                sid = self.ids.get(sym)
+                if sid is None:
+                    if len(self.ids) >= self.max_symbols:
+                        continue
+                    sid = self.ids[sym] = len(self.ids)
+                    off = self.sym_off + sid * SYMBOL_WIDTH
+                    self.buf[off:off + SYMBOL_WIDTH] = sym.encode("ascii", "replace")[:SYMBOL_WIDTH].ljust(SYMBOL_WIDTH, b"\0")
+                    struct.pack_into("<I", self.buf, 12, len(self.ids))
+                RECORD.pack_into(self.buf, self.rec_off + sid * RECORD.size,
+                                 entry.get("ltp", 0), entry.get("close", 0), entry.get("volume", 0),
+                                 entry.get("pct_change", 0), now)
+            struct.pack_into("<Qd", self.buf, 24, feed_seq, now)
+            struct.pack_into("<d", self.buf, HEARTBEAT_OFFSET, now)
+        finally:
+            self._end()
+
+    def heartbeat(self):
+        """Outside the seqlock: readers only compare it against the clock."""
+        with self.lock:
+            struct.pack_into("<d", self.buf, HEARTBEAT_OFFSET, time.time())
+
+    def close(self):
+        with self.lock:
+            struct.pack_into("<d", self.buf, HEARTBEAT_OFFSET, 0.0)  # Readers fall back right away
+        self.buf.close()
+        self._file.close()
+
+
+class MarketShmReader:
+    def __init__(self, path, fallback=None):
+        self.path = Path(path)
+        self.fallback = fallback
+        self.buf = None
+        self._file = None
+        self.symbols = []
+        self.raw = []          # Last copied record bytes per symbol id, for change detection
+        self._seq = 0
+        self._timestamp = ""
+        self._stocks = {}
+        self.changed_at = {}
+        self.last_counter = None
+        self.generation = None
+        self.last_attach_try = 0.0
+        self.lock = threading.RLock()  # The API polls from its worker threads
+
+    def _attach(self):
+        # While the JSON feed is serving, look for a (live) segment every INODE_CHECK_INTERVAL
+        now = time.time()
+        if now - self.last_attach_try < INODE_CHECK_INTERVAL:
+            return False
+        self.last_attach_try = now
+        try:
+            f = open(self.path, "rb")
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        magic, max_symbols = HEADER.unpack_from(buf, 0)[:2]
+        if magic != MAGIC:
+            buf.close()
+            f.close()
+            return False
+        if self._stale(buf):
+            buf.close()
+            f.close()
+            return False
+        self._file, self.buf = f, buf
+        self._reset()
+        self.inode = self.path.stat().st_ino
+        self.last_inode_check = time.time()
+        self.sym_off, self.rec_off, _ = _region_sizes(max_symbols)
+        return True
+
+    @staticmethod
+    def _stale(buf):
+        return time.time() - struct.unpack_from("<d", buf, HEARTBEAT_OFFSET)[0] > SHM_STALE_SECONDS
+
+    def _reset(self):
+        self.symbols, self.raw, self._stocks, self.changed_at = [], [], {}, {}
+        self.last_counter = None
+        self.generation = None
+
+    @property
+    def attached(self):
+        return self.buf is not None
+
+    @property
+    def stocks(self):
+        return self._stocks if self.attached or not self.fallback else self.fallback.stocks
+
+    @property
+    def seq(self):
+        return self._seq if self.attached or not self.fallback else self.fallback.seq
+
+    @property
+    def timestamp(self):
+        return self._timestamp if self.attached or not self.fallback else self.fallback.timestamp
+
+    def _snapshot(self):
+        """Seqlock read: copy header + symbols + records until the counter is stable.
+        Returns None if no stable copy could be made within SEQLOCK_RETRY_SECONDS."""
+        buf = self.buf
+        deadline = time.monotonic() + SEQLOCK_RETRY_SECONDS
+        while True:
+            before = struct.unpack_from("<Q", buf, COUNTER_OFFSET)[0]
+            if not before & 1:
+                n = struct.unpack_from("<I", buf, 12)[0]
+                feed_seq, ts, generation = struct.unpack_from("<QdQ", buf, 24)
+                names = buf[self.sym_off:self.sym_off + n * SYMBOL_WIDTH] \
+                    if n > len(self.symbols) or generation != self.generation else None
+                records = buf[self.rec_off:self.rec_off + n * RECORD.size]
+                if struct.unpack_from("<Q", buf, COUNTER_OFFSET)[0] == before:
+                    return before, n, feed_seq, ts, generation, names, records
+            if time.monotonic() > deadline or self._stale(buf):
+                return None  # Writer killed mid-update: the counter will never settle
+            time.sleep(0)  # Writer mid-update; yield and retry
+
+    def _replaced(self):
+        # Checked at most every INODE_CHECK_INTERVAL while the segment looks idle
+        now = time.time()
+        if now - self.last_inode_check < INODE_CHECK_INTERVAL:
+            return False
+        self.last_inode_check = now
+        try:
+            return self.path.stat().st_ino != self.inode
+        except OSError:
+            return False
+
+    def poll(self):
+        with self.lock:
+            return self._poll()
+
+    def _poll(self):
+        if not self.attached and not self._attach():
+            return self.fallback.poll() if self.fallback else None
+        if self._stale(self.buf):
+            # Writer gone (or shared memory switched off): serve the JSON feed
+            self.close()
+            self._reset()
+            return self.fallback.poll() if self.fallback else None
+
+        snapshot = self._snapshot()
+        if snapshot is None:
+            self.close()
+            self._reset()
+            return self.fallback.poll() if self.fallback else None
+        counter, n, feed_seq, ts, generation, names, records = snapshot
+        if counter == self.last_counter:
+            if self._replaced():
+                self.close()
+                self._reset()
+                self.last_attach_try = 0.0
+                return self._poll()
+            return None
+        self.last_counter = counter
+
+        if generation != self.generation:
+            # Writer restarted: symbol ids were handed out again, rebuild the table
+            self.symbols, self.raw, self._stocks, self.changed_at = [], [], {}, {}
+            self.generation = generation
+        if names is not None:
+            for sid in range(len(self.symbols), n):
+                name = names[sid * SYMBOL_WIDTH:(sid + 1) * SYMBOL_WIDTH].rstrip(b"\0").decode("ascii")
+                self.symbols.append(name)
+                self.raw.append(b"")
+
+        changed = set()
+        for sid in range(n):
+            rec = records[sid * RECORD.size:(sid + 1) * RECORD.size]
+            if rec == self.raw[sid]:
+                continue
+            self.raw[sid] = rec
+            ltp, close, volume, pct, updated = RECORD.unpack(rec)
+            sym = self.symbols[sid]
+            self._stocks[sym] = {"ltp": ltp, "close": close, "volume": int(volume), "pct_change": pct,
+                                 "time": datetime.fromtimestamp(updated).strftime("%H:%M:%S") if updated else ""}
+            self.changed_at[sym] = feed_seq
+            changed.add(sym)
+        self._seq = feed_seq
+        self._timestamp = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else ""
+        return changed if changed else None
+
+    def payload(self, since=None):
+        if not self.attached and self.fallback:
+            return self.fallback.payload(since=since)
+        with self.lock:
+            if since is None:
+                stocks = dict(self._stocks)
+            else:
+                stocks = {s: self._stocks[s] for s, seq in self.changed_at.items() if seq > since}
+            return {"seq": self._seq, "timestamp": self._timestamp, "total": len(self._stocks), "stocks": stocks}
+
+    def close(self):
+        if self.buf is not None:
+            self.buf.close()
+            self._file.close()
+            self.buf = None
+
+
+def open_market_reader(shared_dir):
+    """Prefer the shared-memory segment; use the JSON delta feed until the scraper creates it."""
+    return MarketShmReader(Path(shared_dir) / SHM_NAME, fallback=MarketFeedReader(shared_dir))
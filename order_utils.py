@@ -2,8 +2,11 @@
 # NEW VERSION - HTML Form Filling + Email Sending to Broker
 # Replaces TMS automation with form-based email submission
 
+import atexit
 import json
 import os
+import re
+import threading
 import time
 import smtplib
 from pathlib import Path
@@ -13,12 +16,16 @@ from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 
+from market_feed import REPO_SHARED_DIR, shared_dir
+from serial_allocator import SerialAllocator
+from smtp_pool import smtp_pool
+
 # ============================================================================
 # CONFIGURATION & PATHS
 # ============================================================================
 
 BASE_DIR = Path(__file__).resolve().parent
-SHARED_DIR = BASE_DIR / "shared"
+SHARED_DIR = shared_dir(REPO_SHARED_DIR)  # $SHARED_DIR overrides (replay load tests)
 FORMS_DIR = BASE_DIR / "forms"
 FORMS_SENT_DIR = FORMS_DIR / "sent"
 FORMS_ARCHIVE_DIR = FORMS_DIR / "archive"
@@ -29,7 +36,9 @@ FORMS_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
 
 USER_PROFILE_PATH = BASE_DIR / "user_profile.json"
 FORM_TEMPLATE_PATH = BASE_DIR / "form_template.html"
-SERIAL_NUMBER_FILE = SHARED_DIR / "last_serial.txt"
+SERIAL_NUMBER_FILE = SHARED_DIR / "last_serial.txt"   # Old counter: only read once, to continue after it
+SERIAL_DB = SHARED_DIR / "serials.db"
+SERIAL_BLOCK_SIZE = int(os.environ.get("SERIAL_BLOCK_SIZE", "20") or 20)
 ORDERS_LOG_CSV = BASE_DIR / "orders_log.csv"
 
 # ============================================================================
@@ -108,25 +117,28 @@ def english_to_nepali_time(time_str):
 # SERIAL NUMBER MANAGEMENT
 # ============================================================================
 
+_serial_lock = threading.Lock()
+_serials = None
+
+def serial_allocator():
+    """Process-wide SerialAllocator (serial_allocator.py), opened on first use"""
+    global _serials
+    with _serial_lock:
+        if _serials is None:
+            SHARED_DIR.mkdir(parents=True, exist_ok=True)
+            _serials = SerialAllocator(SERIAL_DB, SERIAL_BLOCK_SIZE, start=888888,
+                                       owner=os.environ.get("ACCOUNT_ID", ""), legacy_file=SERIAL_NUMBER_FILE)
+            atexit.register(_serials.release)
+        return _serials
+
 def get_next_serial_number():
-    """Get and increment serial number, starting from 888888"""
-    try:
-        if SERIAL_NUMBER_FILE.exists():
-            with open(SERIAL_NUMBER_FILE, 'r') as f:
-                last_serial = int(f.read().strip())
-                next_serial = last_serial + 1
-        else:
-            next_serial = 888888
-        
-        # Write new serial number
-        with open(SERIAL_NUMBER_FILE, 'w') as f:
-            f.write(str(next_serial))
-        
-        return next_serial
-    
-    except Exception as e:
-        # Fallback: use timestamp-based number
-        return 888888 + int(time.time() % 100000)
+    """
+    Next order serial, starting from 888888, unique across all executors.
+    Serials come from a block reserved in shared/serials.db, so most calls touch
+    no file. There is no fallback number: if the allocator fails, the order fails
+    (and can be replayed) rather than risk a duplicate serial.
+    """
+    return serial_allocator().next()
 
 
 # ============================================================================
@@ -180,6 +192,100 @@ def calculate_price_ranges(base_price, config):
         }
 
 
+# ============================================================================
+# FORM TEMPLATE (compiled once, reloaded when the file changes)
+# ============================================================================
+
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}")
+BOUND_TEMPLATES_MAX = 32     # Distinct user profiles pre-rendered per template version
+
+class CompiledTemplate:
+    """Template as static text around {{FIELD}} slots: parts[0] slot[0] parts[1] ... parts[-1]"""
+
+    def __init__(self, parts, slots):
+        self.parts = parts
+        self.slots = slots
+        self.bound = {}      # profile fields -> CompiledTemplate with only the order slots left
+
+    @classmethod
+    def parse(cls, text):
+        pieces = PLACEHOLDER_RE.split(text)  # Alternates static text / field name
+        return cls(pieces[0::2], pieces[1::2])
+
+    def bind(self, values):
+        """Fold the given fields into the static text; the other slots stay open."""
+        parts, slots = [self.parts[0]], []
+        for name, part in zip(self.slots, self.parts[1:]):
+            if name in values:
+                parts[-1] += str(values[name]) + part
+            else:
+                slots.append(name)
+                parts.append(part)
+        return CompiledTemplate(parts, slots)
+
+    def render(self, values):
+        """One join; fields without a value keep their {{FIELD}} text, as before."""
+        out = [self.parts[0]]
+        for name, part in zip(self.slots, self.parts[1:]):
+            value = values.get(name)
+            out.append("{{%s}}" % name if value is None else str(value))
+            out.append(part)
+        return "".join(out)
+
+
+_template_lock = threading.Lock()
+_template_cache = {"stat": None, "compiled": None}
+
+def load_form_template():
+    """Compiled form_template.html; re-read only when its mtime or size changes."""
+    st = FORM_TEMPLATE_PATH.stat()
+    key = (st.st_mtime_ns, st.st_size)
+    with _template_lock:
+        if _template_cache["stat"] == key:
+            return _template_cache["compiled"]
+    with open(FORM_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        compiled = CompiledTemplate.parse(f.read())
+    with _template_lock:
+        _template_cache["stat"], _template_cache["compiled"] = key, compiled
+    return compiled
+
+
+def profile_form_fields(user_profile):
+    """Form fields that depend only on user_profile.json, not on the order"""
+    personal = user_profile.get('personal_info', {})
+    trading = user_profile.get('trading_defaults', {})
+    signature_info = user_profile.get('signature', {})
+    return {
+        'DAYS_TO_EXECUTE': trading.get('days_to_execute', '७'),
+        'SECURITY_TYPE': trading.get('security_type', 'साधारण शेयर'),
+        'SIGNATURE': signature_info.get('signature_text', ''),
+        'FULL_NAME': personal.get('full_name', ''),
+        'ADDRESS': personal.get('address', ''),
+        'FATHER_NAME': personal.get('father_name', ''),
+        'SPOUSE_GP_NAME': personal.get('spouse_or_grandfather_name', ''),
+        'CITIZENSHIP_PAN': personal.get('citizenship_or_pan', ''),
+        'DATE_OF_BIRTH': personal.get('date_of_birth', ''),
+        'ISSUE_PLACE': personal.get('issue_place', ''),
+        'MOBILE_NUMBER': personal.get('mobile_number', ''),
+        'PHONE_NUMBER': personal.get('phone_number', ''),
+        'CLIENT_CODE': personal.get('client_code', ''),
+    }
+
+
+def user_form_template(user_profile):
+    """The compiled template with this profile's fields already rendered in"""
+    template = load_form_template()
+    fields = profile_form_fields(user_profile)
+    key = tuple(str(v) for v in fields.values())
+    with _template_lock:
+        bound = template.bound.get(key)
+        if bound is None:
+            if len(template.bound) >= BOUND_TEMPLATES_MAX:
+                template.bound.clear()
+            bound = template.bound[key] = template.bind(fields)
+    return bound
+
+
 # ============================================================================
 # HTML FORM GENERATION
 # ============================================================================
@@ -197,9 +303,8 @@ def generate_filled_form(signal, user_profile, serial_number):
         tuple: (html_content, form_filename)
     """
     try:
-        # Load template
-        with open(FORM_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
-            template = f.read()
+        # Compiled template with the user's static fields pre-rendered
+        template = user_form_template(user_profile)
         
         # Extract signal data
         symbol = signal.get('symbol', 'UNKNOWN').upper()
@@ -224,41 +329,18 @@ def generate_filled_form(signal, user_profile, serial_number):
         # Calculate price ranges
         prices = calculate_price_ranges(price, user_profile)
         
-        # Get user info
-        personal = user_profile.get('personal_info', {})
-        trading = user_profile.get('trading_defaults', {})
-        signature_info = user_profile.get('signature', {})
-        
-        # Build replacements dictionary
-        replacements = {
-            '{{SERIAL_NUMBER}}': to_nepali_number(serial_number),
-            '{{DATE_NEPALI}}': date_nepali,
-            '{{TIME_NEPALI}}': time_nepali,
-            '{{DAYS_TO_EXECUTE}}': trading.get('days_to_execute', '७'),
-            '{{COMPANY_NAME}}': symbol,
-            '{{SECURITY_TYPE}}': trading.get('security_type', 'साधारण शेयर'),
-            '{{QUANTITY}}': to_nepali_number(qty),
-            '{{ACTION_PRICE}}': f"{action} @ रु.{price}",
-            '{{SIGNATURE}}': signature_info.get('signature_text', ''),
-            '{{FULL_NAME}}': personal.get('full_name', ''),
-            '{{ADDRESS}}': personal.get('address', ''),
-            '{{FATHER_NAME}}': personal.get('father_name', ''),
-            '{{SPOUSE_GP_NAME}}': personal.get('spouse_or_grandfather_name', ''),
-            '{{CITIZENSHIP_PAN}}': personal.get('citizenship_or_pan', ''),
-            '{{DATE_OF_BIRTH}}': personal.get('date_of_birth', ''),
-            '{{ISSUE_PLACE}}': personal.get('issue_place', ''),
-            '{{MOBILE_NUMBER}}': personal.get('mobile_number', ''),
-            '{{PHONE_NUMBER}}': personal.get('phone_number', ''),
-            '{{CLIENT_CODE}}': personal.get('client_code', ''),
-            '{{FIXED_PRICE}}': to_nepali_number(prices['fixed']),
-            '{{MIN_MAX_PRICE}}': to_nepali_number(prices['min_max']),
-            '{{BROKER_DISCRETION_PRICE}}': to_nepali_number(prices['broker'])
-        }
-        
-        # Replace all placeholders
-        filled_html = template
-        for placeholder, value in replacements.items():
-            filled_html = filled_html.replace(placeholder, str(value))
+        # Only the order-specific fields are filled per order
+        filled_html = template.render({
+            'SERIAL_NUMBER': to_nepali_number(serial_number),
+            'DATE_NEPALI': date_nepali,
+            'TIME_NEPALI': time_nepali,
+            'COMPANY_NAME': symbol,
+            'QUANTITY': to_nepali_number(qty),
+            'ACTION_PRICE': f"{action} @ रु.{price}",
+            'FIXED_PRICE': to_nepali_number(prices['fixed']),
+            'MIN_MAX_PRICE': to_nepali_number(prices['min_max']),
+            'BROKER_DISCRETION_PRICE': to_nepali_number(prices['broker'])
+        })
         
         # Generate filename
         timestamp_str = dt.strftime("%Y%m%d_%H%M%S")
@@ -297,6 +379,7 @@ def send_email_with_form(html_content, filename, signal, user_profile, logger):
         sender_password = email_config.get('sender_password')
         smtp_server = email_config.get('smtp_server', 'smtp.gmail.com')
         smtp_port = email_config.get('smtp_port', 587)
+        smtp_starttls = email_config.get('smtp_starttls', True)
         
         if not sender_email or not sender_password:
             logger.error("[EMAIL] Sender email or password not configured in user_profile.json")
@@ -341,19 +424,16 @@ NEPSE Trading Bot
         attachment.add_header('Content-Disposition', f'attachment; filename="{filename}"')
         msg.attach(attachment)
         
-        # Send email
-        logger.info(f"[EMAIL] Connecting to {smtp_server}:{smtp_port}")
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
+        # Send email over the process-wide session for this sender (smtp_pool.py):
+        # connect + STARTTLS + login only when no live session is available
+        logger.info(f"[EMAIL] Sending to {broker_email} via {smtp_server}:{smtp_port} as {sender_email}")
+        sent = smtp_pool.send(msg, smtp_server, smtp_port, sender_email, sender_password, starttls=smtp_starttls)
         
-        logger.info(f"[EMAIL] Logging in as {sender_email}")
-        server.login(sender_email, sender_password)
-        
-        logger.info(f"[EMAIL] Sending to {broker_email}")
-        server.send_message(msg)
-        server.quit()
-        
-        logger.info(f"[EMAIL] ✓ Successfully sent form {filename} to {broker_email}")
+        session = "reused session" if sent['reused'] else f"handshake {sent['handshake_ms']}ms"
+        if sent['retried']:
+            session += " after reconnect"
+        logger.info(f"[EMAIL] ✓ Successfully sent form {filename} to {broker_email} "
+                    f"({session}, send {sent['send_ms']}ms)")
         return True
     
     except smtplib.SMTPAuthenticationError:
@@ -370,37 +450,40 @@ NEPSE Trading Bot
 # CSV LOGGING
 # ============================================================================
 
+_orders_log_lock = threading.Lock()
+
 def log_order_to_csv(serial_number, signal, status, logger):
     """Log order details to CSV file"""
     try:
         import csv
         
-        # Create CSV if it doesn't exist
-        file_exists = ORDERS_LOG_CSV.exists()
-        
-        with open(ORDERS_LOG_CSV, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
+        with _orders_log_lock:
+            # Create CSV if it doesn't exist
+            file_exists = ORDERS_LOG_CSV.exists()
             
-            # Write header if new file
-            if not file_exists:
+            with open(ORDERS_LOG_CSV, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                
+                # Write header if new file
+                if not file_exists:
+                    writer.writerow([
+                        'Serial', 'Timestamp', 'Date', 'Time', 'Symbol', 
+                        'Action', 'Price', 'Quantity', 'Status'
+                    ])
+                
+                # Write order data
+                now = datetime.now()
                 writer.writerow([
-                    'Serial', 'Timestamp', 'Date', 'Time', 'Symbol', 
-                    'Action', 'Price', 'Quantity', 'Status'
+                    serial_number,
+                    now.strftime("%Y-%m-%d %H:%M:%S"),
+                    now.strftime("%Y-%m-%d"),
+                    now.strftime("%H:%M:%S"),
+                    signal.get('symbol', 'UNKNOWN'),
+                    signal.get('action', 'BUY'),
+                    signal.get('price', 0),
+                    signal.get('qty', 10),
+                    status
                 ])
-            
-            # Write order data
-            now = datetime.now()
-            writer.writerow([
-                serial_number,
-                now.strftime("%Y-%m-%d %H:%M:%S"),
-                now.strftime("%Y-%m-%d"),
-                now.strftime("%H:%M:%S"),
-                signal.get('symbol', 'UNKNOWN'),
-                signal.get('action', 'BUY'),
-                signal.get('price', 0),
-                signal.get('qty', 10),
-                status
-            ])
         
         logger.info(f"[LOG] Order logged to {ORDERS_LOG_CSV}")
     
@@ -0,0 +1,85 @@
+# scraper_pipeline.py
+# Hand-offs between the scraper's capture -> diff -> publish -> notify stage threads.
+# Exports:
+#  - StageQueue(name, maxsize, coalesce=None)   .put(item) -> bool, .get() -> item | None, .close(), .stats()
+#  - coalesce_capture(older, newer)            merge two pending capture jobs (diff stage input)
+#  - coalesce_publish(older, newer)            merge two pending publish jobs
+#
+# A stage that falls behind never blocks the one feeding it: once its queue is
+# full the newest job is merged into the last pending one, so under overload
+# the diff and publish stages see fewer, larger jobs instead of a growing lag.
+
+import collections
+import threading
+
+
+class StageQueue:
+    """Bounded hand-off between two pipeline stages.
+
+    When full, the newest item is merged into the last pending one with
+    `coalesce`, or dropped if the stage has no coalesce function."""
+
+    def __init__(self, name, maxsize, coalesce=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.coalesce = coalesce
+        self.items = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.puts = self.coalesced = self.dropped = self.high_water = 0
+
+    def put(self, item):
+        with self.cond:
+            self.puts += 1
+            if len(self.items) >= self.maxsize:
+                if self.coalesce is None:
+                    self.dropped += 1
+                    return False
+                self.items[-1] = self.coalesce(self.items[-1], item)
+                self.coalesced += 1
+            else:
+                self.items.append(item)
+                self.high_water = max(self.high_water, len(self.items))
+            self.cond.notify()
+            return True
+
+    def get(self):
+        """Block until an item is available; None once closed and drained."""
+        with self.cond:
+            while not self.items and not self.closed:
+                self.cond.wait(0.5)
+            return self.items.popleft() if self.items else None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {"depth": len(self.items), "max": self.maxsize, "high_water": self.high_water,
+                    "puts": self.puts, "coalesced": self.coalesced, "dropped": self.dropped}
+
+
+def coalesce_capture(older, newer):
+    # Newest row per symbol wins; intermediate prices of a symbol are lost under overload.
+    # Across brokers the further-along (higher volume) row wins instead, so a lagging
+    # source can't overwrite a fresher one before the merge sees it.
+    rows = {r["sym"]: r for r in older["rows"]}
+    for r in newer["rows"]:
+        kept = rows.get(r["sym"])
+        if kept is None or kept.get("src") is r.get("src") or r["vol"] >= kept["vol"]:
+            rows[r["sym"]] = r
+    return dict(newer, rows=list(rows.values()))
+
+
+def coalesce_publish(older, newer):
+    # CSV move rows are never dropped; JSON snapshots only need the latest version
+    return {
+        "now_full": newer["now_full"],
+        "moves_rows": older["moves_rows"] + newer["moves_rows"],
+        "full_rows": newer["full_rows"] or older["full_rows"],
+        "moves": newer["moves"] if newer["moves"] is not None else older["moves"],
+        "changed": {**older["changed"], **newer["changed"]},
+        "stocks": newer["stocks"] or older["stocks"],
+    }
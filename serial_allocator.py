@@ -0,0 +1,177 @@
+# serial_allocator.py
+# Order serial numbers, unique across every executor process, handed out from reserved blocks.
+# Exports:
+#  - SerialAllocator(path, block_size=20, start=888888, owner="", legacy_file=None)
+#      .next() -> int       in memory; one SQLite write transaction per block_size serials
+#      .release()           record how much of the current block was used (called at exit)
+#      .gaps() -> [{"first", "last", "count", "reason", "owner", "pid", "reserved_at"}]
+#      .status() -> {"next", "blocks", "open"}
+#
+# The counter row is advanced in the same transaction that records a block
+# (BEGIN IMMEDIATE, so two processes never reserve the same range), and it only
+# ever moves forward: a crash can lose serials, never reuse them. Lost serials
+# are reported as gaps instead of silently disappearing:
+#   released    the unused tail of a block its process returned at exit
+#   abandoned   a block whose process died without releasing it; which of its
+#               serials went out is unknown (check orders_log.csv / forms/sent)
+# Dead owners are detected with psutil when it is installed; otherwise their
+# blocks stay "open" in status().
+#
+# CLI:
+#   python serial_allocator.py status     [--db shared/serials.db]
+#   python serial_allocator.py gaps
+
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+try:
+    import psutil
+except ImportError:  # Optional: blocks of dead processes are then never reaped
+    psutil = None
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS serial_counter (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        next INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS serial_blocks (
+        first INTEGER PRIMARY KEY,
+        last INTEGER NOT NULL,
+        owner TEXT NOT NULL,
+        host TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        reserved_at REAL NOT NULL,
+        used_upto INTEGER,
+        closed_at REAL
+    );
+"""
+
+
+class SerialAllocator:
+    def __init__(self, path, block_size=20, start=888888, owner="", legacy_file=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.block_size = max(1, int(block_size))
+        self.owner = owner
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.block = None        # (first, last) of the block in use
+        self.last_issued = None
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.conn.execute("SELECT next FROM serial_counter WHERE id = 1").fetchone() is None:
+                self.conn.execute("INSERT INTO serial_counter (id, next) VALUES (1, ?)",
+                                  (max(start, self._legacy_next(legacy_file)),))
+            self._reap()
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _legacy_next(legacy_file):
+        """Continue after the old last_serial.txt counter, if there is one"""
+        try:
+            return int(Path(legacy_file).read_text().strip()) + 1
+        except (TypeError, OSError, ValueError):
+            return 0
+
+    def _reap(self):
+        """Close the blocks of processes on this host that died holding them"""
+        if psutil is None:
+            return
+        rows = self.conn.execute("SELECT first, pid FROM serial_blocks WHERE closed_at IS NULL AND host = ?",
+                                 (self.host,)).fetchall()
+        for first, pid in rows:
+            if pid != self.pid and not psutil.pid_exists(pid):
+                self.conn.execute("UPDATE serial_blocks SET closed_at = ? WHERE first = ?", (time.time(), first))
+
+    def _reserve(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            first = self.conn.execute("SELECT next FROM serial_counter WHERE id = 1").fetchone()[0]
+            last = first + self.block_size - 1
+            self.conn.execute("UPDATE serial_counter SET next = ? WHERE id = 1", (last + 1,))
+            self.conn.execute("INSERT INTO serial_blocks (first, last, owner, host, pid, reserved_at) "
+                              "VALUES (?, ?, ?, ?, ?, ?)",
+                              (first, last, self.owner, self.host, self.pid, time.time()))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return first, last
+
+    def _close_block(self):
+        first, _ = self.block
+        self.conn.execute("UPDATE serial_blocks SET used_upto = ?, closed_at = ? WHERE first = ?",
+                          (self.last_issued if self.last_issued is not None else first - 1, time.time(), first))
+
+    def next(self):
+        with self.lock:
+            if self.block is None or self.last_issued == self.block[1]:
+                if self.block is not None:
+                    self._close_block()  # Fully used
+                self.block = self._reserve()
+                self.last_issued = None
+            self.last_issued = self.block[0] if self.last_issued is None else self.last_issued + 1
+            return self.last_issued
+
+    def release(self):
+        with self.lock:
+            if self.block is not None:
+                self._close_block()
+                self.block = None
+                self.last_issued = None
+
+    def gaps(self):
+        rows = self.conn.execute("SELECT first, last, used_upto, owner, pid, reserved_at FROM serial_blocks "
+                                 "WHERE closed_at IS NOT NULL AND (used_upto IS NULL OR used_upto < last) "
+                                 "ORDER BY first").fetchall()
+        out = []
+        for first, last, used_upto, owner, pid, reserved_at in rows:
+            gap_first = first if used_upto is None else used_upto + 1
+            out.append({"first": gap_first, "last": last, "count": last - gap_first + 1,
+                        "reason": "abandoned" if used_upto is None else "released",
+                        "owner": owner, "pid": pid, "reserved_at": reserved_at})
+        return out
+
+    def status(self):
+        next_serial = self.conn.execute("SELECT next FROM serial_counter WHERE id = 1").fetchone()[0]
+        blocks, open_blocks = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(closed_at IS NULL), 0) FROM serial_blocks").fetchone()
+        return {"next": next_serial, "blocks": blocks, "open": open_blocks}
+
+    def close(self):
+        self.release()
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Order serial blocks and gaps")
+    parser.add_argument("command", choices=["status", "gaps"])
+    parser.add_argument("--db", default="shared/serials.db")
+    args = parser.parse_args()
+    allocator = SerialAllocator(args.db)
+
+    if args.command == "status":
+        st = allocator.status()
+        print(f"{args.db}: next serial {st['next']} | {st['blocks']} blocks reserved, {st['open']} in use")
+        for first, last, owner, pid in allocator.conn.execute(
+                "SELECT first, last, owner, pid FROM serial_blocks WHERE closed_at IS NULL ORDER BY first"):
+            print(f"  {first}-{last} held by {owner or '?'} (pid {pid})")
+    else:
+        gaps = allocator.gaps()
+        for g in gaps:
+            print(f"{g['first']}-{g['last']} ({g['count']}) {g['reason']:9} | {g['owner'] or '?'} pid {g['pid']} "
+                  f"| reserved {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(g['reserved_at']))}")
+        print(f"{sum(g['count'] for g in gaps)} unused serials in {len(gaps)} gaps")
+    allocator.conn.close()
@@ -0,0 +1,132 @@
+# signal_history.py
+# Background writer for fired signals: signal_history table + SIGNALS_HISTORY.csv.
+# Exports:
+#  - SignalHistoryWriter(db_path, csv_path)
+#      .submit(rows)   rows of (time, user_id, symbol, action, price, qty, reason, order_type)
+#      .flush(timeout=5.0), .stats(), .close()
+#
+# One thread owns one SQLite connection and one open CSV handle. Everything
+# submitted since its last pass goes out as a single executemany transaction
+# and one buffered CSV write, so a burst of stop-losses costs one commit
+# instead of one connect/commit/fsync per signal, and the evaluation loop
+# never waits on disk.
+
+import csv
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+CSV_HEADER = ["Time", "User_ID", "Symbol", "Action", "Price", "Qty", "Reason", "Order_Type"]
+INSERT_SQL = """
+    INSERT INTO signal_history (user_id, symbol, action, price, qty, reason, status)
+    VALUES (?, ?, ?, ?, ?, ?, 'PENDING')
+"""
+
+
+class SignalHistoryWriter:
+    def __init__(self, db_path, csv_path):
+        self.db_path = Path(db_path)
+        self.csv_path = Path(csv_path)
+        self.queue = queue.Queue()
+        self.conn = None
+        self.csv_file = None
+        self.csv_writer = None
+        self.batches = self.rows_written = self.db_failures = 0
+        self.last_batch_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name="signal-history", daemon=True)
+        self.thread.start()
+
+    def submit(self, rows):
+        if rows:
+            self.queue.put(list(rows))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        return conn
+
+    def _open_csv(self):
+        self.csv_path.parent.mkdir(parents=True, exist_ok=True)
+        new = not self.csv_path.exists() or self.csv_path.stat().st_size == 0
+        self.csv_file = open(self.csv_path, "a", newline="", encoding="utf-8")
+        self.csv_writer = csv.writer(self.csv_file)
+        if new:
+            self.csv_writer.writerow(CSV_HEADER)
+
+    def _write(self, rows):
+        started = time.time()
+        try:
+            if self.csv_file is None:
+                self._open_csv()
+            self.csv_writer.writerows(rows)
+            self.csv_file.flush()
+        except Exception as e:
+            print(f"⚠️  CSV LOG FAILED: {e}")
+            try:
+                self.csv_file.close()
+            except Exception:
+                pass
+            self.csv_file = None  # Reopen on the next batch
+
+        try:
+            if self.conn is None:
+                self.conn = self._connect()
+            with self.conn:  # One transaction for the whole batch
+                self.conn.executemany(INSERT_SQL, [(r[1], r[2], r[3], r[4], r[5], r[6]) for r in rows])
+        except Exception as e:
+            print(f"⚠️  DB LOG FAILED ({len(rows)} signals): {e}")
+            self.db_failures += 1
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None  # Reconnect on the next batch
+
+        self.batches += 1
+        self.rows_written += len(rows)
+        self.last_batch_seconds = time.time() - started
+
+    def _run(self):
+        stop = False
+        while not stop:
+            rows = self.queue.get()
+            taken = 1
+            stop = rows is None
+            rows = rows or []
+            # Fold in whatever else queued up while we were writing
+            while not stop:
+                try:
+                    more = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if more is None:
+                    stop = True
+                else:
+                    rows.extend(more)
+            if rows:
+                self._write(rows)
+            for _ in range(taken):
+                self.queue.task_done()
+        # The connection belongs to this thread, so it is closed here
+        if self.csv_file:
+            self.csv_file.close()
+        if self.conn:
+            self.conn.close()
+
+    def flush(self, timeout=5.0):
+        """Wait until everything submitted so far is on disk."""
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+        return not self.queue.unfinished_tasks
+
+    def stats(self):
+        return {"batches": self.batches, "rows": self.rows_written, "pending": self.queue.qsize(),
+                "db_failures": self.db_failures, "last_batch_seconds": round(self.last_batch_seconds, 4)}
+
+    def close(self, timeout=10.0):
+        self.queue.put(None)
+        self.thread.join(timeout)
@@ -0,0 +1,232 @@
+# signal_queue.py
+# Append-only signal log (SQLite) with a committed offset per consumer.
+# Exports:
+#  - SignalQueue(path, poll_interval=0.05)
+#      .append(signals) -> offset of the last one     one transaction, then the head file is touched
+#      .register(consumer, start="latest")            first use only: "latest" or "earliest"
+#      .read(consumer, limit=100) -> [(offset, signal)]   after the consumer's committed offset
+#      .wait(consumer, timeout, limit=100) -> [(offset, signal)]   long-poll; [] on timeout
+#      .commit(consumer, offset)                      forward only
+#      .seek(consumer, offset)                        replay: the next read starts after `offset`
+#      .replay(consumer, offset) -> bool              seek once per requested offset (SIGNAL_REPLAY_FROM);
+#                                                     False when that request was already applied
+#      .head(), .consumers() -> {name: {"offset", "lag", "updated_at"}}, .prune(keep_days=7)
+#
+# The signal engine appends; every executor account reads under its own
+# consumer name and commits after handling each signal, so a crash re-delivers
+# at most the signal in flight (at-least-once) and no executor can take
+# another's signals. Waiters sleep on a filesystem notification for
+# <db>.head (watchdog), or re-check every poll_interval without it.
+#
+# CLI:
+#   python signal_queue.py status                   [--db shared/signal_queue.db]
+#   python signal_queue.py seek executor_B 1200     (replay everything after offset 1200)
+#   python signal_queue.py tail 20
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from market_feed import atomic_write_json
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Optional: wait() re-checks every poll_interval instead
+    FileSystemEventHandler = object
+    Observer = None
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS signals (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL NOT NULL,
+        payload TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS consumers (
+        name TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS replays (
+        name TEXT PRIMARY KEY,
+        offset INTEGER NOT NULL,
+        applied_at REAL NOT NULL
+    );
+"""
+
+
+class _HeadTouched(FileSystemEventHandler):
+    def __init__(self, event, name):
+        self.event = event
+        self.name = name
+
+    def on_any_event(self, fs_event):
+        path = getattr(fs_event, "dest_path", "") or fs_event.src_path
+        if os.path.basename(path) == self.name:
+            self.event.set()
+
+
+class SignalQueue:
+    def __init__(self, path, poll_interval=0.05):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.head_path = self.path.with_suffix(".head")
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.executescript(SCHEMA)
+        self.event = threading.Event()
+        self.observer = None
+
+    # ---------- producer ----------
+    def append(self, signals):
+        now = time.time()
+        rows = [(now, json.dumps(signal)) for signal in signals]
+        if not rows:
+            return self.head()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO signals (ts, payload) VALUES (?, ?)", rows)
+            last = self.conn.execute("SELECT MAX(seq) FROM signals").fetchone()[0]
+        atomic_write_json(self.head_path, {"offset": last, "ts": now}, retries=2)
+        return last
+
+    def head(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM signals").fetchone()[0]
+
+    # ---------- consumers ----------
+    def _offset(self, consumer):
+        row = self.conn.execute("SELECT seq FROM consumers WHERE name = ?", (consumer,)).fetchone()
+        return row[0] if row else None
+
+    def register(self, consumer, start="latest"):
+        """Create the consumer's offset if it has none; returns its offset."""
+        with self.lock, self.conn:
+            offset = self._offset(consumer)
+            if offset is None:
+                offset = 0 if start == "earliest" else \
+                    self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM signals").fetchone()[0]
+                self.conn.execute("INSERT INTO consumers (name, seq, updated_at) VALUES (?, ?, ?)",
+                                  (consumer, offset, time.time()))
+            return offset
+
+    def read(self, consumer, limit=100):
+        with self.lock:
+            offset = self._offset(consumer)
+            if offset is None:
+                raise KeyError(f"unknown consumer {consumer!r} (register it first)")
+            rows = self.conn.execute("SELECT seq, payload FROM signals WHERE seq > ? ORDER BY seq LIMIT ?",
+                                     (offset, limit)).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def commit(self, consumer, offset):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE consumers SET seq = MAX(seq, ?), updated_at = ? WHERE name = ?",
+                              (offset, time.time(), consumer))
+
+    def seek(self, consumer, offset):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO consumers (name, seq, updated_at) VALUES (?, ?, ?) "
+                              "ON CONFLICT(name) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at",
+                              (consumer, offset, time.time()))
+
+    def replay(self, consumer, offset):
+        """Seek unless this exact request is the last one applied, so a restart that still
+        carries it does not rewind again; seek() (the CLI) always applies."""
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT offset FROM replays WHERE name = ?", (consumer,)).fetchone()
+            if row is not None and row[0] == offset:
+                return False
+            now = time.time()
+            self.conn.execute("INSERT INTO consumers (name, seq, updated_at) VALUES (?, ?, ?) "
+                              "ON CONFLICT(name) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at",
+                              (consumer, offset, now))
+            self.conn.execute("INSERT OR REPLACE INTO replays (name, offset, applied_at) VALUES (?, ?, ?)",
+                              (consumer, offset, now))
+            return True
+
+    def _watch(self):
+        if self.observer is not None or Observer is None:
+            return
+        try:
+            observer = Observer()
+            observer.schedule(_HeadTouched(self.event, self.head_path.name), str(self.path.parent), recursive=False)
+            observer.daemon = True
+            observer.start()
+            self.observer = observer
+        except Exception as e:
+            print(f"Signal queue notifications unavailable ({e}), checking every {self.poll_interval * 1000:.0f}ms")
+            self.poll_interval = max(self.poll_interval, 0.05)
+
+    @property
+    def mode(self):
+        return "notify" if self.observer else "poll"
+
+    def wait(self, consumer, timeout, limit=100):
+        """Signals after the consumer's offset, blocking up to `timeout` seconds for new ones."""
+        self._watch()
+        deadline = time.time() + timeout
+        while True:
+            self.event.clear()  # Before reading, so an append during the read still wakes us
+            batch = self.read(consumer, limit)
+            remaining = deadline - time.time()
+            if batch or remaining <= 0:
+                return batch
+            if self.observer is not None:
+                # Notifications are the fast path; the cap guards against a missed event
+                self.event.wait(min(remaining, 1.0))
+            else:
+                time.sleep(min(remaining, self.poll_interval))
+
+    def consumers(self):
+        with self.lock:
+            head = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM signals").fetchone()[0]
+            rows = self.conn.execute("SELECT name, seq, updated_at FROM consumers ORDER BY name").fetchall()
+        return {name: {"offset": seq, "lag": head - seq, "updated_at": updated_at} for name, seq, updated_at in rows}
+
+    def prune(self, keep_days=7):
+        """Drop signals older than keep_days; offsets stay valid (AUTOINCREMENT never reuses seqs)."""
+        with self.lock, self.conn:
+            cur = self.conn.execute("DELETE FROM signals WHERE ts < ?", (time.time() - keep_days * 86400,))
+        return cur.rowcount
+
+    def close(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join(timeout=2)
+            self.observer = None
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or rewind the signal queue")
+    parser.add_argument("command", choices=["status", "seek", "tail"])
+    parser.add_argument("args", nargs="*")
+    parser.add_argument("--db", default="shared/signal_queue.db")
+    args = parser.parse_args()
+    queue = SignalQueue(args.db)
+
+    if args.command == "status":
+        print(f"{args.db}: head offset {queue.head()}")
+        for name, c in queue.consumers().items():
+            print(f"  {name:20} offset {c['offset']:8} | lag {c['lag']:6} | "
+                  f"updated {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(c['updated_at']))}")
+    elif args.command == "seek":
+        if len(args.args) != 2:
+            parser.error("seek <consumer> <offset>")
+        queue.seek(args.args[0], int(args.args[1]))
+        print(f"{args.args[0]} -> offset {args.args[1]} (next read starts after it)")
+    else:
+        n = int(args.args[0]) if args.args else 20
+        with queue.lock:
+            rows = queue.conn.execute("SELECT seq, ts, payload FROM signals ORDER BY seq DESC LIMIT ?", (n,)).fetchall()
+        for seq, ts, payload in reversed(rows):
+            s = json.loads(payload)
+            print(f"{seq:8} {time.strftime('%H:%M:%S', time.localtime(ts))} {s.get('action', ''):4} "
+                  f"{s.get('symbol', ''):8} @ {s.get('price', '')} x{s.get('qty', '')} | {s.get('user_id', '')}")
+    queue.close()
@@ -0,0 +1,560 @@
+# signal_rules.py
+# Trigger rules shared by the signal engine (and anything that replays them).
+# Exports:
+#  - BUY, SELL, STOP                        trigger kinds, in precedence order
+#  - calculate_triggers(purchase_price, target_sell_price, risk_tolerance=None, buy_mult=..., ...)
+#      -> {"buy_trigger", "sell_trigger", "stop_loss"}   levels stored with every user stock
+#  - build_entry(ordinal, user_id, symbol, stock_config) -> entry dict | None
+#  - compile_rule(text) -> Rule             safe indicator expression, e.g. "ltp < vwap - 1.5 * atr"
+#  - apply_rules(hits, rule_entries, prices, indicators) -> hits with rule triggers merged in
+#  - TriggerIndex(users=None)               per-symbol sorted trigger levels
+#      .sync(users) -> (added, changed, removed, touched symbols)   re-indexes changed users only
+#      .set_user(user_id, config) / .remove_user(user_id) -> touched symbols
+#      .fired(symbol, price) -> [(entry, kind)]        what the level rules fire at `price`
+#      .crossed(symbol, old, new) -> [(entry, kind)]   levels the move old -> new passed through
+#      .evaluate(prices, indicators=None) -> [(entry, kind, price)]   all fired triggers, in strategy-file order
+#      .entries(), .version                            for views built on the index (signal_vector)
+#  - make_signal(entry, kind, price) -> (signal, legacy_signal)
+#  - TriggerLatches(path, hysteresis=0.005, cooldown=120)   path=None keeps them in memory
+#      .filter(hits, prices, now) -> hits that are armed; fired ones latch once commit()ed
+#      .commit()                       latch what the last filter() admitted and save
+#      .stats(), .save()
+#
+# Rules (unchanged from the original per-user loop):
+#   BUY  when buy_trigger  and price <= buy_trigger
+#   SELL when sell_trigger and price >= sell_trigger   (only if BUY did not fire)
+#   STOP when stop_loss    and price <= stop_loss      (only if neither fired) -> MARKET sell
+# A stock's triggers may also carry buy_rule / sell_rule / stop_rule: an
+# expression over the symbol's indicators (indicators.IndicatorBook), its ltp
+# and the stock's own purchase_price, target_sell_price, buy_trigger,
+# sell_trigger and stop_loss. A kind fires when its level OR its rule holds,
+# with the same precedence; a rule referencing an indicator that is not warm
+# yet does not fire.
+#
+# Every level is kept in a sorted list per symbol and kind, so the triggers
+# hit at a price are one bisect plus a slice: cost follows the number of
+# triggers hit, not the number of strategies configured.
+
+import ast
+import bisect
+import collections
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+from market_feed import atomic_write_json
+
+BUY = "BUY"
+SELL = "SELL"
+STOP = "STOP"
+
+BUY_MULTIPLIER = 0.98     # buy_trigger  = purchase_price    * BUY_MULTIPLIER
+SELL_MULTIPLIER = 0.99    # sell_trigger = target_sell_price * SELL_MULTIPLIER
+STOP_MULTIPLIER = 0.90    # stop_loss    = purchase_price    * STOP_MULTIPLIER
+
+
+def calculate_triggers(purchase_price, target_sell_price, risk_tolerance=None,
+                       buy_mult=BUY_MULTIPLIER, sell_mult=SELL_MULTIPLIER, stop_mult=STOP_MULTIPLIER):
+    """Levels the config API stores (risk_tolerance is accepted but unused, as it always was).
+    The multipliers are parameters so backtest.py can tune them."""
+    return {
+        "buy_trigger": round(purchase_price * buy_mult, 2),
+        "sell_trigger": round(target_sell_price * sell_mult, 2),
+        "stop_loss": round(purchase_price * stop_mult, 2)
+    }
+
+
+def _level(value):
+    try:
+        level = float(value)
+    except (TypeError, ValueError):
+        return None
+    return level if level else None
+
+
+_RULE_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+               ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+               ast.Eq, ast.NotEq, ast.Name, ast.Load, ast.Constant, ast.Call)
+_RULE_FUNCS = {"min": min, "max": max, "abs": abs}
+_RULE_GLOBALS = {"__builtins__": {}, **_RULE_FUNCS}
+_RULE_CACHE = {}
+
+
+class Rule:
+    """A compiled rule expression; calling it with a name -> value mapping returns a bool."""
+
+    def __init__(self, text):
+        self.text = text.strip()
+        try:
+            tree = ast.parse(self.text, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"invalid rule {text!r}: {e.msg}") from None
+        names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _RULE_NODES):
+                raise ValueError(f"rule {text!r}: {type(node).__name__} is not allowed")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise ValueError(f"rule {text!r}: only numeric constants are allowed")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in _RULE_FUNCS or node.keywords:
+                    raise ValueError(f"rule {text!r}: only min(), max() and abs() can be called")
+            elif isinstance(node, ast.Name) and node.id not in _RULE_FUNCS:
+                names.add(node.id)
+        self.names = frozenset(names)
+        self.code = compile(tree, "<rule>", "eval")
+
+    def __call__(self, namespace):
+        for name in self.names:
+            if namespace.get(name) is None:
+                return False  # Unknown name, or an indicator still warming up
+        try:
+            return bool(eval(self.code, _RULE_GLOBALS, namespace))
+        except (ArithmeticError, TypeError):
+            return False
+
+    def __reduce__(self):
+        return compile_rule, (self.text,)  # Code objects don't pickle; shards recompile
+
+    def __repr__(self):
+        return f"Rule({self.text!r})"
+
+
+def compile_rule(text):
+    """Rule for `text` (cached: many users share the same expression). ValueError if unsafe or invalid."""
+    rule = _RULE_CACHE.get(text)
+    if rule is None:
+        rule = _RULE_CACHE[text] = Rule(text)
+    return rule
+
+
+def build_entry(ordinal, user_id, symbol, stock_config):
+    """Flatten one user's stock config into what evaluation needs. None if it can never fire."""
+    triggers = stock_config.get("triggers", {}) or {}
+    purchase_qty = stock_config.get("purchase_qty", 10)
+    partial_fill_enabled = bool(triggers.get("partial_fill_enabled", True))
+    try:
+        min_fill_qty = triggers.get("min_fill_qty") or max(1, purchase_qty // 2)
+    except TypeError:
+        return None
+    entry = {
+        "ordinal": ordinal,
+        "user_id": user_id,
+        "symbol": symbol,
+        # Raw values are kept for the reason text, floats for the index
+        "buy_trigger": triggers.get("buy_trigger", 0),
+        "sell_trigger": triggers.get("sell_trigger", 0),
+        "stop_loss": triggers.get("stop_loss", 0),
+        "levels": {BUY: _level(triggers.get("buy_trigger")),
+                   SELL: _level(triggers.get("sell_trigger")),
+                   STOP: _level(triggers.get("stop_loss"))},
+        "purchase_qty": purchase_qty,
+        "selling_qty": stock_config.get("selling_qty", 10),
+        "order_type": stock_config.get("order_type", "LIMIT"),
+        "partial_fill_enabled": partial_fill_enabled,
+        "min_fill_qty": min_fill_qty,
+        "rules": {},
+        "rule_errors": [],
+    }
+    for kind, key in ((BUY, "buy_rule"), (SELL, "sell_rule"), (STOP, "stop_rule")):
+        text = triggers.get(key)
+        if text:
+            try:
+                entry["rules"][kind] = compile_rule(str(text))
+            except ValueError as e:
+                entry["rule_errors"].append(str(e))
+    if entry["rules"]:
+        # Names a rule can use besides the indicators
+        entry["context"] = {"purchase_price": _level(stock_config.get("purchase_price")),
+                            "target_sell_price": _level(stock_config.get("target_sell_price")),
+                            "buy_trigger": entry["levels"][BUY], "sell_trigger": entry["levels"][SELL],
+                            "stop_loss": entry["levels"][STOP]}
+    return entry if any(entry["levels"].values()) or entry["rules"] else None
+
+
+PRECEDENCE = {BUY: 0, SELL: 1, STOP: 2}
+KINDS = (BUY, SELL, STOP)
+
+
+def apply_rules(hits, rule_entries, prices, indicators):
+    """Merge rule triggers into level `hits` (sorted by ordinal) for the symbols in
+    `prices`. `indicators` maps symbol -> indicator values."""
+    if not rule_entries or not indicators:
+        return hits
+    at = {hit[0]["ordinal"]: i for i, hit in enumerate(hits)}
+    added = False
+    for symbol, price in prices.items():
+        entries = rule_entries.get(symbol)
+        values = indicators.get(symbol)
+        if not entries or values is None:
+            continue
+        for entry in entries:
+            i = at.get(entry["ordinal"])
+            fired_rank = PRECEDENCE[hits[i][1]] if i is not None else len(KINDS)
+            namespace = collections.ChainMap({"ltp": price}, entry["context"], values)
+            for kind in KINDS[:fired_rank]:
+                rule = entry["rules"].get(kind)
+                if rule is not None and rule(namespace):
+                    if i is None:
+                        hits.append((entry, kind, price))
+                        added = True
+                    else:
+                        hits[i] = (entry, kind, price)
+                    break
+    if added:
+        hits.sort(key=lambda hit: hit[0]["ordinal"])
+    return hits
+
+
+class _SymbolLevels:
+    """Sorted (level, ordinal) keys per kind, with the entries in the same order."""
+
+    def __init__(self):
+        self.keys = {BUY: [], SELL: [], STOP: []}
+        self.entries = {BUY: [], SELL: [], STOP: []}
+
+    def add(self, entry):
+        for kind, level in entry["levels"].items():
+            if level is None:
+                continue
+            key = (level, entry["ordinal"])
+            i = bisect.bisect(self.keys[kind], key)
+            self.keys[kind].insert(i, key)
+            self.entries[kind].insert(i, entry)
+
+    def remove(self, entry):
+        for kind, level in entry["levels"].items():
+            if level is None:
+                continue
+            key = (level, entry["ordinal"])
+            i = bisect.bisect_left(self.keys[kind], key)
+            if i < len(self.keys[kind]) and self.keys[kind][i] == key:
+                del self.keys[kind][i]
+                del self.entries[kind][i]
+
+    @property
+    def empty(self):
+        return not any(self.keys.values())
+
+    def at_or_above(self, kind, price):
+        # Levels >= price: BUY/STOP levels the price is at or below
+        return self.entries[kind][bisect.bisect_left(self.keys[kind], (price, -1)):]
+
+    def at_or_below(self, kind, price):
+        # Levels <= price: SELL levels the price has reached
+        return self.entries[kind][:bisect.bisect_right(self.keys[kind], (price, float("inf")))]
+
+    def falling_through(self, kind, new, old):
+        # new <= level < old
+        keys = self.keys[kind]
+        return self.entries[kind][bisect.bisect_left(keys, (new, -1)):bisect.bisect_left(keys, (old, -1))]
+
+    def rising_through(self, kind, old, new):
+        # old < level <= new
+        keys = self.keys[kind]
+        return self.entries[kind][bisect.bisect_right(keys, (old, float("inf"))):
+                                  bisect.bisect_right(keys, (new, float("inf")))]
+
+
+USER_SLOT = 1_000_000   # Ordinal = user position * USER_SLOT + stock position
+
+
+def config_digest(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class TriggerIndex:
+    def __init__(self, users=None):
+        """`users` is user_strategies["users"]: {user_id: {"stocks": {symbol: config}}}."""
+        self.by_symbol = {}
+        self.size = 0
+        self.user_entries = {}   # user_id -> its entries, for patching one user in place
+        self.user_digest = {}    # user_id -> config_digest of what is indexed
+        self.user_pos = {}       # user_id -> position, keeps output in strategy-file order
+        self.next_pos = 0        # Removed users give their position up; a returning one goes last
+        self.version = 0         # Bumped on every change, for views built from the index
+        self.rule_entries = {}   # symbol -> entries with buy/sell/stop rules
+        if users:
+            self.sync(users)
+
+    def set_user(self, user_id, user_config, digest=None):
+        """Replace one user's triggers. Returns the symbols whose levels changed."""
+        digest = digest or (config_digest(user_config) if user_config else None)
+        if digest is not None and self.user_digest.get(user_id) == digest:
+            return set()  # Already indexed as-is
+        if not user_config:
+            return self.remove_user(user_id)
+        touched = self._unindex(user_id)
+        pos = self.user_pos.get(user_id)
+        if pos is None:
+            pos = self.user_pos[user_id] = self.next_pos
+            self.next_pos += 1
+        entries = []
+        for stock_pos, (symbol, stock_config) in enumerate((user_config.get("stocks", {}) or {}).items()):
+            entry = build_entry(pos * USER_SLOT + stock_pos, user_id, symbol, stock_config)
+            if entry is None:
+                continue
+            for error in entry["rule_errors"]:
+                print(f"⚠️  {user_id[:8]}... {symbol}: ignoring {error}")
+            self.by_symbol.setdefault(symbol, _SymbolLevels()).add(entry)
+            if entry["rules"]:
+                self.rule_entries.setdefault(symbol, []).append(entry)
+            entries.append(entry)
+            touched.add(symbol)
+        self.user_entries[user_id] = entries
+        self.user_digest[user_id] = digest
+        self.size += len(entries)
+        self.version += 1
+        return touched
+
+    def remove_user(self, user_id):
+        self.user_pos.pop(user_id, None)
+        return self._unindex(user_id)
+
+    def _unindex(self, user_id):
+        entries = self.user_entries.pop(user_id, [])
+        self.user_digest.pop(user_id, None)
+        for entry in entries:
+            symbol = entry["symbol"]
+            if entry["rules"]:
+                ruled = [e for e in self.rule_entries[symbol] if e is not entry]
+                if ruled:
+                    self.rule_entries[symbol] = ruled
+                else:
+                    del self.rule_entries[symbol]
+            levels = self.by_symbol[symbol]
+            levels.remove(entry)
+            if levels.empty and symbol not in self.rule_entries:
+                del self.by_symbol[symbol]
+        self.size -= len(entries)
+        if entries:
+            self.version += 1
+        return {entry["symbol"] for entry in entries}
+
+    def sync(self, users):
+        """Patch the index to match a freshly parsed users dict, re-indexing only
+        users whose config digest changed. Returns (added, changed, removed, touched symbols)."""
+        added, changed, touched = [], [], set()
+        for user_id, user_config in users.items():
+            digest = config_digest(user_config)
+            old = self.user_digest.get(user_id)
+            if old == digest:
+                continue
+            (changed if old is not None else added).append(user_id)
+            touched |= self.set_user(user_id, user_config, digest)
+        removed = [user_id for user_id in self.user_entries if user_id not in users]
+        for user_id in removed:
+            touched |= self.remove_user(user_id)
+        return added, changed, removed, touched
+
+    def __len__(self):
+        return self.size
+
+    def entries(self):
+        return [entry for entries in self.user_entries.values() for entry in entries]
+
+    @property
+    def symbols(self):
+        return self.by_symbol.keys()
+
+    def fired(self, symbol, price):
+        levels = self.by_symbol.get(symbol)
+        if levels is None:
+            return []
+        taken = set()
+        hits = []
+        for kind, entries in ((BUY, levels.at_or_above(BUY, price)),
+                              (SELL, levels.at_or_below(SELL, price)),
+                              (STOP, levels.at_or_above(STOP, price))):
+            for entry in entries:
+                if entry["ordinal"] not in taken:
+                    taken.add(entry["ordinal"])
+                    hits.append((entry, kind))
+        return hits
+
+    def crossed(self, symbol, old, new):
+        """Triggers whose level the price passed through going from `old` to `new`
+        (falling through a BUY/STOP level, rising through a SELL level)."""
+        levels = self.by_symbol.get(symbol)
+        if levels is None or old == new:
+            return []
+        if new < old:
+            return [(e, kind) for kind in (BUY, STOP) for e in levels.falling_through(kind, new, old)]
+        return [(e, SELL) for e in levels.rising_through(SELL, old, new)]
+
+    def evaluate(self, prices, indicators=None):
+        """`prices` maps symbol -> current LTP, `indicators` symbol -> indicator values
+        (only needed for symbols in rule_entries). Hits come back in strategy-file order."""
+        hits = []
+        for symbol, price in prices.items():
+            if symbol in self.by_symbol:
+                hits.extend((entry, kind, price) for entry, kind in self.fired(symbol, price))
+        hits.sort(key=lambda hit: hit[0]["ordinal"])
+        return apply_rules(hits, self.rule_entries, prices, indicators)
+
+
+def make_signal(entry, kind, price):
+    """Executor signal and its legacy counterpart, exactly as the engine has always written them."""
+    level = entry["levels"][kind]
+    level_hit = level is not None and (price >= level if kind == SELL else price <= level)
+    rule = entry.get("rules", {}).get(kind)
+    if rule is not None and not level_hit:
+        reason = f"{kind} rule hit: {rule.text} @ {price}"
+        qty = entry["purchase_qty"] if kind == BUY else entry["selling_qty"]
+    elif kind == BUY:
+        reason = f"Buy trigger hit: {price} <= {entry['buy_trigger']}"
+        qty = entry["purchase_qty"]
+    elif kind == SELL:
+        reason = f"Target reached: {price} >= {entry['sell_trigger']}"
+        qty = entry["selling_qty"]
+    else:
+        reason = f"STOP LOSS TRIGGERED: {price} <= {entry['stop_loss']}"
+        qty = entry["selling_qty"]
+
+    if kind == STOP:
+        # Force market sell
+        min_qty, order_type, partial_fill = qty, "MARKET", False
+    else:
+        partial_fill = entry["partial_fill_enabled"]
+        min_qty = entry["min_fill_qty"] if partial_fill else qty
+        order_type = entry["order_type"]
+
+    action = BUY if kind == BUY else SELL
+    signal = {
+        "user_id": entry["user_id"],
+        "symbol": entry["symbol"],
+        "action": action,
+        "price": round(price, 2),
+        "qty": qty,
+        "min_qty": min_qty,
+        "order_type": order_type,
+        "partial_fill": partial_fill,
+        "reason": reason,
+        "timestamp": datetime.now().isoformat()
+    }
+    legacy = {
+        "symbol": entry["symbol"],
+        "action": action,
+        "price": round(price, 2),
+        "qty": qty,
+        "reason": reason
+    }
+    return signal, legacy
+
+
+ARMED = "armed"
+FIRED = "fired"
+COOLDOWN = "cooldown"
+
+
+class TriggerLatches:
+    """Edge-triggering on top of the level rules, per (user, symbol, trigger).
+
+    armed -> fired        the trigger hits: its signal goes out once
+    fired -> cooldown     the price leaves the hysteresis band around the level
+                          (above level * (1 + hysteresis) for BUY/STOP, below
+                          level * (1 - hysteresis) for SELL) before `cooldown` seconds
+    fired/cooldown -> armed  out of the band (at any point) and `cooldown` elapsed;
+                          a price back in range then fires again
+    A trigger whose level changed in the strategy file starts armed. A trigger
+    only leaves `fired` on an evaluation where it did not hit, so one fired by
+    its rule alone (it has no band) waits for the rule to evaluate false before
+    its cooldown can re-arm it: a rule that stays true fires once. Only
+    latched triggers are stored; they are saved to `path` on every change and
+    dropped when a new trading day starts.
+
+    filter() only holds back what it admits: the caller commit()s once the
+    signals are durable, so a crash in between re-fires them after a restart
+    instead of leaving them latched and never sent."""
+
+    def __init__(self, path, hysteresis=0.005, cooldown=120):
+        self.path = Path(path) if path else None
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.day = datetime.now().strftime("%Y-%m-%d")
+        self.latches = {}    # symbol -> {(user_id, kind): {"state", "level", "fired_at", "price"}}
+        self.pending = {}    # Same shape: admitted by the last filter(), not yet committed
+        self.suppressed = 0
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("day") != self.day:
+            return  # Yesterday's latches don't carry over
+        for key, latch in (data.get("latches") or {}).items():
+            user_id, symbol, kind = key.split("|", 2)
+            self.latches.setdefault(symbol, {})[(user_id, kind)] = latch
+
+    def save(self):
+        if not self.dirty or self.path is None:
+            return
+        flat = {f"{user_id}|{symbol}|{kind}": latch
+                for symbol, latches in self.latches.items() for (user_id, kind), latch in latches.items()}
+        if atomic_write_json(self.path, {"day": self.day, "latches": flat}, retries=3):
+            self.dirty = False
+
+    def _out_of_band(self, kind, level, price):
+        if level is None:
+            return True  # Rule-only trigger: no level to leave, only its rule has to stop holding
+        if kind == SELL:
+            return price < level * (1 - self.hysteresis)
+        return price > level * (1 + self.hysteresis)
+
+    def _rearm(self, symbol, price, now, hit_rank):
+        latches = self.latches.get(symbol)
+        if not latches:
+            return
+        for key, latch in list(latches.items()):
+            # A hit of the same or an earlier kind means this one still holds (or was not checked)
+            held = hit_rank.get((symbol, key[0]), len(KINDS)) <= PRECEDENCE[key[1]]
+            if latch["state"] == FIRED and not held and self._out_of_band(key[1], latch["level"], price):
+                latch["state"] = COOLDOWN
+                self.dirty = True
+            if latch["state"] == COOLDOWN and now - latch["fired_at"] >= self.cooldown:
+                del latches[key]
+                self.dirty = True
+        if not latches:
+            del self.latches[symbol]
+
+    def filter(self, hits, prices, now):
+        """`hits` as returned by TriggerIndex.evaluate, `prices` the symbols it was given."""
+        day = datetime.now().strftime("%Y-%m-%d")
+        if day != self.day:
+            self.day, self.latches, self.dirty = day, {}, True
+        hit_rank = {(entry["symbol"], entry["user_id"]): PRECEDENCE[kind] for entry, kind, _ in hits}
+        for symbol, price in prices.items():
+            self._rearm(symbol, price, now, hit_rank)
+
+        self.pending = {}    # Whatever the last filter() admitted was never committed: let it fire again
+        admitted = []
+        for entry, kind, price in hits:
+            symbol = entry["symbol"]
+            key = (entry["user_id"], kind)
+            level = entry["levels"][kind]
+            latch = self.latches.get(symbol, {}).get(key)
+            if latch is not None and latch["level"] == level:
+                self.suppressed += 1
+                continue
+            self.pending.setdefault(symbol, {})[key] = {"state": FIRED, "level": level,
+                                                        "fired_at": now, "price": price}
+            admitted.append((entry, kind, price))
+        return admitted
+
+    def commit(self):
+        """Latch the triggers the last filter() admitted, once their signals are queued, and save."""
+        for symbol, latches in self.pending.items():
+            self.latches.setdefault(symbol, {}).update(latches)
+            self.dirty = True
+        self.pending = {}
+        self.save()
+
+    def stats(self):
+        latched = sum(len(latches) for latches in self.latches.values())
+        return {"latched": latched, "suppressed": self.suppressed}
@@ -0,0 +1,309 @@
+# signal_shards.py
+# Spreads trigger evaluation over N worker processes, each owning a partition of the users.
+# Exports:
+#  - ShardPool(n, mode="index")
+#      .set_users({user_id: config | None})   route new/changed/removed users to their shard
+#      .evaluate(prices, indicators=None) -> [(entry, kind, price)]   all shards' hits, in strategy-file order
+#      .stats(reset=False) -> [per-shard dict], .close()
+#  - shard_of(user_id, n) -> int             stable crc32 partition
+#
+# The coordinator (3_signal_engine.py with SIGNAL_SHARDS > 1) keeps reading the
+# feed, the strategies file and the indicators. Each tick it broadcasts the
+# changed prices (plus indicator values for symbols with rule triggers) to
+# every worker at once, then collects their hits and merges them, so the
+# workers evaluate in parallel while latching, signal files and history stay in
+# one place. Workers are separate interpreters started as
+#   python signal_shards.py --worker <shard>
+# and connect back over multiprocessing.connection, so the engine script is not
+# re-imported in them. A worker that exits or stays silent for CONNECT_TIMEOUT
+# while starting raises RuntimeError; one that does not answer a tick within
+# EVAL_TIMEOUT (or whose connection is lost) is restarted, and skipped for that
+# tick if the restart does not come up or answer either. Every eval carries a
+# tick number that the reply echoes, so a late reply to a skipped tick is
+# dropped instead of being read as the next tick's hits.
+#
+# Users land on shard_of(user_id). When users are added and one shard ends up
+# with more than REBALANCE_SLACK x the average trigger rows, users move from
+# the heaviest shard to the lightest until it fits; those placements stick.
+
+import os
+import select
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from multiprocessing.connection import Client, Connection, answer_challenge, deliver_challenge
+from pathlib import Path
+
+from signal_rules import USER_SLOT, TriggerIndex
+
+REBALANCE_SLACK = 1.25
+CONNECT_TIMEOUT = 30
+EVAL_TIMEOUT = 10        # A shard silent this long on a tick is restarted
+
+
+def shard_of(user_id, n):
+    return zlib.crc32(str(user_id).encode("utf-8")) % n
+
+
+def _rows(config):
+    return len((config or {}).get("stocks", {}) or {})
+
+
+class _Shard:
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.proc = None
+        self.conn = None
+        self.users = {}          # user_id -> config, to re-seed a restarted worker
+        self.rows = 0
+        self.evals = 0
+        self.eval_seconds = 0.0
+        self.max_seconds = 0.0
+        self.skipped = 0         # Ticks this shard missed (no reply even after a restart)
+
+
+class ShardPool:
+    def __init__(self, n, mode="index"):
+        self.n = n
+        self.mode = mode
+        self.authkey = os.urandom(16)
+        # A plain socket rather than multiprocessing's Listener, so accepting can time out
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(n)
+        self.shards = [_Shard(i) for i in range(n)]
+        self.assignment = {}     # user_id -> shard id
+        self.user_pos = {}       # user_id -> position, for the merged order
+        self.next_pos = 0        # Removed users give their position up; a returning one goes last
+        self.rebalances = 0
+        self.tick = 0            # Numbers each eval broadcast; replies echo it
+        try:
+            for shard in self.shards:
+                self._start(shard)
+        except Exception:
+            self.close()
+            raise
+
+    # ---------- worker lifecycle ----------
+    def _accept(self, timeout):
+        """An authenticated connection, or None if nobody connected within `timeout`."""
+        if not select.select([self.listener], [], [], max(timeout, 0))[0]:
+            return None
+        sock, _ = self.listener.accept()
+        sock.setblocking(True)  # Connection expects a blocking descriptor
+        try:
+            conn = Connection(sock.detach())
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+            return conn
+        except Exception:
+            return None
+
+    def _start(self, shard):
+        env = dict(os.environ, SIGNAL_SHARD_ADDRESS="%s:%d" % self.listener.getsockname(),
+                   SIGNAL_SHARD_AUTHKEY=self.authkey.hex(), SIGNAL_EVAL_MODE=self.mode)
+        shard.proc = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "--worker", str(shard.shard_id)],
+                                      env=env)
+        deadline = time.time() + CONNECT_TIMEOUT
+        while True:
+            code = shard.proc.poll()
+            if code is not None:
+                raise RuntimeError(f"shard {shard.shard_id} exited with code {code} before connecting")
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                shard.proc.kill()
+                raise RuntimeError(f"shard {shard.shard_id} did not connect within {CONNECT_TIMEOUT}s")
+            conn = self._accept(min(remaining, 0.5))
+            if conn is None:
+                continue
+            if conn.poll(min(remaining, 5)) and conn.recv() == ("hello", shard.shard_id):
+                shard.conn = conn
+                break
+            conn.close()  # A worker from an earlier, abandoned start
+        if shard.users:
+            shard.conn.send(("users", dict(shard.users)))
+
+    def _restart(self, shard, error):
+        print(f"⚠️  Shard {shard.shard_id} lost ({error}), restarting with {len(shard.users)} users")
+        for stop in (shard.conn.close, shard.proc.kill):
+            try:
+                stop()
+            except Exception:
+                pass
+        self._start(shard)
+
+    def close(self):
+        for shard in self.shards:
+            if shard.proc is None:
+                continue
+            try:
+                shard.conn.send(("stop",))
+                shard.proc.wait(timeout=5)
+            except Exception:
+                shard.proc.kill()
+        self.listener.close()
+
+    # ---------- routing ----------
+    def _send(self, shard, message):
+        try:
+            shard.conn.send(message)
+        except (OSError, EOFError) as e:
+            self._restart(shard, e)
+            shard.conn.send(message)
+
+    def set_users(self, updates):
+        """Apply {user_id: config or None}; returns the number of users moved by a rebalance."""
+        per_shard = {}
+        added = False
+        for user_id, config in updates.items():
+            shard_id = self.assignment.get(user_id)
+            if shard_id is None:
+                if not config:
+                    continue
+                shard_id = self.assignment[user_id] = shard_of(user_id, self.n)
+                self.user_pos[user_id] = self.next_pos
+                self.next_pos += 1
+                added = True
+            shard = self.shards[shard_id]
+            shard.rows -= _rows(shard.users.get(user_id))
+            if config:
+                shard.users[user_id] = config
+                shard.rows += _rows(config)
+            else:
+                shard.users.pop(user_id, None)
+                del self.assignment[user_id]
+                del self.user_pos[user_id]
+            per_shard.setdefault(shard_id, {})[user_id] = config
+        for shard_id, batch in per_shard.items():
+            self._send(self.shards[shard_id], ("users", batch))
+        return self._rebalance() if added else 0
+
+    def _rebalance(self):
+        mean = sum(s.rows for s in self.shards) / self.n
+        moved = 0
+        while mean:
+            heavy = max(self.shards, key=lambda s: s.rows)
+            light = min(self.shards, key=lambda s: s.rows)
+            if heavy.rows <= mean * REBALANCE_SLACK:
+                break
+            # Largest user that still leaves the light shard below the heavy one
+            gap = heavy.rows - light.rows
+            best = None
+            for uid, cfg in heavy.users.items():
+                rows = _rows(cfg)
+                if 0 < rows < gap and (best is None or rows > best[0]):
+                    best = (rows, uid)
+            if best is None:
+                break
+            rows, user_id = best
+            config = heavy.users.pop(user_id)
+            heavy.rows -= rows
+            light.users[user_id] = config
+            light.rows += rows
+            self.assignment[user_id] = light.shard_id
+            self._send(heavy, ("users", {user_id: None}))
+            self._send(light, ("users", {user_id: config}))
+            moved += 1
+        if moved:
+            self.rebalances += 1
+        return moved
+
+    # ---------- evaluation ----------
+    def _recv_hits(self, shard, tick):
+        """This tick's reply from `shard`, skipping late replies to earlier ticks."""
+        deadline = time.time() + EVAL_TIMEOUT
+        while True:
+            if not shard.conn.poll(max(deadline - time.time(), 0)):
+                raise TimeoutError(f"no reply in {EVAL_TIMEOUT}s")
+            _, reply_tick, shard_hits, seconds = shard.conn.recv()
+            if reply_tick == tick:
+                return shard_hits, seconds
+
+    def evaluate(self, prices, indicators=None):
+        self.tick += 1
+        message = ("eval", self.tick, prices, indicators)
+        sent = []
+        for shard in self.shards:
+            try:
+                self._send(shard, message)
+            except (OSError, EOFError, RuntimeError) as e:
+                # Lost, and the restart did not come up: its users are not evaluated this tick
+                print(f"⚠️  Shard {shard.shard_id} skipped this tick: {e}")
+                shard.skipped += 1
+                continue
+            sent.append(shard)
+        hits = []
+        for shard in sent:
+            try:
+                shard_hits, seconds = self._recv_hits(shard, self.tick)
+            except (OSError, EOFError) as e:
+                try:
+                    self._restart(shard, e)
+                    shard.conn.send(message)
+                    shard_hits, seconds = self._recv_hits(shard, self.tick)
+                except (OSError, EOFError, RuntimeError) as e:
+                    # Its users are not evaluated this tick; the next tick tries again
+                    print(f"⚠️  Shard {shard.shard_id} skipped this tick: {e}")
+                    shard.skipped += 1
+                    continue
+            shard.evals += 1
+            shard.eval_seconds += seconds
+            shard.max_seconds = max(shard.max_seconds, seconds)
+            hits.extend(shard_hits)
+        hits.sort(key=lambda hit: (self.user_pos.get(hit[0]["user_id"], 0), hit[0]["ordinal"] % USER_SLOT))
+        return hits
+
+    def stats(self, reset=False):
+        out = []
+        for shard in self.shards:
+            out.append({"shard": shard.shard_id, "users": len(shard.users), "rows": shard.rows,
+                        "evals": shard.evals,
+                        "avg_ms": round(shard.eval_seconds / shard.evals * 1000, 3) if shard.evals else 0.0,
+                        "max_ms": round(shard.max_seconds * 1000, 3), "skipped": shard.skipped})
+            if reset:
+                shard.evals, shard.eval_seconds, shard.max_seconds = 0, 0.0, 0.0
+        return out
+
+
+# ==================== WORKER ====================
+def run_worker(shard_id):
+    host, port = os.environ["SIGNAL_SHARD_ADDRESS"].rsplit(":", 1)
+    conn = Client((host, int(port)), authkey=bytes.fromhex(os.environ["SIGNAL_SHARD_AUTHKEY"]))
+    conn.send(("hello", shard_id))
+    index = TriggerIndex()
+    vector_book = None
+    use_numpy = os.environ.get("SIGNAL_EVAL_MODE") == "numpy"
+    if use_numpy:
+        from signal_vector import VectorTriggerBook
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break  # Coordinator went away
+        op = message[0]
+        if op == "users":
+            for user_id, config in message[1].items():
+                index.set_user(user_id, config)
+        elif op == "eval":
+            started = time.perf_counter()
+            _, tick, prices, indicators = message
+            if use_numpy:
+                if vector_book is None or vector_book.version != index.version:
+                    vector_book = VectorTriggerBook(index)
+                hits = vector_book.evaluate(prices, indicators)
+            else:
+                hits = index.evaluate(prices, indicators)
+            conn.send(("hits", tick, hits, time.perf_counter() - started))
+        elif op == "stop":
+            break
+    conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "--worker":
+        print("Started by 3_signal_engine.py (SIGNAL_SHARDS > 1): python signal_shards.py --worker <shard>")
+        sys.exit(1)
+    run_worker(int(sys.argv[2]))
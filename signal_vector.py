@@ -0,0 +1,185 @@
+# signal_vector.py
+# Columnar (numpy) evaluation of the signal_rules trigger rules, for large strategy books.
+# Exports:
+#  - HAVE_NUMPY
+#  - VectorTriggerBook(index)               packs a signal_rules.TriggerIndex into arrays
+#      .evaluate(prices, indicators=None) -> [(entry, kind, price)]   same hits, same order as TriggerIndex.evaluate
+#      .version                                      index version it was built from
+#  - benchmark(users, stocks_per_user, symbols, ticks, seed=7) -> timing dict
+#
+# One row per indexed entry, grouped by symbol id so a tick's rows are a few
+# contiguous slices:
+#   sym_id (int32), ordinal (int64), buy / sell / stop (float64, NaN = unset)
+# A tick gathers its prices into a vector by symbol id, compares every row at
+# once with the BUY > SELL > STOP precedence, and only the hit rows are turned
+# back into (entry, kind, price); make_signal then builds the exact same dicts
+# as the scalar path. Rule triggers (buy_rule/...) are few and go through
+# signal_rules.apply_rules, as in the index.
+#
+# Benchmark against the scalar index:
+#   python signal_vector.py --users 2000 --stocks 10 --symbols 300 --ticks 200
+
+import argparse
+import random
+import time
+
+from signal_rules import BUY, SELL, STOP, TriggerIndex, apply_rules, make_signal
+
+try:
+    import numpy as np
+except ImportError:  # Optional: the engine keeps the scalar TriggerIndex path
+    np = None
+
+HAVE_NUMPY = np is not None
+KINDS = (BUY, SELL, STOP)
+
+
+class VectorTriggerBook:
+    def __init__(self, index):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        self.version = index.version
+        self.rule_entries = {symbol: list(entries) for symbol, entries in index.rule_entries.items()}
+        entries = sorted(index.entries(), key=lambda e: (e["symbol"], e["ordinal"]))
+        self.entries = entries
+        self.symbol_ids = {}
+        starts, ends = [], []
+        for row, entry in enumerate(entries):
+            sym_id = self.symbol_ids.get(entry["symbol"])
+            if sym_id is None:
+                sym_id = self.symbol_ids[entry["symbol"]] = len(starts)
+                starts.append(row)
+                ends.append(row)
+            ends[sym_id] = row + 1
+        self.slices = [(start, end) for start, end in zip(starts, ends)]
+
+        nan = float("nan")
+        self.sym_id = np.array([self.symbol_ids[e["symbol"]] for e in entries], dtype=np.int32)
+        self.ordinal = np.array([e["ordinal"] for e in entries], dtype=np.int64)
+        self.levels = {kind: np.array([nan if e["levels"][kind] is None else e["levels"][kind] for e in entries],
+                                      dtype=np.float64)
+                       for kind in KINDS}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _rows(self, prices):
+        """Row ids of the symbols in `prices`, and the price vector indexed by symbol id."""
+        px = np.full(len(self.slices), np.nan)
+        ranges = []
+        for symbol, price in prices.items():
+            sym_id = self.symbol_ids.get(symbol)
+            if sym_id is not None:
+                px[sym_id] = price
+                ranges.append(self.slices[sym_id])
+        if len(ranges) == len(self.slices):
+            return np.arange(len(self.entries)), px
+        if not ranges:
+            return np.empty(0, dtype=np.int64), px
+        return np.concatenate([np.arange(start, end) for start, end in ranges]), px
+
+    def evaluate(self, prices, indicators=None):
+        return apply_rules(self._level_hits(prices), self.rule_entries, prices, indicators)
+
+    def _level_hits(self, prices):
+        rows, px = self._rows(prices)
+        if not len(rows):
+            return []
+        price = px[self.sym_id[rows]]
+        # NaN levels compare False, so unset triggers never fire
+        buy = price <= self.levels[BUY][rows]
+        sell = (price >= self.levels[SELL][rows]) & ~buy
+        stop = (price <= self.levels[STOP][rows]) & ~buy & ~sell
+        hit = np.nonzero(buy | sell | stop)[0]
+        if not len(hit):
+            return []
+        hit = hit[np.argsort(self.ordinal[rows[hit]], kind="stable")]  # Strategy-file order
+        hits = []
+        for row, is_buy, is_sell in zip(rows[hit].tolist(), buy[hit].tolist(), sell[hit].tolist()):
+            entry = self.entries[row]
+            hits.append((entry, BUY if is_buy else SELL if is_sell else STOP, prices[entry["symbol"]]))
+        return hits
+
+
+# ==================== BENCHMARK ====================
+def _random_users(users, stocks_per_user, symbols, rng):
+    names = [f"SYM{i:03d}" for i in range(symbols)]
+    bases = {s: 100.0 + (i * 37) % 400 for i, s in enumerate(names)}
+    book = {}
+    for u in range(users):
+        stocks = {}
+        for symbol in rng.sample(names, min(stocks_per_user, symbols)):
+            base = bases[symbol]
+            stocks[symbol] = {
+                "purchase_qty": rng.choice([10, 20, 50]),
+                "selling_qty": rng.choice([10, 20, 50]),
+                "order_type": rng.choice(["LIMIT", "MARKET"]),
+                "triggers": {"buy_trigger": round(base * rng.uniform(0.88, 0.99), 2) if rng.random() < 0.8 else 0,
+                             "sell_trigger": round(base * rng.uniform(1.01, 1.12), 2) if rng.random() < 0.8 else 0,
+                             "stop_loss": round(base * rng.uniform(0.80, 0.90), 2) if rng.random() < 0.6 else 0,
+                             "partial_fill_enabled": rng.random() < 0.5, "min_fill_qty": None}}
+        book[f"user{u:05d}"] = {"stocks": stocks}
+    return book, names, bases
+
+
+def _comparable(hits):
+    out = []
+    for entry, kind, price in hits:
+        signal, legacy = make_signal(entry, kind, price)
+        signal.pop("timestamp")
+        out.append((signal, legacy))
+    return out
+
+
+def benchmark(users, stocks_per_user, symbols, ticks, seed=7):
+    rng = random.Random(seed)
+    book, names, bases = _random_users(users, stocks_per_user, symbols, rng)
+    started = time.perf_counter()
+    index = TriggerIndex(book)
+    index_build = time.perf_counter() - started
+    started = time.perf_counter()
+    vector = VectorTriggerBook(index)
+    vector_build = time.perf_counter() - started
+
+    # Prices wander within +-8% of each symbol's base: a full sweep every 10th
+    # tick, otherwise ~5% of symbols move
+    ltp = dict(bases)
+    ticks_prices = []
+    for t in range(ticks):
+        moved = names if t % 10 == 0 else rng.sample(names, max(1, symbols // 20))
+        for s in moved:
+            step = ltp[s] * rng.uniform(0.99, 1.01)
+            ltp[s] = round(min(max(step, bases[s] * 0.92), bases[s] * 1.08), 1)
+        ticks_prices.append({s: ltp[s] for s in moved})
+
+    timings = {}
+    results = {}
+    for name, evaluate in (("scalar", index.evaluate), ("numpy", vector.evaluate)):
+        started = time.perf_counter()
+        tick_hits = [evaluate(prices) for prices in ticks_prices]
+        timings[name] = time.perf_counter() - started
+        results[name] = tick_hits
+
+    identical = all(_comparable(a) == _comparable(b) for a, b in zip(results["scalar"], results["numpy"]))
+    return {"rows": len(index), "ticks": ticks, "hits": sum(len(h) for h in results["scalar"]),
+            "identical": identical, "index_build": index_build, "vector_build": vector_build,
+            "scalar": timings["scalar"], "numpy": timings["numpy"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scalar vs numpy trigger evaluation")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--stocks", type=int, default=10, help="Stocks per user")
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+    if not HAVE_NUMPY:
+        parser.error("numpy is not installed")
+
+    r = benchmark(args.users, args.stocks, args.symbols, args.ticks)
+    print(f"{r['rows']:,} trigger rows, {r['ticks']} ticks, {r['hits']:,} hits | identical output: {r['identical']}")
+    print(f"  build   scalar index {r['index_build'] * 1000:8.1f}ms | numpy book {r['vector_build'] * 1000:8.1f}ms")
+    for name in ("scalar", "numpy"):
+        print(f"  {name:7} {r[name] * 1000:8.1f}ms total | {r[name] / r['ticks'] * 1e6:8.1f}us/tick")
+    if not r["identical"]:
+        raise SystemExit(1)
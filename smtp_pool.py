@@ -0,0 +1,184 @@
+# smtp_pool.py
+# Authenticated SMTP sessions kept open and shared by every order sent from this process.
+# Exports:
+#  - SMTPPool(max_sessions=4, noop_after=30, idle_close=240, timeout=20)
+#      .send(message, server, port, sender, password, starttls=True) -> {"handshake_ms", "send_ms", "reused", "retried"}
+#      .stats(reset=False) -> {"sender@server:port": {...}}, .close()
+#  - smtp_pool                                  the process-wide pool (closed at exit)
+#
+# Sessions are keyed by (server, port, sender). A send takes an idle session of
+# that key (or opens one: connect + STARTTLS + login, up to max_sessions at once,
+# else waits for one to come back), so concurrent orders each get their own
+# connection and never interleave on one. A session idle for noop_after seconds
+# is NOOP-checked before use; one idle for idle_close is quit instead (servers
+# drop those anyway). If a reused session turns out to be dead mid-send, the
+# message is sent once more on a fresh session; a failure on a fresh session,
+# including SMTPAuthenticationError, is raised to the caller.
+
+import atexit
+import smtplib
+import threading
+import time
+
+RETRYABLE = (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, ConnectionError, OSError)
+
+
+class _Session:
+    __slots__ = ("smtp", "last_used")
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.last_used = time.time()
+
+
+class _KeyStats:
+    __slots__ = ("handshakes", "handshake_seconds", "sends", "send_seconds", "max_send", "reused",
+                 "reconnects", "noops", "failures")
+
+    def __init__(self):
+        self.handshakes = self.sends = self.reused = self.reconnects = self.noops = self.failures = 0
+        self.handshake_seconds = self.send_seconds = self.max_send = 0.0
+
+
+def _quit(smtp):
+    try:
+        smtp.quit()
+    except Exception:
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+
+class SMTPPool:
+    def __init__(self, max_sessions=4, noop_after=30, idle_close=240, timeout=20):
+        self.max_sessions = max_sessions
+        self.noop_after = noop_after
+        self.idle_close = idle_close
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.idle = {}       # key -> [_Session], most recently used last
+        self.open = {}       # key -> sessions open (idle + in use)
+        self.key_stats = {}
+
+    # ---------- sessions ----------
+    def _connect(self, key, password, starttls):
+        server, port, sender = key
+        started = time.perf_counter()
+        smtp = smtplib.SMTP(server, port, timeout=self.timeout)
+        try:
+            if starttls:
+                smtp.starttls()
+            if password:
+                smtp.login(sender, password)
+        except Exception:
+            _quit(smtp)
+            raise
+        stats = self.key_stats[key]
+        stats.handshakes += 1
+        stats.handshake_seconds += time.perf_counter() - started
+        return _Session(smtp), time.perf_counter() - started
+
+    def _acquire(self, key):
+        """An idle session that answers, or None when the caller may open a new one."""
+        with self.cond:
+            stats = self.key_stats.setdefault(key, _KeyStats())
+            while True:
+                idle = self.idle.setdefault(key, [])
+                if idle:
+                    session = idle.pop()
+                    break
+                if self.open.get(key, 0) < self.max_sessions:
+                    self.open[key] = self.open.get(key, 0) + 1
+                    return None
+                self.cond.wait()
+        age = time.time() - session.last_used
+        if age < self.noop_after:
+            return session
+        if age < self.idle_close:
+            try:
+                stats.noops += 1
+                if session.smtp.noop()[0] == 250:
+                    return session
+            except Exception:
+                pass
+        _quit(session.smtp)
+        return None  # Its slot is reused by the new connection
+
+    def _release(self, key, session):
+        with self.cond:
+            if session is None:
+                self.open[key] -= 1
+            else:
+                session.last_used = time.time()
+                self.idle[key].append(session)
+            self.cond.notify()
+
+    # ---------- sending ----------
+    def send(self, message, server, port, sender, password, starttls=True):
+        key = (server, int(port), sender)
+        session = self._acquire(key)
+        stats = self.key_stats[key]
+        handshake = 0.0
+        reused = session is not None
+        retried = False
+        try:
+            if session is None:
+                session, handshake = self._connect(key, password, starttls)
+            started = time.perf_counter()
+            try:
+                session.smtp.send_message(message)
+            except (smtplib.SMTPAuthenticationError, TimeoutError):
+                raise  # A slow server may still deliver: resending could duplicate the order
+            except RETRYABLE as e:
+                if not reused or (isinstance(e, smtplib.SMTPResponseException) and e.smtp_code != 421):
+                    raise
+                # The server dropped a kept-alive session: send once more on a fresh one
+                _quit(session.smtp)
+                session = None
+                stats.reconnects += 1
+                retried = True
+                session, handshake = self._connect(key, password, starttls)
+                started = time.perf_counter()
+                session.smtp.send_message(message)
+            elapsed = time.perf_counter() - started
+        except Exception:
+            stats.failures += 1
+            if session is not None:
+                _quit(session.smtp)
+            self._release(key, None)
+            raise
+        stats.sends += 1
+        stats.reused += reused and not retried
+        stats.send_seconds += elapsed
+        stats.max_send = max(stats.max_send, elapsed)
+        self._release(key, session)
+        return {"handshake_ms": round(handshake * 1000, 1), "send_ms": round(elapsed * 1000, 1),
+                "reused": reused and not retried, "retried": retried}
+
+    def stats(self, reset=False):
+        out = {}
+        with self.cond:
+            for (server, port, sender), s in self.key_stats.items():
+                out[f"{sender}@{server}:{port}"] = {
+                    "open": self.open.get((server, port, sender), 0), "sends": s.sends, "reused": s.reused,
+                    "handshakes": s.handshakes, "reconnects": s.reconnects, "noops": s.noops, "failures": s.failures,
+                    "handshake_avg_ms": round(s.handshake_seconds / s.handshakes * 1000, 1) if s.handshakes else 0.0,
+                    "send_avg_ms": round(s.send_seconds / s.sends * 1000, 1) if s.sends else 0.0,
+                    "send_max_ms": round(s.max_send * 1000, 1)}
+                if reset:
+                    self.key_stats[(server, port, sender)] = _KeyStats()
+        return out
+
+    def close(self):
+        with self.cond:
+            sessions = [session for idle in self.idle.values() for session in idle]
+            for key, idle in self.idle.items():
+                self.open[key] -= len(idle)
+                idle.clear()
+        for session in sessions:
+            _quit(session.smtp)
+
+
+smtp_pool = SMTPPool()
+atexit.register(smtp_pool.close)
@@ -0,0 +1,5 @@
+# Tests import the top-level modules (market_shm, signal_queue, ...) from the repo root
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
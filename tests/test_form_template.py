@@ -0,0 +1,99 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import order_utils
+from order_utils import (calculate_price_ranges, english_to_nepali_date, english_to_nepali_time,
+                         generate_filled_form, load_form_template, to_nepali_number, user_form_template)
+
+
+def replace_pass_form(template, signal, user_profile, serial_number):
+    """What generate_filled_form did before the template was compiled: one str.replace per field."""
+    personal = user_profile.get('personal_info', {})
+    trading = user_profile.get('trading_defaults', {})
+    signature_info = user_profile.get('signature', {})
+    dt = datetime.fromtimestamp(signal['timestamp'])
+    prices = calculate_price_ranges(signal['price'], user_profile)
+    replacements = {
+        '{{SERIAL_NUMBER}}': to_nepali_number(serial_number),
+        '{{DATE_NEPALI}}': english_to_nepali_date(dt.strftime("%Y-%m-%d")),
+        '{{TIME_NEPALI}}': english_to_nepali_time(dt.strftime("%H:%M:%S")),
+        '{{DAYS_TO_EXECUTE}}': trading.get('days_to_execute', '७'),
+        '{{COMPANY_NAME}}': signal['symbol'].upper(),
+        '{{SECURITY_TYPE}}': trading.get('security_type', 'साधारण शेयर'),
+        '{{QUANTITY}}': to_nepali_number(signal['qty']),
+        '{{ACTION_PRICE}}': f"{signal['action'].upper()} @ रु.{signal['price']}",
+        '{{SIGNATURE}}': signature_info.get('signature_text', ''),
+        '{{FULL_NAME}}': personal.get('full_name', ''),
+        '{{ADDRESS}}': personal.get('address', ''),
+        '{{FATHER_NAME}}': personal.get('father_name', ''),
+        '{{SPOUSE_GP_NAME}}': personal.get('spouse_or_grandfather_name', ''),
+        '{{CITIZENSHIP_PAN}}': personal.get('citizenship_or_pan', ''),
+        '{{DATE_OF_BIRTH}}': personal.get('date_of_birth', ''),
+        '{{ISSUE_PLACE}}': personal.get('issue_place', ''),
+        '{{MOBILE_NUMBER}}': personal.get('mobile_number', ''),
+        '{{PHONE_NUMBER}}': personal.get('phone_number', ''),
+        '{{CLIENT_CODE}}': personal.get('client_code', ''),
+        '{{FIXED_PRICE}}': to_nepali_number(prices['fixed']),
+        '{{MIN_MAX_PRICE}}': to_nepali_number(prices['min_max']),
+        '{{BROKER_DISCRETION_PRICE}}': to_nepali_number(prices['broker'])
+    }
+    for placeholder, value in replacements.items():
+        template = template.replace(placeholder, str(value))
+    return template
+
+
+@pytest.fixture
+def template_file(tmp_path, monkeypatch):
+    path = tmp_path / "form_template.html"
+    monkeypatch.setattr(order_utils, "FORM_TEMPLATE_PATH", path)
+    monkeypatch.setattr(order_utils, "_template_cache", {"stat": None, "compiled": None})
+    return path
+
+
+@pytest.mark.parametrize("profile", ["shipped", "empty"])
+def test_compiled_template_matches_the_replace_passes_byte_for_byte(profile):
+    shipped = order_utils.FORM_TEMPLATE_PATH.read_text(encoding="utf-8")
+    user_profile = json.loads(order_utils.USER_PROFILE_PATH.read_text(encoding="utf-8")) if profile == "shipped" else {}
+    for serial, signal in enumerate([
+        {"symbol": "nabil", "action": "buy", "price": 512.3, "qty": 10, "timestamp": 1760000000},
+        {"symbol": "NICA", "action": "SELL", "price": 401, "qty": 250, "timestamp": 1760050000.5},
+    ], start=41):
+        html, _ = generate_filled_form(signal, user_profile, serial)
+        expected = replace_pass_form(shipped, signal, user_profile, serial)
+        assert html.encode("utf-8") == expected.encode("utf-8")
+
+
+def test_template_and_bound_profiles_are_rebuilt_when_the_file_changes(template_file):
+    template_file.write_text("<p>{{FULL_NAME}} {{COMPANY_NAME}}</p>", encoding="utf-8")
+    first = load_form_template()
+    assert load_form_template() is first
+    bound = user_form_template({"personal_info": {"full_name": "Ram"}})
+    assert bound.render({"COMPANY_NAME": "NABIL"}) == "<p>Ram NABIL</p>"
+    assert user_form_template({"personal_info": {"full_name": "Ram"}}) is bound
+
+    # Same size, newer mtime
+    template_file.write_text("<b>{{FULL_NAME}} {{COMPANY_NAME}}</b>", encoding="utf-8")
+    st = template_file.stat()
+    os.utime(template_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    second = load_form_template()
+    assert second is not first
+    assert user_form_template({"personal_info": {"full_name": "Ram"}}).render({"COMPANY_NAME": "NABIL"}) == \
+        "<b>Ram NABIL</b>"
+
+    # Different size, mtime restored to the old value
+    template_file.write_text("<div>{{FULL_NAME}} / {{COMPANY_NAME}}</div>", encoding="utf-8")
+    os.utime(template_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert load_form_template() is not second
+    assert user_form_template({"personal_info": {"full_name": "Ram"}}).render({"COMPANY_NAME": "NABIL"}) == \
+        "<div>Ram / NABIL</div>"
+
+
+def test_bound_profile_cache_stays_capped(template_file):
+    template_file.write_text("{{FULL_NAME}}:{{COMPANY_NAME}}", encoding="utf-8")
+    for i in range(order_utils.BOUND_TEMPLATES_MAX * 2 + 5):
+        bound = user_form_template({"personal_info": {"full_name": f"user{i}"}})
+        assert bound.render({"COMPANY_NAME": "HDL"}) == f"user{i}:HDL"
+        assert len(load_form_template().bound) <= order_utils.BOUND_TEMPLATES_MAX
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+import pytest
+
+from indicators import IndicatorBook
+
+
+def test_ema_is_none_until_period_bars_then_seeded_with_their_mean():
+    book = IndicatorBook(bar_seconds=60, ema_periods=(3,))
+    start = datetime(2026, 3, 2, 11, 0).timestamp()
+    seen = []
+    # One tick per one-minute bar; the sixth only closes the fifth bar
+    for i, close in enumerate([100.0, 102.0, 104.0, 110.0, 108.0, 108.0]):
+        book.update("NABIL", close, 1000 + i, start + i * 60)
+        seen.append(book.values("NABIL")["ema3"])
+
+    assert seen[:3] == [None, None, None]  # Bars close on the next bar's first tick
+    assert seen[3] == pytest.approx(102.0)  # Mean of the first three closes
+    assert seen[4] == pytest.approx(102.0 + 0.5 * (110.0 - 102.0))
+    assert seen[5] == pytest.approx(106.0 + 0.5 * (108.0 - 106.0))
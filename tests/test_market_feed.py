@@ -0,0 +1,26 @@
+import json
+import os
+
+from market_feed import SNAPSHOT_NAME, MarketFeedReader
+
+
+def write_snapshot(path, stocks, timestamp):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"timestamp": timestamp, "stocks": stocks}))
+    os.replace(tmp, path)
+
+
+def test_legacy_snapshot_is_reloaded_only_when_rewritten(tmp_path):
+    snapshot = tmp_path / SNAPSHOT_NAME
+    write_snapshot(snapshot, {"NABIL": {"ltp": 500}, "NICA": {"ltp": 400}}, "10:00:00")
+    reader = MarketFeedReader(tmp_path)
+
+    assert reader.poll() == {"NABIL", "NICA"}
+    assert reader.poll() is None  # No market_seq.json: must not report the same snapshot again
+    assert reader.poll() is None
+
+    write_snapshot(snapshot, {"NABIL": {"ltp": 505}, "NICA": {"ltp": 400}}, "10:00:03")
+    assert reader.poll() == {"NABIL"}
+    assert reader.payload()["stocks"]["NABIL"] == {"ltp": 505}
+    assert reader.timestamp == "10:00:03"
+    assert reader.poll() is None
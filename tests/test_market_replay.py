@@ -0,0 +1,33 @@
+import os
+import time
+
+from market_feed import PARENT_SHARED_DIR, REPO_SHARED_DIR, shared_dir
+from market_replay import Pacer, live_target
+
+
+def test_pacer_compresses_long_gaps():
+    pacer = Pacer(100, max_gap=2)
+    overnight = 18 * 3600 * 1000
+    started = time.perf_counter()
+    for ts_ms in (0, 1000, 2000, 2000 + overnight, 3000 + overnight):
+        pacer.wait(ts_ms)
+    # 1s + 1s + 2s (capped) + 1s of recorded time at 100x
+    assert time.perf_counter() - started < 0.5
+    assert pacer.gaps == 1
+    assert pacer.skipped_ms == overnight - 2000
+
+
+def test_live_target_covers_every_default_shared_dir_of_the_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert live_target(PARENT_SHARED_DIR)                 # Engine and API (the shared/ next to the repo)
+    assert live_target(REPO_SHARED_DIR)                   # Executors / order_utils
+    assert live_target(os.path.relpath(PARENT_SHARED_DIR))  # e.g. --shared-dir ../shared
+    assert live_target("shared")                           # The scraper's, relative to where it runs
+    assert not live_target(tmp_path / "shared_replay")
+
+
+def test_shared_dir_override_points_consumers_at_the_replay(tmp_path, monkeypatch):
+    monkeypatch.delenv("SHARED_DIR", raising=False)
+    assert shared_dir(PARENT_SHARED_DIR) == PARENT_SHARED_DIR
+    monkeypatch.setenv("SHARED_DIR", str(tmp_path / "shared_replay"))
+    assert shared_dir(PARENT_SHARED_DIR) == (tmp_path / "shared_replay").resolve()
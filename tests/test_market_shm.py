@@ -0,0 +1,102 @@
+import struct
+import threading
+
+import market_shm
+from market_feed import MarketFeedReader, MarketPublisher
+from market_shm import HEARTBEAT_OFFSET, MarketShmReader, MarketShmWriter
+
+
+def entry(ltp):
+    return {"ltp": ltp, "close": ltp, "volume": ltp, "pct_change": 0.0}
+
+
+def test_reader_rebuilds_symbol_table_after_writer_restart(tmp_path):
+    path = tmp_path / "market_shm.bin"
+    writer = MarketShmWriter(path, max_symbols=8)
+    writer.write({"A": entry(1), "B": entry(2)}, 1)
+    reader = MarketShmReader(path)
+    assert reader.poll() == {"A", "B"}
+
+    # Same file reused; ids are handed out again in arrival order
+    writer.close()
+    writer = MarketShmWriter(path, max_symbols=8)
+    writer.write({"B": entry(20), "A": entry(10)}, 2)
+
+    assert reader.poll() == {"A", "B"}
+    assert reader.stocks["A"]["ltp"] == 10
+    assert reader.stocks["B"]["ltp"] == 20
+    writer.close()
+
+
+def test_seqlock_reader_never_sees_a_torn_record(tmp_path):
+    path = tmp_path / "market_shm.bin"
+    writer = MarketShmWriter(path, max_symbols=64)
+    symbols = [f"S{i}" for i in range(64)]
+    writer.write({s: entry(0) for s in symbols}, 1)
+    reader = MarketShmReader(path)
+    stop = threading.Event()
+
+    def write_loop():
+        i = 1
+        while not stop.is_set():
+            writer.write({s: entry(i) for s in symbols}, i + 1)
+            i += 1
+
+    thread = threading.Thread(target=write_loop)
+    thread.start()
+    try:
+        for _ in range(2000):
+            reader.poll()
+            values = {(v["ltp"], v["close"], v["volume"]) for v in reader.stocks.values()}
+            # One write updates every symbol: a consistent copy has a single value everywhere
+            assert len(values) == 1
+            ltp, close, volume = values.pop()
+            assert ltp == close == volume
+    finally:
+        stop.set()
+        thread.join()
+        writer.close()
+
+
+def test_stale_segment_falls_back_to_json_feed(tmp_path, monkeypatch):
+    monkeypatch.setattr(market_shm, "INODE_CHECK_INTERVAL", 0)
+    publisher = MarketPublisher(tmp_path)
+    publisher.publish("t1", {"A": entry(5)}, {"A": entry(5)})
+    writer = MarketShmWriter(tmp_path / market_shm.SHM_NAME, max_symbols=8)
+    writer.write({"A": entry(1)}, 1)
+
+    reader = MarketShmReader(tmp_path / market_shm.SHM_NAME, fallback=MarketFeedReader(tmp_path))
+    reader.poll()
+    assert reader.attached and reader.stocks["A"]["ltp"] == 1
+
+    # Writer silent for longer than SHM_STALE_SECONDS: the JSON feed takes over
+    struct.pack_into("<d", writer.buf, HEARTBEAT_OFFSET, 1.0)
+    assert reader.poll() == {"A"}
+    assert not reader.attached and reader.stocks["A"]["ltp"] == 5
+
+    # Alive again: back on shared memory
+    writer.write({"A": entry(7)}, 2)
+    reader.poll()
+    assert reader.attached and reader.stocks["A"]["ltp"] == 7
+
+    # A clean writer shutdown hands over immediately
+    writer.close()
+    reader.poll()
+    assert not reader.attached and reader.stocks["A"]["ltp"] == 5
+
+
+def test_counter_left_odd_by_a_dead_writer_falls_back_instead_of_spinning(tmp_path, monkeypatch):
+    monkeypatch.setattr(market_shm, "SEQLOCK_RETRY_SECONDS", 0.05)
+    publisher = MarketPublisher(tmp_path)
+    publisher.publish("t1", {"A": entry(5)}, {"A": entry(5)})
+    writer = MarketShmWriter(tmp_path / market_shm.SHM_NAME, max_symbols=8)
+    writer.write({"A": entry(1)}, 1)
+    reader = MarketShmReader(tmp_path / market_shm.SHM_NAME, fallback=MarketFeedReader(tmp_path))
+    reader.poll()
+    assert reader.attached and reader.stocks["A"]["ltp"] == 1
+
+    # Killed between _begin() and _end(): the heartbeat is still fresh, the counter stays odd
+    writer._begin()
+    assert reader.poll() == {"A"}
+    assert not reader.attached and reader.stocks["A"]["ltp"] == 5
+    writer.close()
@@ -0,0 +1,146 @@
+import importlib.util
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+EXECUTOR = Path(__file__).resolve().parent.parent / "4_order_executor_B.py"
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    # Loaded from a copy so its log folder is created under tmp_path, not in the repo
+    script = shutil.copy(EXECUTOR, tmp_path / "order_executor.py")
+    spec = importlib.util.spec_from_file_location("order_executor", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "SHARED", tmp_path / "shared")
+    return module
+
+
+class FakeBroker:
+    """Stands in for execute_order: each signal's "mode" says how the send goes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = []          # offsets in the order their sends started
+        self.finished = set()
+        self.release = threading.Event()
+
+    def execute_order(self, driver, signal, logger):
+        with self.lock:
+            self.sent.append(signal["queue_offset"])
+        try:
+            mode = signal["mode"]
+            if mode == "slow":
+                time.sleep(0.3)
+            elif mode == "hang":
+                self.release.wait(10)
+            elif mode == "raise":
+                raise ConnectionError("smtp down")
+            return mode != "fail"
+        finally:
+            with self.lock:
+                self.finished.add(signal["queue_offset"])
+
+
+class RecordingQueue:
+    def __init__(self, broker, given_up=()):
+        self.broker = broker
+        self.given_up = set(given_up)  # Reported without finishing: timed out or skipped
+        self.commits = []
+
+    def commit(self, consumer, offset):
+        with self.broker.lock:
+            # Only a finished prefix of the batch may be committed
+            assert all(seq in self.broker.finished or seq in self.given_up for seq in range(1, offset + 1))
+        self.commits.append(offset)
+
+
+def make_batch(orders):
+    return [(seq, {"user_id": user, "symbol": symbol, "action": "BUY", "mode": mode})
+            for seq, (user, symbol, mode) in enumerate(orders, start=1)]
+
+
+def test_chains_keep_queue_order_and_commit_only_finished_prefixes(executor, monkeypatch):
+    broker = FakeBroker()
+    monkeypatch.setattr(executor, "execute_order", broker.execute_order)
+    batch = make_batch([
+        ("u1", "NABIL", "slow"), ("u2", "NICA", "raise"), ("u1", "NABIL", "fast"),
+        ("u1", "HDL", "fail"), ("u2", "NICA", "fast"), ("u1", "NABIL", "slow"), ("u2", "HDL", "fast"),
+    ])
+    queue = RecordingQueue(broker)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        processed, failed = executor.dispatch_batch(batch, queue, pool, lambda: None)
+
+    sent = broker.sent
+    assert sent.index(1) < sent.index(3) < sent.index(6)  # u1/NABIL in queue order
+    assert sent.index(2) < sent.index(5)                  # u2/NICA continues after an exception
+    assert sorted(s["queue_offset"] for s in processed) == [1, 3, 5, 6, 7]
+    assert {s["queue_offset"]: s["error"] for s in failed} == {2: "smtp down", 4: "failed to send"}
+    assert queue.commits == sorted(queue.commits) and queue.commits[-1] == 7
+    assert sorted(p.name.split("_")[0] for p in (executor.SHARED).glob("*/*.json")) == ["done", "failed"]
+
+
+def test_timeout_reports_the_order_and_skips_the_rest_of_its_chain_without_sending_them(executor, monkeypatch):
+    broker = FakeBroker()
+    monkeypatch.setattr(executor, "execute_order", broker.execute_order)
+    monkeypatch.setattr(executor, "ORDER_TIMEOUT", 0.3)
+    batch = make_batch([("u1", "NABIL", "hang"), ("u2", "NICA", "fast"), ("u1", "NABIL", "fast"),
+                        ("u1", "NABIL", "fast"), ("u2", "NICA", "fast")])
+    queue = RecordingQueue(broker, given_up=(1, 3, 4))
+    pool = ThreadPoolExecutor(max_workers=4)
+    try:
+        processed, failed = executor.dispatch_batch(batch, queue, pool, lambda: None)
+    finally:
+        broker.release.set()
+        pool.shutdown(wait=True)
+
+    assert sorted(s["queue_offset"] for s in processed) == [2, 5]
+    errors = {s["queue_offset"]: s["error"] for s in failed}
+    assert errors[1].startswith("timed out")
+    assert errors[3] == errors[4] == "skipped: an earlier order for this symbol timed out"
+    assert 3 not in broker.sent and 4 not in broker.sent  # Reported skipped, so never sent
+    assert queue.commits[-1] == 5
+
+
+def test_send_that_finishes_while_the_timeout_scan_holds_the_lock_is_not_timed_out(executor, monkeypatch):
+    broker = FakeBroker()
+    returned = threading.Event()
+
+    def slow_send(driver, signal, logger):
+        ok = broker.execute_order(driver, signal, logger)
+        if signal["queue_offset"] == 1:
+            returned.set()
+        return ok
+
+    class LateWorkerLock:
+        """The worker that just finished offset 1 only gets the lock after the next timeout scans."""
+
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.delayed = False
+
+        def __enter__(self):
+            if returned.is_set() and not self.delayed and threading.current_thread() is not threading.main_thread():
+                self.delayed = True
+                time.sleep(1.2)
+            self.lock.acquire()
+
+        def __exit__(self, *exc):
+            self.lock.release()
+
+    monkeypatch.setattr(executor, "execute_order", slow_send)
+    monkeypatch.setattr(executor, "ORDER_TIMEOUT", 0.1)
+    monkeypatch.setattr(executor, "threading", SimpleNamespace(Lock=LateWorkerLock))
+    batch = make_batch([("u1", "NABIL", "slow"), ("u1", "NABIL", "fast")])
+    queue = RecordingQueue(broker)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        processed, failed = executor.dispatch_batch(batch, queue, pool, lambda: None)
+
+    assert sorted(s["queue_offset"] for s in processed) == [1, 2]
+    assert failed == [] and broker.sent == [1, 2]
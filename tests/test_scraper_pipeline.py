@@ -0,0 +1,53 @@
+from scraper_pipeline import StageQueue, coalesce_capture, coalesce_publish
+
+
+def capture(label, *rows):
+    return {"now_full": label, "now_short": label, "label": label,
+            "rows": [{"sym": sym, "ltp": ltp, "vol": vol, **({"src": src} if src else {})}
+                     for sym, ltp, vol, src in rows]}
+
+
+def test_full_capture_queue_merges_jobs_keeping_the_latest_row_per_symbol():
+    queue = StageQueue("diff", 1, coalesce_capture)
+    queue.put(capture("t1", ("NABIL", 500, 10, None), ("NICA", 400, 5, None)))
+    queue.put(capture("t2", ("NABIL", 501, 11, None), ("HDL", 900, 1, None)))
+    queue.put(capture("t3", ("NABIL", 499, 12, None)))
+
+    job = queue.get()
+    assert job["label"] == "t3" and queue.stats()["coalesced"] == 2
+    assert {r["sym"]: r["ltp"] for r in job["rows"]} == {"NABIL": 499, "NICA": 400, "HDL": 900}
+
+
+def test_capture_coalescing_keeps_the_further_along_broker_row():
+    broker_a, broker_b = object(), object()
+    older = capture("t1", ("NABIL", 500, 100, broker_a))
+    job = coalesce_capture(older, capture("t2", ("NABIL", 495, 90, broker_b)))
+    assert job["rows"][0]["ltp"] == 500  # broker_b lags on volume
+    job = coalesce_capture(job, capture("t3", ("NABIL", 502, 95, broker_a)))
+    assert job["rows"][0]["ltp"] == 502  # Same broker: newest wins
+
+
+def publish(label, changed, moves_rows=(), full_rows=(), moves=None):
+    return {"now_full": label, "moves_rows": list(moves_rows), "full_rows": list(full_rows),
+            "moves": moves, "changed": changed, "stocks": {**changed, "label": label}}
+
+
+def test_publish_coalescing_keeps_the_newest_snapshot_and_every_move_row():
+    queue = StageQueue("publish", 1, coalesce_publish)
+    queue.put(publish("t1", {"NABIL": 500, "NICA": 400}, moves_rows=["m1"], moves=["NABIL up"]))
+    queue.put(publish("t2", {"NABIL": 501}, moves_rows=["m2"], full_rows=["f2"]))
+    queue.put(publish("t3", {"HDL": 900}, moves_rows=["m3"]))
+
+    job = queue.get()
+    assert job["now_full"] == "t3" and job["stocks"]["label"] == "t3"
+    assert job["changed"] == {"NABIL": 501, "NICA": 400, "HDL": 900}
+    assert job["moves_rows"] == ["m1", "m2", "m3"]
+    assert job["full_rows"] == ["f2"] and job["moves"] == ["NABIL up"]
+
+
+def test_stage_without_coalesce_drops_when_full_and_get_returns_none_once_closed():
+    queue = StageQueue("notify", 1)
+    assert queue.put("a") and not queue.put("b")
+    queue.close()
+    assert queue.get() == "a" and queue.get() is None
+    assert queue.stats()["dropped"] == 1
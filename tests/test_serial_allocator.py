@@ -0,0 +1,50 @@
+import multiprocessing
+
+from serial_allocator import SerialAllocator
+
+
+def _take(path, owner, count, out):
+    allocator = SerialAllocator(path, block_size=7, owner=owner)
+    serials = [allocator.next() for _ in range(count)]
+    allocator.close()
+    out.put(serials)
+
+
+def test_serials_are_unique_across_processes(tmp_path):
+    path = str(tmp_path / "serials.db")
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=_take, args=(path, f"executor_{i}", 50, out)) for i in range(4)]
+    for p in procs:
+        p.start()
+    results = [out.get(timeout=60) for _ in procs]
+    for p in procs:
+        p.join(timeout=10)
+
+    serials = [s for r in results for s in r]
+    assert len(serials) == len(set(serials)) == 200
+    assert min(serials) >= 888888
+    for r in results:
+        assert r == sorted(r)
+
+
+def test_unused_tail_is_reported_and_never_reissued(tmp_path):
+    path = tmp_path / "serials.db"
+    first = SerialAllocator(path, block_size=10, start=1000, owner="A")
+    assert [first.next() for _ in range(3)] == [1000, 1001, 1002]
+    first.close()
+
+    second = SerialAllocator(path, block_size=10, owner="B")
+    assert second.next() == 1010
+    assert second.gaps() == [{"first": 1003, "last": 1009, "count": 7, "reason": "released", "owner": "A",
+                              "pid": second.pid, "reserved_at": second.gaps()[0]["reserved_at"]}]
+    assert second.status()["open"] == 1
+    second.close()
+
+
+def test_legacy_counter_is_continued(tmp_path):
+    legacy = tmp_path / "last_serial.txt"
+    legacy.write_text("900123\n")
+    allocator = SerialAllocator(tmp_path / "serials.db", legacy_file=legacy)
+    assert allocator.next() == 900124
+    allocator.close()
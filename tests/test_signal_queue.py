@@ -0,0 +1,65 @@
+from signal_queue import SignalQueue
+
+
+def signal(n):
+    return {"action": "BUY", "symbol": f"S{n}", "price": 100 + n, "qty": 10, "user_id": "u1"}
+
+
+def test_consumers_commit_independently_and_replay_after_seek(tmp_path):
+    queue = SignalQueue(tmp_path / "signal_queue.db")
+    try:
+        queue.append([signal(0)])
+        assert queue.register("executor_A") == 1            # "latest": skips what was already there
+        assert queue.register("executor_B", start="earliest") == 0
+        last = queue.append([signal(1), signal(2), signal(3)])
+        assert last == 4 == queue.head()
+
+        batch = queue.read("executor_A")
+        assert [s["symbol"] for _, s in batch] == ["S1", "S2", "S3"]
+        queue.commit("executor_A", batch[0][0])
+        # Not committed yet: a restarted consumer gets the in-flight signals again
+        assert [seq for seq, _ in queue.read("executor_A")] == [3, 4]
+        queue.commit("executor_A", 4)
+        queue.commit("executor_A", 2)  # Commits only move forward
+        assert queue.read("executor_A") == []
+        assert queue.consumers()["executor_A"]["lag"] == 0
+
+        # executor_B is unaffected by A's commits
+        assert [seq for seq, _ in queue.read("executor_B", limit=2)] == [1, 2]
+        assert queue.consumers()["executor_B"]["lag"] == 4
+
+        queue.seek("executor_A", 2)
+        assert [s["symbol"] for _, s in queue.read("executor_A")] == ["S2", "S3"]
+        assert queue.register("executor_A") == 2  # An existing offset is kept
+    finally:
+        queue.close()
+
+
+def test_wait_returns_new_signals_or_empty_on_timeout(tmp_path):
+    queue = SignalQueue(tmp_path / "signal_queue.db", poll_interval=0.01)
+    try:
+        queue.register("executor_A")
+        assert queue.wait("executor_A", timeout=0.05) == []
+        queue.append([signal(7)])
+        assert [s["symbol"] for _, s in queue.wait("executor_A", timeout=1)] == ["S7"]
+    finally:
+        queue.close()
+
+
+def test_replay_request_is_applied_once(tmp_path):
+    queue = SignalQueue(tmp_path / "signal_queue.db")
+    try:
+        queue.register("executor_A")
+        queue.append([signal(n) for n in range(5)])
+        assert queue.replay("executor_A", 2)
+        queue.commit("executor_A", 5)
+        # Restarted with SIGNAL_REPLAY_FROM=2 still set: no second rewind
+        assert not queue.replay("executor_A", 2)
+        assert queue.read("executor_A") == []
+        # A new request, or an explicit seek, still rewinds
+        assert queue.replay("executor_A", 3)
+        assert [seq for seq, _ in queue.read("executor_A")] == [4, 5]
+        queue.seek("executor_A", 2)
+        assert len(queue.read("executor_A")) == 3
+    finally:
+        queue.close()
@@ -0,0 +1,143 @@
+import json
+import random
+
+from signal_rules import BUY, SELL, STOP, TriggerIndex, TriggerLatches
+from signal_vector import _random_users
+
+
+def user(buy=0, sell=0, stop=0, **rules):
+    return {"stocks": {"NABIL": {"purchase_qty": 10, "selling_qty": 10,
+                                 "triggers": {"buy_trigger": buy, "sell_trigger": sell, "stop_loss": stop, **rules}}}}
+
+
+def kinds(hits):
+    return [(entry["user_id"], kind) for entry, kind, *_ in hits]
+
+
+def test_crossed_finds_levels_passed_through_on_both_sides():
+    index = TriggerIndex({"u1": user(buy=100, sell=120, stop=90), "u2": user(buy=95, sell=110)})
+    # Falling: BUY/STOP levels in [new, old)
+    assert sorted(kinds(index.crossed("NABIL", 101, 95))) == [("u1", BUY), ("u2", BUY)]
+    assert sorted(kinds(index.crossed("NABIL", 100, 89))) == [("u1", STOP), ("u2", BUY)]
+    assert kinds(index.crossed("NABIL", 95, 95)) == []
+    # Rising: SELL levels in (old, new]
+    assert kinds(index.crossed("NABIL", 109, 110)) == [("u2", SELL)]
+    assert kinds(index.crossed("NABIL", 110, 119.9)) == []
+    assert sorted(kinds(index.crossed("NABIL", 105, 125))) == [("u1", SELL), ("u2", SELL)]
+    assert index.crossed("NICA", 100, 50) == []
+
+
+def test_evaluate_keeps_precedence_and_strategy_file_order():
+    index = TriggerIndex({"u1": user(buy=100, stop=90), "u2": user(sell=80), "u3": user(stop=95)})
+    # BUY beats STOP for u1; SELL only fires upwards
+    assert kinds(index.evaluate({"NABIL": 85})) == [("u1", BUY), ("u2", SELL), ("u3", STOP)]
+    assert kinds(index.evaluate({"NABIL": 97})) == [("u1", BUY), ("u2", SELL)]
+    assert index.evaluate({"NICA": 1}) == []
+
+
+def test_latches_are_only_persisted_once_committed(tmp_path):
+    path = tmp_path / "latches.json"
+    index = TriggerIndex({"u1": user(buy=100)})
+    latches = TriggerLatches(path, cooldown=60)
+    prices = {"NABIL": 99.0}
+    assert [kind for _, kind, _ in latches.filter(index.evaluate(prices), prices, 0)] == [BUY]
+
+    # The queue append failed: nothing was saved, and the next evaluation fires again
+    assert TriggerLatches(path).stats()["latched"] == 0
+    assert len(latches.filter(index.evaluate(prices), prices, 1)) == 1
+    latches.commit()
+    assert latches.filter(index.evaluate(prices), prices, 2) == []
+    assert TriggerLatches(path).stats()["latched"] == 1
+
+
+def test_rule_only_trigger_that_stays_true_fires_once_until_the_rule_turns_false():
+    index = TriggerIndex({"u1": user(buy_rule="rsi < 30")})
+    latches = TriggerLatches(None, cooldown=60)
+    prices = {"NABIL": 500.0}
+
+    def fire(rsi, now):
+        admitted = latches.filter(index.evaluate(prices, {"NABIL": {"rsi": rsi}}), prices, now)
+        latches.commit()
+        return [kind for _, kind, _ in admitted]
+
+    assert fire(25, 0) == [BUY]
+    assert fire(25, 120) == [] and fire(20, 600) == []  # Still oversold: past the cooldown, no repeat
+    assert fire(40, 601) == []                          # Rule false, cooldown long over: re-armed
+    assert fire(25, 602) == [BUY]
+
+
+def test_removed_user_fires_nothing_until_added_back():
+    index = TriggerIndex({"u1": user(buy=100), "u2": user(buy=100)})
+    assert index.remove_user("u1") == {"NABIL"}
+    assert kinds(index.evaluate({"NABIL": 99})) == [("u2", BUY)] and len(index) == 1
+    assert index.remove_user("u1") == set()
+    index.set_user("u1", user(buy=100))
+    assert kinds(index.evaluate({"NABIL": 99})) == [("u2", BUY), ("u1", BUY)] and len(index) == 2
+    # Removing the last trigger on a symbol drops the symbol
+    index.remove_user("u1")
+    index.remove_user("u2")
+    assert list(index.symbols) == [] and index.evaluate({"NABIL": 99}) == []
+
+
+def test_incremental_updates_match_a_full_rebuild():
+    rng = random.Random(4)
+    book, names, bases = _random_users(40, 5, 15, rng)
+    index = TriggerIndex(book)
+    version = index.version
+    assert index.sync(book) == ([], [], [], set()) and index.version == version  # Nothing changed
+
+    for step in range(30):
+        user_id = rng.choice(sorted(book))
+        if step % 5 == 0:
+            book.pop(user_id)
+            assert index.sync(book)[2] == [user_id]
+        else:
+            config = json.loads(json.dumps(book[user_id]))
+            symbol = rng.choice(sorted(config["stocks"]))
+            config["stocks"][symbol]["triggers"]["buy_trigger"] = round(bases[symbol] * rng.uniform(0.9, 1.0), 2)
+            book[user_id] = config
+            index.set_user(user_id, config)
+        prices = {s: round(bases[s] * rng.uniform(0.85, 1.15), 1) for s in names}
+        rebuilt = TriggerIndex(book)
+        assert [(e["user_id"], e["symbol"], kind) for e, kind, _ in index.evaluate(prices)] == \
+            [(e["user_id"], e["symbol"], kind) for e, kind, _ in rebuilt.evaluate(prices)]
+        assert len(index) == len(rebuilt) and set(index.symbols) == set(rebuilt.symbols)
+
+
+def test_latch_rearms_only_after_leaving_the_band_and_the_cooldown(tmp_path):
+    index = TriggerIndex({"u1": user(buy=100, sell=120)})
+    latches = TriggerLatches(tmp_path / "latches.json", hysteresis=0.01, cooldown=60)
+
+    def fire(price, now):
+        prices = {"NABIL": price}
+        admitted = latches.filter(index.evaluate(prices), prices, now)
+        latches.commit()
+        return kinds(admitted)
+
+    assert fire(99, 0) == [("u1", BUY)]
+    assert fire(99, 100) == []          # Held below the level: no repeat
+    assert fire(100.5, 110) == []       # Inside the 1% band: still fired
+    assert fire(99, 120) == []
+    assert fire(101.5, 130) == []       # Left the band after the cooldown: re-armed
+    assert fire(99, 131) == [("u1", BUY)]
+
+    assert fire(102, 140) == []         # Left the band, but within the cooldown
+    assert fire(99, 150) == []
+    assert latches.stats()["latched"] == 1
+
+    # Restarted engine: the cooldown state comes back from disk
+    latches = TriggerLatches(tmp_path / "latches.json", hysteresis=0.01, cooldown=60)
+    assert latches.stats()["latched"] == 1
+    assert fire(99, 160) == []
+    assert fire(99, 191) == [("u1", BUY)]  # Cooldown over; it already left the band
+    assert fire(121, 192) == [("u1", SELL)]  # Other trigger kinds latch separately
+
+
+def test_changed_level_starts_armed():
+    index = TriggerIndex({"u1": user(buy=100)})
+    latches = TriggerLatches(None, cooldown=60)
+    prices = {"NABIL": 99}
+    assert len(latches.filter(index.evaluate(prices), prices, 0)) == 1
+    latches.commit()
+    index.set_user("u1", user(buy=99.5))
+    assert kinds(latches.filter(index.evaluate(prices), prices, 1)) == [("u1", BUY)]
@@ -0,0 +1,163 @@
+import random
+import sys
+import time
+
+import pytest
+
+import signal_shards
+from signal_rules import TriggerIndex
+from signal_shards import ShardPool
+from signal_vector import _random_users
+
+
+def comparable(hits):
+    return [(entry["user_id"], entry["symbol"], kind, price) for entry, kind, price in hits]
+
+
+def test_merged_hits_match_a_single_index_across_restart_and_rebalance():
+    rng = random.Random(3)
+    book, names, bases = _random_users(60, 6, 40, rng)
+    pool = ShardPool(3)
+    try:
+        pool.set_users(book)
+        index = TriggerIndex(book)
+        for tick in range(30):
+            prices = {s: round(bases[s] * rng.uniform(0.85, 1.15), 1) for s in rng.sample(names, 15)}
+            if tick == 10:
+                pool.shards[1].proc.kill()  # Restarted transparently on this tick
+                pool.shards[1].proc.wait()
+            assert comparable(pool.evaluate(prices)) == comparable(index.evaluate(prices))
+
+        # One heavy user lands on a shard: the others take users until it fits the slack
+        heavy = {"stocks": {s: book["user00000"]["stocks"][next(iter(book["user00000"]["stocks"]))]
+                            for s in names}}
+        moved = pool.set_users({"whale": heavy})
+        rows = [s["rows"] for s in pool.stats()]
+        assert moved > 0
+        assert max(rows) <= sum(rows) / len(rows) * signal_shards.REBALANCE_SLACK or \
+            max(rows) == len(names)  # Only the whale itself is left on its shard
+        index.set_user("whale", heavy)
+        prices = {s: bases[s] * 0.8 for s in names}
+        assert comparable(pool.evaluate(prices)) == comparable(index.evaluate(prices))
+    finally:
+        pool.close()
+
+
+def fake_worker(tmp_path, body):
+    script = tmp_path / "worker.sh"
+    script.write_text("#!/bin/sh\n" + body + "\n")
+    script.chmod(0o755)
+    return str(script)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a shell script as the worker interpreter")
+def test_worker_that_exits_before_connecting_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr(signal_shards.sys, "executable", fake_worker(tmp_path, "exit 3"))
+    started = time.time()
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        ShardPool(1)
+    assert time.time() - started < 5
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a shell script as the worker interpreter")
+def test_worker_that_never_connects_times_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(signal_shards, "CONNECT_TIMEOUT", 1)
+    monkeypatch.setattr(signal_shards.sys, "executable", fake_worker(tmp_path, "exec sleep 60"))
+    started = time.time()
+    with pytest.raises(RuntimeError, match="did not connect"):
+        ShardPool(1)
+    assert time.time() - started < 3
+
+
+def test_shard_that_cannot_be_restarted_is_skipped_for_the_tick(monkeypatch):
+    rng = random.Random(5)
+    book, names, bases = _random_users(30, 4, 20, rng)
+    pool = ShardPool(2)
+    try:
+        pool.set_users(book)
+        index = TriggerIndex(book)
+        prices = {s: bases[s] * 0.8 for s in names}
+        lost = pool.shards[1]
+        lost.proc.kill()
+        lost.proc.wait()
+        lost.conn.close()  # The broadcast send fails, and so does the restart
+
+        def fail_start(shard):
+            raise RuntimeError(f"shard {shard.shard_id} did not connect")
+
+        monkeypatch.setattr(pool, "_start", fail_start)
+        expected = [hit for hit in comparable(index.evaluate(prices))
+                    if pool.assignment[hit[0]] == 0]
+        assert comparable(pool.evaluate(prices)) == expected
+        assert [s["skipped"] for s in pool.stats()] == [0, 1]
+
+        # The next tick restarts it for real
+        monkeypatch.undo()
+        assert comparable(pool.evaluate(prices)) == comparable(index.evaluate(prices))
+    finally:
+        pool.close()
+
+
+def test_a_removed_user_that_comes_back_is_ordered_last_like_in_the_strategies_file():
+    rng = random.Random(9)
+    book, names, bases = _random_users(12, 4, 6, rng)
+    pool = ShardPool(2)
+    try:
+        pool.set_users(book)
+        index = TriggerIndex(book)
+        returning = "user00002"
+        config = book.pop(returning)
+        pool.set_users({returning: None})
+        index.sync(book)
+        book[returning] = config  # Re-added: now the last user in the file
+        pool.set_users({returning: config})
+        index.sync(book)
+        assert list(index.user_pos)[-1] == returning and len(pool.user_pos) == len(book)
+
+        prices = {s: bases[s] * 0.8 for s in names}
+        expected = comparable(TriggerIndex(book).evaluate(prices))
+        assert expected[-1][0] == returning
+        assert comparable(index.evaluate(prices)) == expected
+        assert comparable(pool.evaluate(prices)) == expected
+    finally:
+        pool.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a shell script as the worker interpreter")
+def test_late_reply_from_a_skipped_tick_is_not_read_as_the_next_ticks_hits(tmp_path, monkeypatch):
+    # Shard 1's workers sleep past EVAL_TIMEOUT on their first eval, the restarted one included
+    slow = tmp_path / "slow_worker.py"
+    slow.write_text(f"""import sys, time
+sys.path.insert(0, {str(signal_shards.Path(signal_shards.__file__).parent)!r})
+import signal_shards
+shard_id = int(sys.argv[-1])
+evaluate = signal_shards.TriggerIndex.evaluate
+calls = []
+def slow_evaluate(self, *args):
+    calls.append(1)
+    if shard_id == 1 and len(calls) == 1:
+        time.sleep(1.5)
+    return evaluate(self, *args)
+signal_shards.TriggerIndex.evaluate = slow_evaluate
+signal_shards.run_worker(shard_id)
+""")
+    monkeypatch.setattr(signal_shards.sys, "executable",
+                        fake_worker(tmp_path, f'exec {sys.executable} {slow} "$@"'))
+    monkeypatch.setattr(signal_shards, "EVAL_TIMEOUT", 0.5)
+    rng = random.Random(8)
+    book, names, bases = _random_users(30, 4, 20, rng)
+    pool = ShardPool(2)
+    try:
+        pool.set_users(book)
+        index = TriggerIndex(book)
+        first = {s: bases[s] * 0.8 for s in names}
+        assert comparable(pool.evaluate(first)) == [hit for hit in comparable(index.evaluate(first))
+                                                    if pool.assignment[hit[0]] == 0]
+        assert [s["skipped"] for s in pool.stats()] == [0, 1]
+
+        time.sleep(1.5)  # The restarted worker's reply to the first tick is now waiting in the pipe
+        for _ in range(3):
+            prices = {s: bases[s] * rng.uniform(0.8, 1.2) for s in names}
+            assert comparable(pool.evaluate(prices)) == comparable(index.evaluate(prices))
+    finally:
+        pool.close()
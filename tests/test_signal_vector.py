@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from signal_rules import TriggerIndex, make_signal
+from signal_vector import HAVE_NUMPY, VectorTriggerBook, _random_users
+
+pytestmark = pytest.mark.skipif(not HAVE_NUMPY, reason="numpy is not installed")
+
+
+def comparable(hits):
+    return [(entry["user_id"], entry["symbol"], kind, price) for entry, kind, price in hits]
+
+
+def test_vector_hits_match_the_index_in_order_including_rule_triggers():
+    rng = random.Random(11)
+    book, names, bases = _random_users(80, 6, 40, rng)
+    # Some stocks also fire on indicator rules, some on nothing but a rule
+    for config in list(book.values())[::3]:
+        for stock in config["stocks"].values():
+            stock["triggers"]["buy_rule"] = "rsi < 30"
+            stock["triggers"]["sell_rule"] = "ltp > vwap + 2 * atr"
+    for config in list(book.values())[1::7]:
+        for stock in config["stocks"].values():
+            stock["triggers"].update(buy_trigger=0, sell_trigger=0, stop_loss=0, stop_rule="ltp < ema_9 * 0.9")
+    index = TriggerIndex(book)
+    vector = VectorTriggerBook(index)
+
+    fired = by_rule = 0
+    for _ in range(40):
+        prices = {s: round(bases[s] * rng.uniform(0.8, 1.2), 1) for s in rng.sample(names, 20)}
+        rules = {s: {"rsi": rng.uniform(10, 90), "vwap": bases[s], "atr": bases[s] * 0.02,
+                     "ema_9": bases[s] * rng.uniform(0.9, 1.2)}
+                 for s in prices if s in index.rule_entries}
+        hits = index.evaluate(prices, rules)
+        assert comparable(vector.evaluate(prices, rules)) == comparable(hits)
+        fired += len(hits)
+        by_rule += sum("rule hit" in make_signal(*hit)[0]["reason"] for hit in hits)
+    assert fired > by_rule > 0
@@ -0,0 +1,96 @@
+import smtplib
+import socketserver
+import threading
+from email.message import EmailMessage
+
+import pytest
+
+from smtp_pool import SMTPPool
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib; hangs up after a message when the server is told to."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 fake ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode().strip().split(" ")[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-fake\r\n250 AUTH PLAIN\r\n")
+            elif verb == "AUTH":
+                self.reply("535 bad credentials" if server.reject_auth else "235 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                server.delivered += 1
+                self.reply("250 queued")
+                if server.drop_after_message:
+                    return  # Idle session dropped server-side, as providers do
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def fake_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeSMTPHandler)
+    server.daemon_threads = True
+    server.connections = server.delivered = 0
+    server.drop_after_message = False
+    server.reject_auth = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def message():
+    msg = EmailMessage()
+    msg["From"], msg["To"], msg["Subject"] = "bot@example.com", "broker@example.com", "order"
+    msg.set_content("BUY NABIL 10 @ 500")
+    return msg
+
+
+def test_session_is_reused_and_reopened_after_server_disconnect(fake_server):
+    pool = SMTPPool()
+    port = fake_server.server_address[1]
+    try:
+        first = pool.send(message(), "127.0.0.1", port, "bot@example.com", "pw", starttls=False)
+        second = pool.send(message(), "127.0.0.1", port, "bot@example.com", "pw", starttls=False)
+        assert (first["reused"], second["reused"]) == (False, True)
+        assert fake_server.connections == 1
+
+        fake_server.drop_after_message = True
+        pool.send(message(), "127.0.0.1", port, "bot@example.com", "pw", starttls=False)
+        # The kept session is dead now: SMTPServerDisconnected, then one resend on a fresh session
+        result = pool.send(message(), "127.0.0.1", port, "bot@example.com", "pw", starttls=False)
+        assert result["retried"] and not result["reused"]
+        assert fake_server.delivered == 4
+        stats = pool.stats()[f"bot@example.com@127.0.0.1:{port}"]
+        assert (stats["sends"], stats["reconnects"], stats["failures"]) == (4, 1, 0)
+    finally:
+        pool.close()
+
+
+def test_failure_on_a_fresh_session_is_raised(fake_server):
+    fake_server.reject_auth = True
+    pool = SMTPPool()
+    port = fake_server.server_address[1]
+    try:
+        with pytest.raises(smtplib.SMTPAuthenticationError):
+            pool.send(message(), "127.0.0.1", port, "bot@example.com", "pw", starttls=False)
+        stats = pool.stats()[f"bot@example.com@127.0.0.1:{port}"]
+        assert (stats["open"], stats["failures"], fake_server.delivered) == (0, 1, 0)
+    finally:
+        pool.close()
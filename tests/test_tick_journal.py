@@ -0,0 +1,24 @@
+from tick_journal import MOVE, SNAPSHOT, JournalReader, JournalWriter
+
+
+def test_out_of_order_timestamps_are_clamped_and_the_index_finds_every_record(tmp_path):
+    writer = JournalWriter(tmp_path)
+    for ts_ms, sym in [(1000, "NABIL"), (2500, "NICA"), (2400, "NABIL"), (3100, "HDL"), (900, "NICA")]:
+        writer.append_move(ts_ms, sym, 500.0, 499.0, 10, 0.2)
+    writer.close()
+
+    # A resumed writer continues from the last timestamp on disk
+    writer = JournalWriter(tmp_path)
+    writer.append_snapshot(3000, "HDL", 1200.0, 1190.0, 1210.0, 1185.0, 1195.0, 40, 0.4)
+    writer.close()
+
+    reader = JournalReader(tmp_path)
+    try:
+        ts = [r["ts_ms"] for r in reader.read()]
+        assert ts == [1000, 2500, 2500, 3100, 3100, 3100]
+        assert reader.index_ts == sorted(reader.index_ts)
+        assert [r["sym"] for r in reader.read(2000, 3000)] == ["NICA", "NABIL"]
+        assert [r["sym"] for r in reader.read(3000, None, kind=SNAPSHOT)] == ["HDL"]
+        assert len(list(reader.read(start_ms=3100, kind=MOVE))) == 2
+    finally:
+        reader.close()
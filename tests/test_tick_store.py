@@ -0,0 +1,51 @@
+import tick_store
+from tick_store import TickStore, open_tick_store
+
+
+def test_new_session_day_resets_the_file_in_place_and_readers_notice(tmp_path, monkeypatch):
+    path = tmp_path / "tick_store.bin"
+    monkeypatch.setattr(tick_store, "_session_day", lambda: 20260101)
+    writer = TickStore(path, max_symbols=4, capacity=8)
+    writer.append("NABIL", 1.0, 500.0, 10, 0.5)
+    reader = open_tick_store(path)
+
+    # Scraper restart on the same day reattaches in place
+    writer.close()
+    writer = TickStore(path, max_symbols=4, capacity=8)
+    assert writer.last("NABIL") == (1.0, 500.0, 10.0, 0.5)
+    assert not reader.replaced()
+
+    # Next day: same file (Windows can't replace it while mapped), emptied, and readers reattach
+    writer.close()
+    inode = path.stat().st_ino
+    monkeypatch.setattr(tick_store, "_session_day", lambda: 20260102)
+    writer = TickStore(path, max_symbols=4, capacity=8)
+    assert path.stat().st_ino == inode
+    assert writer.symbols == [] and writer.last("NABIL") is None
+    assert reader.replaced()
+    reader.close()
+    reader = open_tick_store(path)
+    assert reader.last("NABIL") is None and not reader.replaced()
+    reader.close()
+    writer.close()
+
+
+def test_new_layout_replaces_the_file_without_touching_mapped_readers(tmp_path):
+    path = tmp_path / "tick_store.bin"
+    writer = TickStore(path, max_symbols=4, capacity=8)
+    writer.append("NABIL", 1.0, 500.0, 10, 0.5)
+    reader = open_tick_store(path)
+    writer.close()
+    writer = TickStore(path, max_symbols=4, capacity=16)
+    assert reader.last("NABIL") == (1.0, 500.0, 10.0, 0.5)
+    assert reader.replaced()
+    reader.close()
+    writer.close()
+
+
+def test_ring_keeps_the_newest_capacity_records():
+    store = TickStore(max_symbols=2, capacity=4)
+    for i in range(10):
+        store.append("NICA", float(i), 400.0 + i, i, 0.0)
+    assert [row[0] for row in store.history("NICA")] == [6.0, 7.0, 8.0, 9.0]
+    assert store.last_ltp("NICA") == 409.0
@@ -0,0 +1,240 @@
+# tick_journal.py
+# Fixed-record binary tick journal, one segment per hourly market_logs folder.
+# Exports:
+#  - JournalWriter(segment_dir)          append_snapshot(...), append_move(...), flush(), close()
+#  - JournalReader(segment_dir)          mmap reader: read(start_ms, end_ms, symbols, kind)
+#  - iter_ticks(base_dir, start_ms, end_ms, symbols, kind) -> records across segments
+#  - export_csv(segment_dir, out_dir)    regenerate FULL_SNAPSHOT.csv / MOVES.csv
+#
+# Segment files (next to each other in market_logs/NEPSE_<YYYY-mm-dd_HH>/):
+#   TICKS.bin  fixed 80-byte records, see RECORD below
+#   TICKS.sym  segment symbol table, one symbol per line, line number = sym_id
+#   TICKS.idx  (ts_ms, byte offset) of the first record of every INDEX_STEP_MS
+# ts_ms never decreases within a segment (the writer clamps a late record to
+# the previous timestamp), so the index is sorted and read() can stop at end_ms.
+#
+# CLI:
+#   python tick_journal.py export market_logs/NEPSE_2025-12-01_11 [--out DIR]
+#   python tick_journal.py export market_logs            (every segment)
+
+import bisect
+import csv
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+
+SNAPSHOT = 0
+MOVE = 1
+
+# ts_ms, sym_id, kind, reserved, ltp, open, high, low, close, ref, pct, vol
+RECORD = struct.Struct("<qIHHdddddddq")
+INDEX_ENTRY = struct.Struct("<qQ")
+INDEX_STEP_MS = 1000
+
+BIN_NAME = "TICKS.bin"
+SYM_NAME = "TICKS.sym"
+IDX_NAME = "TICKS.idx"
+
+FIELDS = ("ts_ms", "sym", "kind", "ltp", "open", "high", "low", "close", "ref", "pct", "vol")
+
+
+class JournalWriter:
+    """Append-only writer for one segment. Reopening an existing segment resumes it."""
+
+    def __init__(self, segment_dir):
+        self.dir = Path(segment_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.ids = {}
+        sym_path = self.dir / SYM_NAME
+        if sym_path.exists():
+            for sid, line in enumerate(sym_path.read_text(encoding="utf-8").splitlines()):
+                self.ids[line] = sid
+
+        self.bin = open(self.dir / BIN_NAME, "ab")
+        self.sym = open(sym_path, "a", encoding="utf-8")
+        self.idx = open(self.dir / IDX_NAME, "ab")
+        # Drop a torn trailing record left by a crash so offsets stay aligned
+        size = self.bin.tell()
+        if size % RECORD.size:
+            self.bin.truncate(size - size % RECORD.size)
+            self.bin.seek(0, os.SEEK_END)
+        self.offset = self.bin.tell()
+        self.last_index_step = None
+        self.last_ts = 0
+        if self.offset:
+            with open(self.dir / BIN_NAME, "rb") as f:
+                f.seek(self.offset - RECORD.size)
+                self.last_ts = RECORD.unpack(f.read(RECORD.size))[0]
+            self.last_index_step = self.last_ts // INDEX_STEP_MS  # Already indexed before the restart
+
+    def _sym_id(self, sym):
+        sid = self.ids.get(sym)
+        if sid is None:
+            sid = self.ids[sym] = len(self.ids)
+            self.sym.write(sym + "\n")
+            self.sym.flush()  # Symbol must be durable before any record references it
+        return sid
+
+    def _append(self, ts_ms, sym, kind, ltp, open_, high, low, close, ref, pct, vol):
+        # Coalesced stage batches can hand over a record older than the last one
+        ts_ms = self.last_ts = max(ts_ms, self.last_ts)
+        step = ts_ms // INDEX_STEP_MS
+        if step != self.last_index_step:
+            self.idx.write(INDEX_ENTRY.pack(ts_ms, self.offset))
+            self.last_index_step = step
+        self.bin.write(RECORD.pack(ts_ms, self._sym_id(sym), kind, 0,
+                                   ltp, open_, high, low, close, ref, pct, int(vol)))
+        self.offset += RECORD.size
+
+    def append_snapshot(self, ts_ms, sym, ltp, open_, high, low, close, vol, pct):
+        self._append(ts_ms, sym, SNAPSHOT, ltp, open_, high, low, close, 0.0, pct, vol)
+
+    def append_move(self, ts_ms, sym, ltp, ref, vol, pct):
+        self._append(ts_ms, sym, MOVE, ltp, 0.0, 0.0, 0.0, 0.0, ref, pct, vol)
+
+    def flush(self):
+        self.bin.flush()
+        self.idx.flush()
+
+    def close(self):
+        for f in (self.bin, self.idx, self.sym):
+            if not f.closed:
+                f.close()
+
+
+class JournalReader:
+    """Read one segment through mmap. Records come back as dicts keyed by FIELDS."""
+
+    def __init__(self, segment_dir):
+        self.dir = Path(segment_dir)
+        self.symbols = []
+        self._reload_symbols()
+        self.index_ts, self.index_off = [], []
+        idx_path = self.dir / IDX_NAME
+        if idx_path.exists():
+            data = idx_path.read_bytes()
+            for ts_ms, off in INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]):
+                self.index_ts.append(ts_ms)
+                self.index_off.append(off)
+
+        self._file = None
+        self.buf = None
+        bin_path = self.dir / BIN_NAME
+        if bin_path.exists() and bin_path.stat().st_size >= RECORD.size:
+            self._file = open(bin_path, "rb")
+            self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _reload_symbols(self):
+        sym_path = self.dir / SYM_NAME
+        if sym_path.exists():
+            self.symbols = sym_path.read_text(encoding="utf-8").splitlines()
+
+    def __len__(self):
+        return len(self.buf) // RECORD.size if self.buf is not None else 0
+
+    def _start_offset(self, start_ms):
+        if start_ms is None or not self.index_ts:
+            return 0
+        i = bisect.bisect_right(self.index_ts, start_ms) - 1
+        return self.index_off[i] if i >= 0 else 0
+
+    def read(self, start_ms=None, end_ms=None, symbols=None, kind=None):
+        """Yield records with start_ms <= ts_ms < end_ms, optionally filtered by symbol set and kind."""
+        if self.buf is None:
+            return
+        wanted = None
+        if symbols is not None:
+            wanted = {self.symbols.index(s) for s in symbols if s in self.symbols}
+            if not wanted:
+                return
+        end = len(self) * RECORD.size
+        for off in range(self._start_offset(start_ms), end, RECORD.size):
+            rec = RECORD.unpack_from(self.buf, off)
+            ts_ms = rec[0]
+            if start_ms is not None and ts_ms < start_ms:
+                continue
+            if end_ms is not None and ts_ms >= end_ms:
+                break
+            if wanted is not None and rec[1] not in wanted:
+                continue
+            if kind is not None and rec[2] != kind:
+                continue
+            if rec[1] >= len(self.symbols):
+                self._reload_symbols()  # Live segment: writer added symbols after we opened
+            yield dict(zip(FIELDS, (ts_ms, self.symbols[rec[1]], rec[2]) + rec[4:]))
+
+    def close(self):
+        if self.buf is not None:
+            self.buf.close()
+            self._file.close()
+            self.buf = None
+
+
+def segment_dirs(base_dir):
+    return sorted(p.parent for p in Path(base_dir).glob(f"NEPSE_*/{BIN_NAME}"))
+
+
+def _segment_hour_ms(segment_dir):
+    try:
+        hour = datetime.strptime(Path(segment_dir).name[len("NEPSE_"):], "%Y-%m-%d_%H")
+        return int(hour.timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def iter_ticks(base_dir, start_ms=None, end_ms=None, symbols=None, kind=None):
+    """Stream records across every hourly segment under base_dir, in time order."""
+    for seg in segment_dirs(base_dir):
+        hour_ms = _segment_hour_ms(seg)
+        if hour_ms is not None:
+            # Segments hold one wall-clock hour; skip the ones outside the range
+            if end_ms is not None and hour_ms >= end_ms:
+                break
+            if start_ms is not None and hour_ms + 3_600_000 <= start_ms:
+                continue
+        reader = JournalReader(seg)
+        try:
+            yield from reader.read(start_ms, end_ms, symbols, kind)
+        finally:
+            reader.close()
+
+
+def export_csv(segment_dir, out_dir=None):
+    """Write FULL_SNAPSHOT.csv and MOVES.csv in the scraper's legacy CSV layout."""
+    out = Path(out_dir) if out_dir else Path(segment_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    reader = JournalReader(segment_dir)
+    try:
+        with open(out / "FULL_SNAPSHOT.csv", "w", newline="", encoding="utf-8") as f_full, \
+             open(out / "MOVES.csv", "w", newline="", encoding="utf-8") as f_moves:
+            full = csv.writer(f_full)
+            moves = csv.writer(f_moves)
+            full.writerow(["Time", "Symbol", "LTP", "Open", "High", "Low", "Close", "Vol", "%Chg"])
+            moves.writerow(["Time", "Symbol", "LTP", "From", "Change", "Dir", "Vol", "%Chg"])
+            for r in reader.read():
+                when = datetime.fromtimestamp(r["ts_ms"] / 1000).strftime("%Y-%m-%d %H:%M:%S")
+                if r["kind"] == SNAPSHOT:
+                    full.writerow([when, r["sym"], r["ltp"], r["open"], r["high"], r["low"],
+                                   r["close"], r["vol"], f"{r['pct']:+.2f}"])
+                else:
+                    change = r["ltp"] - r["ref"]
+                    moves.writerow([when, r["sym"], r["ltp"], f"{r['ref']:.2f}", f"{change:+.2f}",
+                                    "UP" if change > 0 else "DOWN", f"{r['vol']:,}", f"{r['pct']:+.2f}"])
+    finally:
+        reader.close()
+    return out
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "export":
+        print("Usage: python tick_journal.py export <segment_dir | market_logs> [--out DIR]")
+        sys.exit(1)
+    target = Path(sys.argv[2])
+    out_dir = sys.argv[sys.argv.index("--out") + 1] if "--out" in sys.argv else None
+    segments = [target] if (target / BIN_NAME).exists() else segment_dirs(target)
+    for seg in segments:
+        dest = export_csv(seg, Path(out_dir) / seg.name if out_dir else None)
+        print(f"EXPORTED -> {dest}")
@@ -0,0 +1,221 @@
+# tick_store.py
+# Preallocated per-symbol tick rings covering a whole trading session.
+# Exports:
+#  - TickStore(path=None, max_symbols=512, capacity=2048, readonly=False)
+#      .intern(sym) -> int            symbol -> slot id (stable for the session)
+#      .append(sym, ts, ltp, vol, pct) O(1), no per-tick allocation
+#      .last(sym) -> (ts, ltp, vol, pct) | None
+#      .history(sym, since=None)      -> numpy (n, 4) array, or list of tuples without numpy
+#      .snapshot()                    -> (symbols, numpy (n_symbols, 4) array of latest records)
+#      .replaced() -> bool            read-only: the writer has since started a new file or day (reattach)
+#  - open_tick_store(path) -> read-only TickStore attached to the scraper's file
+#
+# Layout (little endian, one flat buffer, mmap'd when a path is given):
+#   header   64 bytes   magic, max_symbols, capacity, n_symbols, session day
+#   symbols  max_symbols * 16 bytes, NUL padded ASCII
+#   heads    max_symbols * uint64, total records ever appended per slot
+#   rings    max_symbols * capacity * 4 float64 (ts, ltp, vol, pct)
+# A slot's record is written before its head is bumped, so readers in other
+# processes only ever see complete records. Each ring keeps the newest
+# `capacity` records and wraps over older ones; the scraper sizes it to one
+# record per refresh for a whole session. A new session day with the same
+# layout is reset in place (the file keeps its size, so mappings stay valid,
+# and Windows does not allow replacing a file another process has mapped);
+# readers see the session day change and reattach. A new layout gets a fresh
+# file swapped in by rename, never an in-place truncate; on Windows that fails
+# with PermissionError while a reader is attached, and the caller decides how
+# to carry on.
+
+import mmap
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # Optional: history()/snapshot() fall back to tuples
+    np = None
+
+MAGIC = b"NEPTICK1"
+HEADER = struct.Struct("<8sIIII")
+HEADER_SIZE = 64
+SYMBOL_WIDTH = 16
+FIELDS = 4          # ts, ltp, vol, pct
+RECORD_SIZE = FIELDS * 8
+
+
+def _session_day():
+    return int(datetime.now().strftime("%Y%m%d"))
+
+
+class TickStore:
+    def __init__(self, path=None, max_symbols=512, capacity=2048, readonly=False):
+        self.path = Path(path) if path else None
+        self.readonly = readonly
+        self._file = None
+
+        if readonly:
+            self._file = open(self.path, "rb")
+            self._inode = os.fstat(self._file.fileno()).st_ino
+            self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, max_symbols, capacity, _, self._day = HEADER.unpack_from(self.buf, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a tick store")
+        self.max_symbols = max_symbols
+        self.capacity = capacity
+
+        self._sym_off = HEADER_SIZE
+        self._head_off = self._sym_off + max_symbols * SYMBOL_WIDTH
+        self._ring_off = self._head_off + max_symbols * 8
+        size = self._ring_off + max_symbols * capacity * RECORD_SIZE
+
+        if not readonly:
+            self.buf = self._open_writable(size)
+
+        self.heads = memoryview(self.buf)[self._head_off:self._ring_off].cast("Q")
+        self.rings = memoryview(self.buf)[self._ring_off:size].cast("d")
+        self.ids = {}
+        self.symbols = []
+        self._load_symbols()
+
+    def _open_writable(self, size):
+        if self.path is None:
+            buf = bytearray(size)
+            HEADER.pack_into(buf, 0, MAGIC, self.max_symbols, self.capacity, 0, _session_day())
+            return buf
+
+        # Reattach to today's store after a scraper restart, otherwise start fresh
+        same_layout = reuse = False
+        if self.path.exists() and self.path.stat().st_size == size:
+            with open(self.path, "rb") as f:
+                magic, max_symbols, capacity, _, day = HEADER.unpack(f.read(HEADER.size))
+            same_layout = (magic, max_symbols, capacity) == (MAGIC, self.max_symbols, self.capacity)
+            reuse = same_layout and day == _session_day()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not same_layout:
+            # The old file may still be mapped by the API: replace it, don't truncate it
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w+b") as f:
+                f.truncate(size)
+                f.write(HEADER.pack(MAGIC, self.max_symbols, self.capacity, 0, _session_day()))
+            tmp.replace(self.path)
+        self._file = open(self.path, "r+b")
+        buf = mmap.mmap(self._file.fileno(), size)
+        if same_layout and not reuse:
+            # Yesterday's session: the new day goes in first so readers stop trusting their ids
+            HEADER.pack_into(buf, 0, MAGIC, self.max_symbols, self.capacity, 0, _session_day())
+            buf[self._head_off:self._ring_off] = bytes(self._ring_off - self._head_off)
+        return buf
+
+    def _load_symbols(self):
+        n = HEADER.unpack_from(self.buf, 0)[3]
+        for sid in range(len(self.symbols), n):
+            off = self._sym_off + sid * SYMBOL_WIDTH
+            sym = bytes(self.buf[off:off + SYMBOL_WIDTH]).rstrip(b"\0").decode("ascii")
+            self.ids[sym] = sid
+            self.symbols.append(sym)
+
+    def replaced(self):
+        if HEADER.unpack_from(self.buf, 0)[4] != self._day:
+            return True  # Reset in place for a new session day
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except OSError:
+            return True
+
+    def intern(self, sym):
+        sid = self.ids.get(sym)
+        if sid is not None:
+            return sid
+        if self.readonly:
+            self._load_symbols()  # Writer may have added symbols since we attached
+            return self.ids.get(sym)
+        sid = len(self.symbols)
+        if sid >= self.max_symbols:
+            raise OverflowError(f"tick store full ({self.max_symbols} symbols)")
+        off = self._sym_off + sid * SYMBOL_WIDTH
+        self.buf[off:off + SYMBOL_WIDTH] = sym.encode("ascii", "replace")[:SYMBOL_WIDTH].ljust(SYMBOL_WIDTH, b"\0")
+        self.ids[sym] = sid
+        self.symbols.append(sym)
+        struct.pack_into("<I", self.buf, 16, sid + 1)  # Publish n_symbols after the name is written
+        return sid
+
+    def append(self, sym, ts, ltp, vol, pct):
+        sid = self.intern(sym)
+        head = self.heads[sid]
+        base = (sid * self.capacity + head % self.capacity) * FIELDS
+        rings = self.rings
+        rings[base] = ts
+        rings[base + 1] = ltp
+        rings[base + 2] = vol
+        rings[base + 3] = pct
+        self.heads[sid] = head + 1
+
+    def last(self, sym):
+        sid = self.intern(sym)
+        if sid is None:
+            return None
+        head = self.heads[sid]
+        if not head:
+            return None
+        base = (sid * self.capacity + (head - 1) % self.capacity) * FIELDS
+        return tuple(self.rings[base:base + FIELDS])
+
+    def last_ltp(self, sym, default=0.0):
+        rec = self.last(sym)
+        return rec[1] if rec else default
+
+    def history(self, sym, since=None):
+        """Records for `sym` in time order, optionally only those with ts >= since."""
+        sid = self.intern(sym)
+        head = self.heads[sid] if sid is not None else 0
+        if not head:
+            return np.empty((0, FIELDS)) if np is not None else []
+
+        count = min(head, self.capacity)
+        start = head % self.capacity if head > self.capacity else 0
+        if np is not None:
+            offset = self._ring_off + sid * self.capacity * RECORD_SIZE
+            ring = np.frombuffer(self.buf, dtype="<f8", count=self.capacity * FIELDS, offset=offset)
+            ring = ring.reshape(self.capacity, FIELDS)
+            rows = np.concatenate((ring[start:count], ring[:start])) if start else ring[:count].copy()
+            return rows[rows[:, 0] >= since] if since is not None else rows
+
+        base = sid * self.capacity * FIELDS
+        rows = []
+        for i in range(count):
+            off = base + ((start + i) % self.capacity) * FIELDS
+            rec = tuple(self.rings[off:off + FIELDS])
+            if since is None or rec[0] >= since:
+                rows.append(rec)
+        return rows
+
+    def snapshot(self):
+        """Latest record of every interned symbol as (symbols, rows)."""
+        if self.readonly:
+            self._load_symbols()
+        symbols = list(self.symbols)
+        n = len(symbols)
+        if np is not None:
+            heads = np.frombuffer(self.buf, dtype="<u8", count=n, offset=self._head_off).astype(np.int64)
+            rings = np.frombuffer(self.buf, dtype="<f8", count=n * self.capacity * FIELDS,
+                                  offset=self._ring_off).reshape(n, self.capacity, FIELDS)
+            rows = rings[np.arange(n), (heads - 1) % self.capacity].copy()
+            rows[heads == 0] = 0.0
+            return symbols, rows
+        return symbols, [self.last(sym) or (0.0, 0.0, 0.0, 0.0) for sym in symbols]
+
+    def close(self):
+        self.heads.release()
+        self.rings.release()
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        if self._file:
+            self._file.close()
+
+
+def open_tick_store(path):
+    return TickStore(path, readonly=True)
+
@@ -7,7 +7,7 @@ Import and include this router into your main_fastapi.py:
 """
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from typing import List, Optional, Dict
 import sqlite3
 import json
@@ -21,6 +21,7 @@ BASE_DIR = Path(__file__).resolve().parent
 DATABASE_PATH = BASE_DIR / "trading_system.db"
 
 # Import generator
+from signal_rules import calculate_triggers, compile_rule
 from user_strategies_generator import generate_user_strategies_json
 
 router = APIRouter()
@@ -50,6 +51,16 @@ class StockConfig(BaseModel):
     order_type: str = Field(default="LIMIT", example="LIMIT")
     partial_fill_enabled: bool = Field(default=True)
     min_fill_qty: Optional[int] = Field(None, example=5)
+    # Indicator rules (signal_rules.compile_rule), fire alongside the price levels
+    buy_rule: Optional[str] = Field(None, example="ltp < vwap - 1.5 * atr")
+    sell_rule: Optional[str] = Field(None, example="rsi > 70 and ltp > ema21")
+    stop_rule: Optional[str] = Field(None, example="ltp < purchase_price - 3 * atr")
+
+    @validator("buy_rule", "sell_rule", "stop_rule")
+    def check_rule(cls, value):
+        if value:
+            compile_rule(value)  # ValueError -> 422 with the reason
+        return value or None
 
 class Portfolio(BaseModel):
     total_budget: float = Field(..., gt=0, example=1000000)
@@ -70,17 +81,6 @@ class TradingConfigResponse(BaseModel):
     total_stocks: int
     generated_file: bool
 
-# Trigger calculation
-def calculate_triggers(purchase_price: float, target_sell_price: float, risk_tolerance: float) -> Dict:
-    buy_trigger = purchase_price * 0.98
-    sell_trigger = target_sell_price * 0.99
-    stop_loss = purchase_price * 0.90
-    return {
-        "buy_trigger": round(buy_trigger, 2),
-        "sell_trigger": round(sell_trigger, 2),
-        "stop_loss": round(stop_loss, 2)
-    }
-
 # Background thread: periodically regenerate strategies (defensive)
 def _background_generator_loop(interval=30):
     while True:
@@ -150,9 +150,9 @@ async def save_trading_config(config: TradingConfigRequest):
                     user_id, symbol, category, purchase_price, target_sell_price,
                     current_price, purchase_qty, selling_qty, weight, order_type,
                     partial_fill_enabled, min_fill_qty, buy_trigger, sell_trigger,
-                    stop_loss, is_active, updated_at
+                    stop_loss, buy_rule, sell_rule, stop_rule, is_active, updated_at
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
                 ON CONFLICT(user_id, symbol) DO UPDATE SET
                     category = excluded.category,
                     purchase_price = excluded.purchase_price,
@@ -167,6 +167,9 @@ async def save_trading_config(config: TradingConfigRequest):
                     buy_trigger = excluded.buy_trigger,
                     sell_trigger = excluded.sell_trigger,
                     stop_loss = excluded.stop_loss,
+                    buy_rule = excluded.buy_rule,
+                    sell_rule = excluded.sell_rule,
+                    stop_rule = excluded.stop_rule,
                     is_active = 1,
                     updated_at = excluded.updated_at
             """, (
@@ -175,6 +178,7 @@ async def save_trading_config(config: TradingConfigRequest):
                 stock.selling_qty, stock.weight, stock.order_type,
                 int(stock.partial_fill_enabled), min_fill,
                 triggers["buy_trigger"], triggers["sell_trigger"], triggers["stop_loss"],
+                stock.buy_rule, stock.sell_rule, stock.stop_rule,
                 datetime.now()
             ))
 
@@ -182,7 +186,7 @@ async def save_trading_config(config: TradingConfigRequest):
         conn.close()
 
         # Regenerate strategies JSON
-        generated = generate_user_strategies_json()
+        generated = generate_user_strategies_json(changed_users=[config.user_id])
 
         return TradingConfigResponse(
             ok=True,
@@ -239,6 +243,15 @@ class UpdateStockRequest(_BaseModel):
     order_type: Optional[str] = Field(None, example="LIMIT")
     partial_fill_enabled: Optional[bool] = None
     min_fill_qty: Optional[int] = None
+    buy_rule: Optional[str] = Field(None, description="Empty string clears the rule")
+    sell_rule: Optional[str] = None
+    stop_rule: Optional[str] = None
+
+    @validator("buy_rule", "sell_rule", "stop_rule")
+    def check_rule(cls, value):
+        if value:
+            compile_rule(value)
+        return value
 
 @router.put("/user/stock/{symbol}")
 async def update_stock(symbol: str, update: UpdateStockRequest):
@@ -294,6 +307,12 @@ async def update_stock(symbol: str, update: UpdateStockRequest):
             update_fields.append("min_fill_qty = ?")
             update_values.append(update.min_fill_qty)
 
+        for column in ("buy_rule", "sell_rule", "stop_rule"):
+            value = getattr(update, column)
+            if value is not None:
+                update_fields.append(f"{column} = ?")
+                update_values.append(value or None)
+
         update_fields.extend(["buy_trigger = ?", "sell_trigger = ?", "stop_loss = ?", "updated_at = ?"])
         update_values.extend([triggers["buy_trigger"], triggers["sell_trigger"], triggers["stop_loss"], datetime.now()])
 
@@ -305,7 +324,7 @@ async def update_stock(symbol: str, update: UpdateStockRequest):
         conn.close()
 
         # Regenerate JSON
-        generate_user_strategies_json()
+        generate_user_strategies_json(changed_users=[update.user_id])
 
         return {"ok": True, "message": f"Stock {symbol} updated successfully"}
     except HTTPException:
@@ -330,7 +349,7 @@ async def delete_stock(symbol: str, user_id: str = Query(...)):
         conn.commit()
         conn.close()
 
-        generate_user_strategies_json()
+        generate_user_strategies_json(changed_users=[user_id])
 
         return {"ok": True, "message": f"Stock {symbol} removed from portfolio"}
     except HTTPException:
@@ -5,7 +5,13 @@ Generate shared/user_strategies.json from the SQLite DB.
 Used by:
  - trading_config_router (after writes)
  - can be run in a background thread periodically
+
+After a write for specific users, pass `changed_users`: each of them also gets a
+small shared/strategy_update_<user_id>.json notice ({"user_id", "config"}, config
+null once the user is gone) that the signal engine applies immediately, without
+re-reading the whole strategies file.
 """
+import re
 import sqlite3
 import json
 from pathlib import Path
@@ -14,8 +20,25 @@ from datetime import datetime
 DATABASE_PATH = Path(__file__).parent / "trading_system.db"
 STRATEGIES_FILE = Path(__file__).parent.parent / "shared" / "user_strategies.json"
 STRATEGIES_TMP = STRATEGIES_FILE.with_suffix(".tmp")
+STRATEGY_UPDATE_PREFIX = "strategy_update_"
+RULE_COLUMNS = ("buy_rule", "sell_rule", "stop_rule")
+
+def stock_rules(stock_row):
+    """Indicator rule expressions set on a user_stocks row (older DBs lack the columns)."""
+    keys = stock_row.keys()
+    return {column: stock_row[column] for column in RULE_COLUMNS if column in keys and stock_row[column]}
+
+def write_strategy_updates(strategies, user_ids):
+    """One notice per changed user, next to user_strategies.json."""
+    for user_id in user_ids:
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(user_id))
+        path = STRATEGIES_FILE.parent / f"{STRATEGY_UPDATE_PREFIX}{name}.json"
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"user_id": user_id, "config": strategies["users"].get(user_id)}, f)
+        tmp.replace(path)
 
-def generate_user_strategies_json() -> bool:
+def generate_user_strategies_json(changed_users=None) -> bool:
     try:
         conn = sqlite3.connect(DATABASE_PATH)
         conn.row_factory = sqlite3.Row
@@ -66,7 +89,8 @@ def generate_user_strategies_json() -> bool:
                         "sell_trigger": stock_row["sell_trigger"],
                         "stop_loss": stock_row["stop_loss"],
                         "partial_fill_enabled": bool(stock_row["partial_fill_enabled"]),
-                        "min_fill_qty": stock_row["min_fill_qty"]
+                        "min_fill_qty": stock_row["min_fill_qty"],
+                        **stock_rules(stock_row)
                     },
                     "status": "ACTIVE"
                 }
@@ -91,6 +115,8 @@ def generate_user_strategies_json() -> bool:
         with STRATEGIES_TMP.open("w", encoding="utf-8") as f:
             json.dump(strategies, f, indent=2)
         STRATEGIES_TMP.replace(STRATEGIES_FILE)
+        if changed_users:
+            write_strategy_updates(strategies, changed_users)
 
         print(f"✅ Generated user_strategies.json - {len(strategies['users'])} users")
         return True